@@ -0,0 +1,62 @@
+"""
+Benchmark for finding where tokens are in the source.
+
+Lexing only records each token's start offset; lines are counted when a location is
+first asked for, by building an index of line starts that later lookups binary search.
+This times lexing (optionally against another copy of compiler.py, to show the
+tokenizer isn't any slower for it), building the index, and looking up the locations
+of random tokens with the index and by counting newlines from the start each time:
+
+    git show HEAD~1:compiler.py > /tmp/old_compiler.py
+    python -m benchmarks.bench_locations --baseline /tmp/old_compiler.py
+
+Run from the repository root.
+"""
+import argparse
+import random
+import timeit
+
+import compiler
+from benchmarks.bench_parser import load_compiler
+from benchmarks.programs import SHAPES, ProgramGenerator
+
+
+def best_time(function, repeat):
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--baseline", help="path to another compiler.py to compare lexing with")
+    parser.add_argument("--shapes", nargs="+", choices=SHAPES, default=["elif_chain", "nested_while", "comments"])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 20000])
+    parser.add_argument("--lookups", type=int, default=1000, help="random tokens to locate")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    baseline = load_compiler(args.baseline) if args.baseline else None
+
+    for shape in args.shapes:
+        for size in args.sizes:
+            source = "\n".join(ProgramGenerator(0).generate(shape, size))
+            tokens = compiler.tokenize_string(source)
+            starts = compiler.line_starts(source)
+            lex = best_time(lambda: compiler.tokenize_string(source), args.repeat)
+            line = f"{shape:>12} {size:>6}: {len(tokens):>8} tokens {len(starts):>7} lines  " \
+                   f"lex {len(tokens) / lex:>11,.0f} tokens/s"
+            if baseline:
+                baseline_lex = best_time(lambda: baseline.tokenize_string(source), args.repeat)
+                line += f"  baseline {len(tokens) / baseline_lex:>11,.0f} tokens/s  ratio {baseline_lex / lex:.2f}x"
+            print(line)
+
+            index = best_time(lambda: compiler.line_starts(source), args.repeat)
+            offsets = [tokens.starts[random.randrange(len(tokens))] for _ in range(args.lookups)]
+            with_index = best_time(
+                lambda: [compiler.source_location(source, offset, starts) for offset in offsets], args.repeat
+            )
+            rescan = best_time(lambda: [compiler.source_location(source, offset) for offset in offsets], 1)
+            print(f"{'':>12} {'':>6}  line index {index * 1000:7.2f}ms ({index / lex:.1%} of lexing)  "
+                  f"{args.lookups} lookups {with_index * 1000:7.2f}ms indexed, {rescan * 1000:8.2f}ms rescanning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark for parse_tokens().
+
+Times the parser on long elif chains, deeply nested if statements and expressions
+with thousands of operators (as a statement, and as the two sides of a while loop's
+condition), and optionally on another copy of compiler.py so the two can be compared, eg:
+
+    git show HEAD~1:compiler.py > /tmp/old_compiler.py
+    python -m benchmarks.bench_parser --baseline /tmp/old_compiler.py
+
+Run from the repository root.
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import timeit
+
+import compiler
+
+
+def elif_chain(length):
+    """An if statement followed by `length` elif clauses and an else."""
+    clauses = ["if (a > b) { printf('0'); }"]
+    clauses += [f"elif ({i} > {i + 1}) {{ printf('{i}'); }}" for i in range(length)]
+    clauses.append("else { printf('end'); };")
+    return " ".join(clauses)
+
+
+def nested_ifs(depth):
+    """`depth` if statements, each inside the previous one's block."""
+    return "if (a > b) { " * depth + "printf('x');" + " };" * depth
+
+
+def long_expression(length):
+    """An arithmetic statement of `length` operators, mixing precedences, variables and brackets."""
+    operators = "+-*/"
+    terms = ["a"]
+    for i in range(length):
+        operand = f"({i} - b)" if i % 5 == 4 else ("c" if i % 2 else str(i + 1))
+        terms.append(f"{operators[i % 4]} {operand}")
+    return " ".join(terms) + ";"
+
+
+def long_condition(length):
+    """A while loop whose condition has `length` operators on each side."""
+    side = long_expression(length)[:-1]
+    return f"while (x + {side} < {side}) {{ printf('x'); x++ }};"
+
+
+def load_compiler(path):
+    spec = importlib.util.spec_from_file_location("baseline_compiler", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def time_parser(module, tokens, repeat):
+    # parse_tokens() prints on success, which shouldn't be timed:
+    with contextlib.redirect_stdout(io.StringIO()):
+        return min(timeit.repeat(lambda: module.parse_tokens(tokens), number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--baseline", help="path to another compiler.py to compare against")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    baseline = load_compiler(args.baseline) if args.baseline else None
+
+    shapes = [("elif chain", elif_chain), ("nested ifs", nested_ifs),
+              ("expression", long_expression), ("condition", long_condition)]
+    for name, make_program in shapes:
+        for size in args.sizes:
+            tokens = compiler.tokenize_string(make_program(size))
+            seconds = time_parser(compiler, tokens, args.repeat)
+            line = f"{name:>10} {size:>6}: {len(tokens):>8} tokens {len(tokens) / seconds:>12,.0f} tokens/s"
+            if baseline:
+                try:
+                    baseline_seconds = time_parser(baseline, tokens, args.repeat)
+                except SyntaxError:
+                    print(line + "  (baseline can't parse it)")
+                    continue
+                line += f"  baseline {len(tokens) / baseline_seconds:>12,.0f} tokens/s"
+                line += f"  speedup {baseline_seconds / seconds:.2f}x"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
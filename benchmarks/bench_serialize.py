@@ -0,0 +1,54 @@
+"""
+Benchmark for compile_serialize.py.
+
+Compares tokenizing (and parsing) generated programs with loading the same tokens (and
+syntax tree) back from their serialized form, and the size of that form against the
+source and a pickle of the tokens:
+
+    python -m benchmarks.bench_serialize [--shapes elif_chain] [--sizes 1000 20000]
+
+Run from the repository root.
+"""
+import argparse
+import pickle
+import timeit
+
+import compile_serialize
+import compiler
+from benchmarks.programs import SHAPES, ProgramGenerator
+
+
+def best_time(function, repeat):
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--shapes", nargs="+", choices=SHAPES, default=["elif_chain", "nested_while", "comments"])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 20000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for shape in args.shapes:
+        for size in args.sizes:
+            source = "\n".join(ProgramGenerator(0).generate(shape, size))
+            tokens = compiler.tokenize_string(source, [])
+            lex = best_time(lambda: compiler.tokenize_string(source, []), args.repeat)
+            data = compile_serialize.dump_tokens(tokens)
+            load = best_time(lambda: compile_serialize.load_tokens(data), args.repeat)
+            print(f"{shape:>12} {size:>6}: {len(tokens):>8} tokens  {len(source):>9}B source "
+                  f"{len(data):>9}B serialized {len(pickle.dumps(tokens)):>9}B pickled  "
+                  f"lex {lex * 1000:8.2f}ms  load {load * 1000:7.2f}ms  {lex / load:5.1f}x")
+            try:
+                syntax_tree = compiler.parse_tokens(tokens)
+            except Exception:
+                continue  # shapes that are several programs, which don't parse as one
+            parse = best_time(lambda: compiler.parse_tokens(tokens), args.repeat)
+            data = compile_serialize.dump_parse_result(tokens, syntax_tree)
+            load = best_time(lambda: compile_serialize.load_parse_result(data), args.repeat)
+            print(f"{'':>12} {'':>6}  with the syntax tree {len(data):>9}B serialized  "
+                  f"lex+parse {(lex + parse) * 1000:8.2f}ms  load {load * 1000:7.2f}ms  {(lex + parse) / load:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Benchmark for each stage of the compiler.
+
+Generates programs of every shape in benchmarks/programs.py at each size, then times
+tokenize_string(), parse_tokens(), semantic_analyzer() and generate_code() separately,
+reporting tokens/s and peak memory for each. Results can be saved as JSON and compared
+with the results of another commit, eg:
+
+    python -m benchmarks.bench_stages --output before.json
+    git checkout my-branch
+    python -m benchmarks.bench_stages --compare before.json
+
+Run from the repository root.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import timeit
+import tracemalloc
+
+import compiler
+from benchmarks.programs import SHAPES, ProgramGenerator
+
+
+STAGES = ("tokenize", "parse", "semantic", "generate")
+
+
+def run_stages(sources):
+    """
+    Runs each stage over all of sources, keeping what each stage returns for the next.
+
+    Returns:
+        stages (dict): Maps each stage name to a function that runs it over the batch.
+        token_count (int): Number of tokens in the batch.
+    """
+    token_buffers = [compiler.tokenize_string(source) for source in sources]
+    syntax_trees = [compiler.parse_tokens(tokens) for tokens in token_buffers]
+    stages = {
+        "tokenize": lambda: [compiler.tokenize_string(source) for source in sources],
+        "parse": lambda: [compiler.parse_tokens(tokens) for tokens in token_buffers],
+        "semantic": lambda: [compiler.semantic_analyzer(tree) for tree in syntax_trees],
+        "generate": lambda: [compiler.generate_code(tree) for tree in syntax_trees],
+    }
+    return stages, sum(len(tokens) for tokens in token_buffers)
+
+
+def peak_memory(function):
+    """Peak bytes allocated by Python while function runs, measured separately from timing."""
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark(shape, size, seed, repeat):
+    sources = ProgramGenerator(seed).generate(shape, size)
+    stages, token_count = run_stages(sources)
+    result = {
+        "shape": shape,
+        "size": size,
+        "programs": len(sources),
+        "source_bytes": sum(len(source) for source in sources),
+        "tokens": token_count,
+        "stages": {},
+    }
+    for stage in STAGES:
+        seconds = min(timeit.repeat(stages[stage], number=1, repeat=repeat))
+        result["stages"][stage] = {
+            "seconds": seconds,
+            "tokens_per_second": token_count / seconds if seconds else None,
+            "peak_bytes": peak_memory(stages[stage]),
+        }
+    return result
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """Prints how each stage's speed changed from baseline (a previously saved run)."""
+    previous = {(entry["shape"], entry["size"]): entry for entry in baseline["results"]}
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'} (>1.00x is faster):")
+    for entry in results:
+        before = previous.get((entry["shape"], entry["size"]))
+        if before is None:
+            continue
+        ratios = "  ".join(
+            f"{stage} {before['stages'][stage]['seconds'] / entry['stages'][stage]['seconds']:.2f}x"
+            for stage in STAGES
+        )
+        print(f"{entry['shape']:>12} {entry['size']:>6}: {ratios}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--shapes", nargs="+", choices=SHAPES, default=list(SHAPES))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="file to save the results to as JSON")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    results = []
+    for shape in args.shapes:
+        for size in args.sizes:
+            entry = benchmark(shape, size, args.seed, args.repeat)
+            results.append(entry)
+            stages = "  ".join(
+                f"{stage} {entry['stages'][stage]['tokens_per_second']:>11,.0f}/s"
+                f" {entry['stages'][stage]['peak_bytes'] / 1024:>8,.0f} KiB"
+                for stage in STAGES
+            )
+            print(f"{shape:>12} {size:>6}: {entry['tokens']:>8} tokens  {stages}")
+
+    report = {
+        "commit": current_commit(),
+        "python": platform.python_version(),
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            compare(results, json.load(baseline_file))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark for the compiler's cold start.
+
+Compiles a small program in a new process each time, as a build calling the compiler
+once per file would, in each command line mode. The commands are run in turn, so
+they all see the same load on the machine, and the median and best wall times are
+reported next to a process that only starts Python. Then lists what importing the
+compiler spends its time on, from `python -X importtime`:
+
+    git show HEAD~1:compiler.py > /tmp/old_compiler.py
+    python -m benchmarks.bench_startup --baseline /tmp/old_compiler.py
+
+`python compiler.py` compiles the whole file to bytecode on every run, as Python does
+for any script; `python -m compiler` uses the cached bytecode, which each compiler.py
+is given first, as it would be after its first import. Run from the repository root.
+"""
+import argparse
+import os
+import py_compile
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PROGRAM = "int x = 10;\n"
+MODES = {"": [], " --check-only": ["--check-only"], " --tokens-only": ["--tokens-only"]}
+
+
+def time_commands(commands, runs):
+    """Runs each (name, command, directory) runs times, in turn. Returns name -> wall times (s)."""
+    times = {name: [] for name, _, _ in commands}
+    for _ in range(runs):
+        for name, command, directory in commands:
+            started = time.perf_counter()
+            subprocess.run(command, cwd=directory, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+            times[name].append(time.perf_counter() - started)
+    return times
+
+
+def import_times(path, count):
+    """Returns the count slowest imports (by cumulative microseconds) of importing the compiler at path."""
+    directory, name = os.path.split(os.path.abspath(path))
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {name[:-3]}"],
+        cwd=directory, capture_output=True, text=True, check=True,
+    )
+    imports = []
+    for line in completed.stderr.splitlines()[1:]:
+        own, cumulative, module = line.split("|")  # "import time: own | cumulative | module"
+        imports.append((int(cumulative), int(own.split(":")[1]), module.rstrip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--baseline", help="path to another compiler.py to compare against")
+    parser.add_argument("--runs", type=int, default=40)
+    parser.add_argument("--imports", type=int, default=12, help="slowest imports to list")
+    args = parser.parse_args()
+    compilers = [("", "compiler.py")] + ([("baseline ", args.baseline)] if args.baseline else [])
+    for _, path in compilers:
+        py_compile.compile(path, doraise=True)
+
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as program_file:
+        program_file.write(PROGRAM)
+    try:
+        commands = [("python only", [sys.executable, "-c", "pass"], None)]
+        for label, path in compilers:
+            directory, name = os.path.split(os.path.abspath(path))
+            commands.append((f"{label}script", [sys.executable, path, program_file.name], None))
+            for mode, extra in MODES.items() if not label else [("", [])]:
+                command = [sys.executable, "-m", name[:-3], program_file.name] + extra
+                commands.append((f"{label}-m{mode}", command, directory))
+        for name, times in time_commands(commands, args.runs).items():
+            print(f"{name:>24}: median {statistics.median(times) * 1000:6.1f}ms  best {min(times) * 1000:6.1f}ms")
+    finally:
+        os.unlink(program_file.name)
+
+    for _, path in compilers:
+        print(f"\nimporting {path} (cumulative / own microseconds):")
+        for cumulative, own, module in import_times(path, args.imports):
+            print(f"  {cumulative:>8} {own:>8}  {module}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+"""
+Fuzzer for the lexer and parser.
+
+Mutates generated programs (see benchmarks/programs.py) and checks every result:
+
+- The lexers agree: tokenize_string() with tokenize_bytes() (for ASCII sources),
+  tokenize_stream() fed in random chunks, tokenize_string(..., errors) and
+  relex_tokens() from the program before the mutation.
+- The parsers agree: parse_tokens() with and without a ParseProfile, and the
+  recovering parser reports an error exactly when the others fail.
+- Nothing raises but a ValueError from the lexers or a SyntaxError from the parsers.
+
+Then looks for inputs whose time to lex and parse grows faster than their size: a
+few known-awkward snippets (unterminated prints and comments, long invalid runs) and
+random ones cut from the mutated programs are each repeated n and 4n times on one line
+and timed, both as a string and streamed in chunks by tokenize_stream(). A snippet
+whose growth exponent is over --threshold on either is cut down to the smallest one
+that still is, and reported. --save keeps those in slow_inputs.json,
+which --regressions times again, as a benchmark that fails if any has come back:
+
+    python -m benchmarks.fuzz [--seed 0] [--iterations 2000] [--save]
+    python -m benchmarks.fuzz --regressions
+
+Exits with status 1 if anything was found. Run from the repository root.
+"""
+import argparse
+import io
+import json
+import math
+import os
+import random
+import sys
+import time
+
+import compiler
+from benchmarks.programs import SHAPES, ProgramGenerator
+
+SLOW_INPUTS = os.path.join(os.path.dirname(__file__), "slow_inputs.json")
+# small chunks, so that a long line is streamed in many of them:
+STREAM_CHUNK_SIZE = 64
+
+# inserted by the mutations, as well as cut from other programs:
+FRAGMENTS = (
+    "printf('", "')", "'", "/*", "*/", "//", "\n", " ", "(", ")", "{", "}", ";", "++",
+    "if", "elif", "else", "while", "int", "x", "_a1", "7", "+", "*", "/", "-", "<=", "!=",
+    "=", ",", "@", "$", "\t", "é",
+)
+# snippets that make the lexer look ahead to the end of a line, or match a long run:
+ADVERSARIAL = (
+    "printf('", "printf('a", "printf(' ')", "/* ", "/*/", "'", "@", "@ ", "x@", "// ",
+    "printf('/* ", "/* printf('", "((", "1+", "if (a > b) { ", "iffy ",
+)
+
+
+def mutate(source, rng):
+    """Returns source with one random insertion, deletion, duplication or replacement."""
+    position = rng.randint(0, len(source))
+    end = min(len(source), position + rng.randint(0, 12))
+    kind = rng.random()
+    if kind < 0.4:
+        return source[:position] + rng.choice(FRAGMENTS) + source[position:]
+    if kind < 0.6:
+        return source[:position] + source[end:]
+    if kind < 0.8:
+        return source[:end] + source[position:end] + source[end:]
+    # any ASCII character, control characters included (eg \x1c, whitespace in a str but not in bytes):
+    return source[:position] + chr(rng.randint(0, 127)) + source[end:]
+
+
+def lex(function, *args):
+    """Returns (kind, pairs or message): "tokens" and the (token, lexeme) pairs, or "error" and the ValueError."""
+    try:
+        return "tokens", list(function(*args))
+    except ValueError as error:
+        return "error", str(error)
+
+
+def parse(tokens, profile=None):
+    """Returns (kind, tree or message) for parse_tokens(): "tree", "incomplete" or "error"."""
+    try:
+        syntax_tree = compiler.parse_tokens(tokens, profile)
+    except SyntaxError as error:
+        return "error", (str(error), getattr(error, "token_index", None))
+    return ("tree", syntax_tree) if syntax_tree is not None else ("incomplete", None)
+
+
+def chunked(source, rng):
+    chunks, position = [], 0
+    while position < len(source):
+        size = rng.randint(1, 16)
+        chunks.append(source[position : position + size])
+        position += size
+    return chunks
+
+
+def check(previous, source, rng):
+    """
+    Runs every lexer and parser over source. Returns a list of problems found, as
+    strings, and raises if anything raises what it shouldn't.
+    """
+    problems = []
+    expected = lex(compiler.tokenize_string, source)
+    if source.isascii():
+        # \\s, \\d and \\S only match ASCII characters in bytes mode, so others are left out:
+        found = lex(compiler.tokenize_bytes, source.encode())
+        if found != expected:
+            problems.append(f"tokenize_bytes() gave {found[1]!r:.200}")
+    found = lex(compiler.tokenize_stream, chunked(source, rng))
+    if found != expected:
+        problems.append(f"tokenize_stream() gave {found[1]!r:.200}")
+    invalid = []
+    recovered = compiler.tokenize_string(source, invalid)
+    if invalid:
+        start, end = invalid[0]
+        message = f"ERROR - The input contains the following invalid tokens: '{source[start:end]}'"
+        if expected != ("error", message):
+            problems.append(f"tokenize_string(errors) found {source[start:end]!r} invalid first")
+    elif expected != ("tokens", list(recovered)):
+        problems.append("tokenize_string(errors) gave different tokens")
+
+    if invalid_free(previous):
+        # the mutation as one edit, for relex_tokens():
+        prefix = 0
+        while prefix < min(len(previous), len(source)) and previous[prefix] == source[prefix]:
+            prefix += 1
+        suffix = 0
+        while suffix < min(len(previous), len(source)) - prefix and previous[-1 - suffix] == source[-1 - suffix]:
+            suffix += 1
+        old_tokens = compiler.tokenize_string(previous)
+        deleted = len(previous) - suffix - prefix
+        inserted = source[prefix : len(source) - suffix]
+        found = lex(lambda: compiler.relex_tokens(old_tokens, prefix, deleted, inserted)[0])
+        if found != expected:
+            problems.append(f"relex_tokens() gave {found[1]!r:.200}")
+
+    if expected[0] == "error":
+        return problems
+    tokens = compiler.tokenize_string(source)
+    result = parse(tokens)
+    profiled = parse(tokens, compiler.ParseProfile())
+    if profiled != result:
+        problems.append(f"parse_tokens(profile) gave {profiled!r:.200} not {result!r:.200}")
+    errors = []
+    syntax_tree = compiler.parse_tokens(tokens, errors=errors)
+    if result[0] == "tree" and (errors or syntax_tree != result[1]):
+        problems.append(f"the recovering parser found {errors[:1]!r:.200} in a valid program")
+    elif result[0] != "tree" and not errors:
+        problems.append(f"the recovering parser found nothing wrong, parse_tokens() gave {result!r:.200}")
+    elif result[0] == "error" and errors[0].token_index != result[1][1]:
+        problems.append(f"the recovering parser's first error is at token {errors[0].token_index}, not {result[1][1]}")
+    return problems
+
+
+def invalid_free(source):
+    invalid = []
+    compiler.tokenize_string(source, invalid)
+    return not invalid
+
+
+def run_fuzz(seed, iterations, rng):
+    """Mutates programs for iterations rounds. Returns (failures, snippets cut from the programs)."""
+    generator = ProgramGenerator(seed)
+    failures, snippets = [], []
+    source = ""
+    for iteration in range(iterations):
+        if iteration % 20 == 0:
+            source = " ".join(generator.generate(rng.choice(SHAPES), rng.randint(1, 6)))
+        mutated = mutate(source, rng)
+        try:
+            problems = check(source, mutated, rng)
+        except Exception as error:
+            problems = [f"crashed with {type(error).__name__}: {error}"]
+        if problems:
+            failures.append((mutated, problems))
+        if rng.random() < 0.1:
+            start = rng.randint(0, len(mutated))
+            snippet = mutated[start : start + rng.randint(1, 24)].replace("\n", " ")
+            if snippet.strip():
+                snippets.append(snippet)
+        source = mutated
+    return failures, snippets
+
+
+def lex_and_parse_time(source, repeat=3):
+    best = math.inf
+    for _ in range(repeat):
+        started = time.perf_counter()
+        tokens = compiler.tokenize_string(source, [])
+        if tokens:
+            compiler.parse_tokens(tokens, errors=[])
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def stream_time(source, repeat=3):
+    best = math.inf
+    for _ in range(repeat):
+        started = time.perf_counter()
+        try:
+            for _ in compiler.tokenize_stream(io.StringIO(source), STREAM_CHUNK_SIZE):
+                pass
+        except ValueError:
+            pass  # the stream has no errors list, so stops at an invalid token
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+# what's timed for each input:
+TIMERS = {"string": lex_and_parse_time, "stream": stream_time}
+
+
+def growth(unit, prefix="", suffix="", minimum_time=0.005, limit=4000000, timer=lex_and_parse_time):
+    """
+    Times prefix + unit * n + suffix at n and 4n with timer (one of TIMERS), with n
+    doubled until the first takes at least minimum_time (or the source would be over
+    limit characters).
+
+    Returns:
+        (exponent, n, seconds): How the time grows with n (1 for linear, 2 for
+        quadratic), and the n and time it was measured from.
+    """
+    count = max(1, 256 // len(unit))
+    while True:
+        seconds = timer(prefix + unit * count + suffix)
+        if seconds >= minimum_time or len(unit) * count * 8 > limit:
+            break
+        count *= 2
+    larger = timer(prefix + unit * count * 4 + suffix)
+    return math.log(max(larger, 1e-9) / max(seconds, 1e-9), 4), count, seconds
+
+
+def slowest_growth(unit, prefix="", suffix=""):
+    """Returns (growth(), name) for whichever of TIMERS grows fastest."""
+    return max((growth(unit, prefix, suffix, timer=timer), name) for name, timer in TIMERS.items())
+
+
+def is_slow(unit, threshold):
+    # measured twice, so one noisy timing can't flag (or clear) a snippet:
+    return any(
+        min(growth(unit, timer=timer)[0], growth(unit, timer=timer)[0]) > threshold for timer in TIMERS.values()
+    )
+
+
+def shrink(unit, threshold):
+    """Removes characters from unit, one at a time, as long as it stays slow."""
+    position = 0
+    while position < len(unit) and len(unit) > 1:
+        smaller = unit[:position] + unit[position + 1 :]
+        if is_slow(smaller, threshold):
+            unit = smaller
+        else:
+            position += 1
+    return unit
+
+
+def find_slow(snippets, threshold):
+    """Returns the (shrunk, distinct) snippets whose time grows faster than threshold allows."""
+    found = []
+    for snippet in dict.fromkeys(ADVERSARIAL + tuple(snippets)):
+        if is_slow(snippet, threshold):
+            smallest = shrink(snippet, threshold)
+            if smallest not in found:
+                found.append(smallest)
+    return found
+
+
+def load_slow_inputs():
+    if not os.path.exists(SLOW_INPUTS):
+        return []
+    with open(SLOW_INPUTS, encoding="utf-8") as slow_file:
+        return json.load(slow_file)
+
+
+def run_regressions(threshold):
+    """Times every input in slow_inputs.json. Returns the number that are still slow."""
+    still_slow = 0
+    for entry in load_slow_inputs():
+        (exponent, count, seconds), name = slowest_growth(entry["unit"], entry.get("prefix", ""), entry.get("suffix", ""))
+        slow = exponent > threshold
+        still_slow += slow
+        print(f"{entry['unit']!r:>24} {name:>6} x{count:<7} {seconds * 1000:8.2f}ms  x4: growth n^{exponent:.2f}"
+              f"{'  SLOW' if slow else ''}  {entry.get('note', '')}")
+    return still_slow
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--iterations", type=int, default=2000, help="programs to mutate and check")
+    parser.add_argument("--snippets", type=int, default=100, help="random snippets to time, besides ADVERSARIAL")
+    parser.add_argument("--threshold", type=float, default=1.4,
+                        help="growth exponent over which an input is slow (1 is linear, 2 quadratic)")
+    parser.add_argument("--save", action="store_true", help="add slow inputs found to slow_inputs.json")
+    parser.add_argument("--regressions", action="store_true", help="only time the inputs in slow_inputs.json")
+    args = parser.parse_args()
+
+    if args.regressions:
+        return 1 if run_regressions(args.threshold) else 0
+
+    rng = random.Random(args.seed)
+    failures, snippets = run_fuzz(args.seed, args.iterations, rng)
+    for source, problems in failures:
+        print(f"INCONSISTENT {source!r}")
+        for problem in problems:
+            print(f"    {problem}")
+    print(f"{args.iterations} programs checked, {len(failures)} with problems")
+
+    rng.shuffle(snippets)
+    slow = [(unit, *slowest_growth(unit)) for unit in find_slow(snippets[: args.snippets], args.threshold)]
+    for unit, (exponent, count, seconds), name in slow:
+        print(f"SLOW {unit!r} ({name}): {count} repeats take {seconds * 1000:.2f}ms, growing as n^{exponent:.2f}")
+    print(f"{len(ADVERSARIAL) + min(len(snippets), args.snippets)} snippets timed, {len(slow)} slow")
+    if args.save and slow:
+        saved = load_slow_inputs()
+        known = {entry["unit"] for entry in saved}
+        saved += [
+            {"unit": unit, "note": f"found by benchmarks/fuzz.py --seed {args.seed}, {name} growing as n^{exponent:.2f}"}
+            for unit, (exponent, _, _), name in slow if unit not in known
+        ]
+        with open(SLOW_INPUTS, "w", encoding="utf-8") as slow_file:
+            json.dump(saved, slow_file, indent=2)
+            slow_file.write("\n")
+    return 1 if failures or slow else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
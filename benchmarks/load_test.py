@@ -0,0 +1,157 @@
+"""
+Load test for compile_server.py.
+
+Sends generated programs (see benchmarks/programs.py) from several connections at
+once, each keeping a number of requests in flight, and reports throughput, errors and
+latency percentiles as seen by the client, alongside the server's own stats. Start a
+server first, or pass --start-server to have one started (and stopped) for the run:
+
+    python -m benchmarks.load_test --start-server --connections 8 --requests 5000
+
+--subprocess N also times N compilations done the old way, a `python compiler.py`
+process per program, for comparison. Run from the repository root.
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.programs import SHAPES, ProgramGenerator
+from compile_client import CompileClient
+from compile_server import latency_percentiles
+
+
+def make_sources(shapes, count, size, seed):
+    generator = ProgramGenerator(seed)
+    sources = []
+    while len(sources) < count:
+        for shape in shapes:
+            sources.extend(generator.generate(shape, size))
+    return sources[:count]
+
+
+async def _connection(options, sources, latencies, errors):
+    client = await CompileClient.connect(options.socket, options.host, options.port)
+    in_flight = asyncio.Semaphore(options.in_flight)
+
+    async def one(source):
+        async with in_flight:
+            started = time.perf_counter()
+            response = await client.compile(source, options.timeout)
+            latencies.append(time.perf_counter() - started)
+            if response["error"] is not None:
+                errors[response["error"]["type"]] = errors.get(response["error"]["type"], 0) + 1
+
+    async with client:
+        await asyncio.gather(*(one(source) for source in sources))
+        return await client.stats()
+
+
+async def run_load(options, sources):
+    """
+    Returns:
+        report (dict): Requests, seconds, requests/s, errors by type, client-side
+        latency percentiles (ms) and the server's stats at the end.
+    """
+    latencies, errors = [], {}
+    share = -(-len(sources) // options.connections)
+    started = time.perf_counter()
+    stats = await asyncio.gather(*(
+        _connection(options, sources[start:start + share], latencies, errors)
+        for start in range(0, len(sources), share)
+    ))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "seconds": elapsed,
+        "requests_per_second": len(latencies) / elapsed,
+        "errors": errors,
+        "latency_ms": latency_percentiles(latencies),
+        "server": stats[-1],
+    }
+
+
+def time_subprocesses(sources, count):
+    """Seconds per program compiled by starting `python compiler.py program.txt` for each."""
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for index, source in enumerate(sources[:count]):
+            path = os.path.join(directory, f"{index}.txt")
+            with open(path, "w") as source_file:
+                source_file.write(source)
+            paths.append(path)
+        started = time.perf_counter()
+        for path in paths:
+            subprocess.run([sys.executable, "compiler.py", path], capture_output=True)
+        return (time.perf_counter() - started) / len(paths)
+
+
+def _wait_for_server(options, server):
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("ERROR - The compile server exited before it started listening.")
+        try:
+            asyncio.run(_ping(options))
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("ERROR - The compile server didn't start listening within 30 seconds.")
+
+
+async def _ping(options):
+    async with await CompileClient.connect(options.socket, options.host, options.port) as client:
+        await client.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--socket", help="path of the server's Unix socket")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--start-server", action="store_true", help="start a server for the run")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="workers for --start-server")
+    parser.add_argument("--connections", type=int, default=4)
+    parser.add_argument("--in-flight", type=int, default=32, help="requests waiting at once per connection")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--shapes", nargs="+", choices=SHAPES, default=["prints", "elif_chain", "arithmetic"])
+    parser.add_argument("--size", type=int, default=10, help="size of each generated program, see programs.py")
+    parser.add_argument("--timeout", type=float, default=None, help="seconds each request has")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--subprocess", type=int, default=0, metavar="N",
+                        help="also time N compilations as a process each")
+    options = parser.parse_args()
+
+    sources = make_sources(options.shapes, options.requests, options.size, options.seed)
+    server = None
+    if options.start_server:
+        command = [sys.executable, "compile_server.py", "--host", options.host, "--port", str(options.port)]
+        if options.socket:
+            command += ["--socket", options.socket]
+        if options.workers:
+            command += ["-j", str(options.workers)]
+        server = subprocess.Popen(command)
+        _wait_for_server(options, server)
+    try:
+        report = asyncio.run(run_load(options, sources))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    latency = report["latency_ms"]
+    print(f"{report['requests']} requests in {report['seconds']:.2f}s: {report['requests_per_second']:,.0f}/s")
+    print(f"latency ms: p50 {latency['p50']:.2f}  p90 {latency['p90']:.2f}  p99 {latency['p99']:.2f}  max {latency['max']:.2f}")
+    print(f"errors: {report['errors'] or 'none'}")
+    server_stats = report["server"]
+    print(f"server: {server_stats['batches']} batches, {server_stats['timed_out']} timed out, "
+          f"p99 {server_stats['latency_ms']['p99']:.2f}ms")
+    if options.subprocess:
+        per_program = time_subprocesses(sources, options.subprocess)
+        print(f"a process per program: {1 / per_program:,.0f}/s ({per_program * 1000:.1f}ms each)")
+
+
+if __name__ == "__main__":
+    main()
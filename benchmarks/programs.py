@@ -0,0 +1,93 @@
+"""
+Seeded generator of valid programs for the benchmarks.
+
+A program in this language is a single statement, so shapes that can't grow inside
+one statement (a print, an arithmetic expression) are generated as a batch of `size`
+separate programs instead. Every shape returns a list of sources, and the same seed
+always gives the same list.
+"""
+import random
+
+
+SHAPES = ("prints", "elif_chain", "nested_while", "arithmetic", "comments")
+
+# identifiers that don't start with a keyword (the lexer would split "iffy" into IF + "fy"):
+NAMES = ("a", "b", "c", "x", "y", "n", "count", "total", "value", "left", "right")
+RELATIONAL_OPERATORS = (">", "<", ">=", "<=", "==", "!=")
+ARITHMETIC_OPERATORS = ("+", "-", "*", "/")
+WORDS = ("hello", "x is more than y", "100", "done", "IF x", "WHILE", "a $3(^&*&)", "end")
+
+
+class ProgramGenerator:
+    """
+    Makes programs of a given shape and size.
+
+    Args:
+        seed (int): Seed for the random choices, so runs can be repeated exactly.
+    """
+
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+
+    def generate(self, shape, size):
+        """
+        Args:
+            shape (str): One of SHAPES.
+            size (int): Number of programs, clauses or levels of nesting, depending on the shape.
+        Returns:
+            sources (list): The generated programs.
+        """
+        if shape not in SHAPES:
+            raise ValueError(f"Unknown shape {shape!r}, expected one of {SHAPES}")
+        return getattr(self, shape)(size)
+
+    def condition(self):
+        if self.random.random() < 0.5:
+            return f"{self.random.choice(NAMES)} {self.random.choice(RELATIONAL_OPERATORS)} {self.random.choice(NAMES)}"
+        return f"{self.random.randint(0, 999)} {self.random.choice(RELATIONAL_OPERATORS)} {self.random.randint(0, 999)}"
+
+    def print_statement(self):
+        return f"printf('{self.random.choice(WORDS)}');"
+
+    def prints(self, size):
+        """`size` print statements, as separate programs."""
+        return [self.print_statement() for _ in range(size)]
+
+    def elif_chain(self, size):
+        """An if statement with `size` elif clauses, some holding an if of their own."""
+        parts = [f"if ({self.condition()}) {{ {self.print_statement()} }}"]
+        for _ in range(size):
+            if self.random.random() < 0.2:
+                block = f"if ({self.condition()}) {{ {self.print_statement()} }};"
+            else:
+                block = self.print_statement()
+            parts.append(f"elif ({self.condition()}) {{ {block} }}")
+        parts.append(f"else {{ {self.print_statement()} }};")
+        return [" ".join(parts)]
+
+    def nested_while(self, size):
+        """A while loop holding `size` if statements, each nested in the one before."""
+        counter = self.random.choice(NAMES)
+        opening = f"while ({counter} < {self.random.randint(1, 999)}) {{ "
+        ifs = "".join(f"if ({self.condition()}) {{ " for _ in range(size))
+        closing = " };" * size
+        return [f"{opening}{ifs}{self.print_statement()}{closing} {counter}++ }};"]
+
+    def arithmetic(self, size):
+        """`size` arithmetic expressions, as separate programs."""
+        return [
+            f"{self.random.randint(0, 99999)} {self.random.choice(ARITHMETIC_OPERATORS)} {self.random.randint(0, 99999)};"
+            for _ in range(size)
+        ]
+
+    def comments(self, size):
+        """An elif chain of `size` clauses with single and multi-line comments between them."""
+        parts = [f"if ({self.condition()}) {{ {self.print_statement()} }}"]
+        for index in range(size):
+            if self.random.random() < 0.5:
+                parts.append(f"// clause {index}: {self.random.choice(WORDS)}\n")
+            else:
+                parts.append(f"/* clause {index}: {self.random.choice(WORDS)} */")
+            parts.append(f"elif ({self.condition()}) {{ /* body */ {self.print_statement()} }}")
+        parts.append("; // end of chain")
+        return [" ".join(parts)]
@@ -0,0 +1,656 @@
+"""
+Bytecode backend: lowers a syntax tree from compiler.parse_tokens() into compact
+bytecode and runs it on a stack-based virtual machine.
+
+    result = compiler.compile_source(source)
+    program = compile_program(result.syntax_tree)
+    execution = run(program, variables={"x": 0})
+    execution.output     # lines printed by printf()
+    execution.variables  # values of the variables afterwards
+
+Instructions are ints in an array('i'): an opcode followed by its arguments, which
+index into registers (the variables, then the numbers) or the pool of printed text.
+Conditions compile to a single compare-and-jump instruction. A Bytecode
+can be written out with to_bytes() and read back with Bytecode.from_bytes(), so a
+program only has to be compiled once.
+
+Also runnable from the command line:
+
+    python bytecode.py program.txt [--set x=0] [--save program.bc]
+    python bytecode.py --load program.bc [--set x=0]
+"""
+import argparse
+from array import array
+from collections import namedtuple
+import struct
+import sys
+
+import compiler
+
+
+# Opcodes. Numbers and variables both live in registers - the variables, followed by
+# the constants - so loading either is the same instruction. Most instructions are an
+# opcode and one argument (0 when unused), the compare-and-jumps are an opcode and three.
+LOAD = 1  # push registers[argument]
+STORE = 2  # pop into registers[argument]
+ADD = 3  # pop b, pop a, push a + b
+SUBTRACT = 4
+MULTIPLY = 5
+DIVIDE = 6  # integer division, rounding towards zero as in C
+PRINT = 7  # print strings[argument]
+INCREMENT = 8  # add 1 to registers[argument], once per iteration of a while loop
+SET_VALUE = 9  # pop the value of an arithmetic statement
+JUMP = 10  # continue from code[argument]
+HALT = 11
+# (a, b, target): jump to target unless registers[a] <op> registers[b]:
+JUMP_UNLESS_MORE_THAN = 12
+JUMP_UNLESS_LESS_THAN = 13
+JUMP_UNLESS_MORE_THAN_OR_EQUALS = 14
+JUMP_UNLESS_LESS_THAN_OR_EQUALS = 15
+JUMP_UNLESS_EQUALS = 16
+JUMP_UNLESS_NOT_EQUALS = 17
+# (a, b, target): jump to target if registers[a] <op> registers[b], used at the
+# bottom of while loops so each iteration only needs the one jump:
+JUMP_IF_MORE_THAN = 18
+JUMP_IF_LESS_THAN = 19
+JUMP_IF_MORE_THAN_OR_EQUALS = 20
+JUMP_IF_LESS_THAN_OR_EQUALS = 21
+JUMP_IF_EQUALS = 22
+JUMP_IF_NOT_EQUALS = 23
+
+OPCODE_NAMES = {
+    globals()[name]: name
+    for name in [
+        "LOAD", "STORE", "ADD", "SUBTRACT", "MULTIPLY", "DIVIDE", "PRINT", "INCREMENT",
+        "SET_VALUE", "JUMP", "HALT",
+        "JUMP_UNLESS_MORE_THAN", "JUMP_UNLESS_LESS_THAN", "JUMP_UNLESS_MORE_THAN_OR_EQUALS",
+        "JUMP_UNLESS_LESS_THAN_OR_EQUALS", "JUMP_UNLESS_EQUALS", "JUMP_UNLESS_NOT_EQUALS",
+        "JUMP_IF_MORE_THAN", "JUMP_IF_LESS_THAN", "JUMP_IF_MORE_THAN_OR_EQUALS",
+        "JUMP_IF_LESS_THAN_OR_EQUALS", "JUMP_IF_EQUALS", "JUMP_IF_NOT_EQUALS",
+    ]
+}
+# number of ints in each instruction, opcode included:
+INSTRUCTION_SIZES = {opcode: 4 if opcode >= JUMP_UNLESS_MORE_THAN else 2 for opcode in OPCODE_NAMES}
+
+_ARITHMETIC_OPCODES = {
+    compiler.TokenType.ADD: ADD,
+    compiler.TokenType.SUBTRACT: SUBTRACT,
+    compiler.TokenType.MULTIPLY: MULTIPLY,
+    compiler.TokenType.DIVIDE: DIVIDE,
+}
+# indexed the same way, by relative operator token code:
+_JUMP_UNLESS_OPCODES = {
+    compiler.TokenType.MORE_THAN: JUMP_UNLESS_MORE_THAN,
+    compiler.TokenType.LESS_THAN: JUMP_UNLESS_LESS_THAN,
+    compiler.TokenType.MORE_THAN_OR_EQUALS: JUMP_UNLESS_MORE_THAN_OR_EQUALS,
+    compiler.TokenType.LESS_THAN_OR_EQUALS: JUMP_UNLESS_LESS_THAN_OR_EQUALS,
+    compiler.TokenType.EQUALS: JUMP_UNLESS_EQUALS,
+    compiler.TokenType.NOT_EQUALS: JUMP_UNLESS_NOT_EQUALS,
+}
+_JUMP_IF_OPCODES = {
+    operator: opcode + (JUMP_IF_MORE_THAN - JUMP_UNLESS_MORE_THAN)
+    for operator, opcode in _JUMP_UNLESS_OPCODES.items()
+}
+# how each opcode changes the depth of the value stack:
+_STACK_EFFECTS = {LOAD: 1, STORE: -1, ADD: -1, SUBTRACT: -1, MULTIPLY: -1, DIVIDE: -1, SET_VALUE: -1}
+
+BYTECODE_MAGIC = b"PSBC"
+BYTECODE_VERSION = 2
+_PREFIX = struct.Struct("<4sH")  # magic, version: the same in every version
+_HEADER = struct.Struct("<4sHIIIII")  # magic, version, stack size, code, constants, names, strings
+_LENGTH = struct.Struct("<I")
+
+
+class Bytecode:
+    """
+    A compiled program.
+
+    Attributes:
+        code (array): The instructions (see INSTRUCTION_SIZES).
+        constants (list): Number values (ints), in the registers after the variables,
+        then a 0 for each scratch register the program uses.
+        names (list): Variable names, the first registers.
+        strings (list): Printed text, indexed by PRINT.
+        stack_size (int): Most values the program ever has on the stack at once.
+    """
+
+    __slots__ = ("code", "constants", "names", "strings", "stack_size", "_inputs")
+    _FIELDS = ("code", "constants", "names", "strings", "stack_size")
+
+    def __init__(self, code, constants, names, strings, stack_size):
+        self.code = code
+        self.constants = constants
+        self.names = names
+        self.strings = strings
+        self.stack_size = stack_size
+        self._inputs = None
+
+    def __eq__(self, other):
+        return type(other) is Bytecode and all(
+            getattr(self, name) == getattr(other, name) for name in Bytecode._FIELDS
+        )
+
+    def instructions(self):
+        """Yields (position, opcode, arguments) for each instruction in code."""
+        code = self.code
+        pc = 0
+        while pc < len(code):
+            size = INSTRUCTION_SIZES[code[pc]]
+            yield pc, code[pc], tuple(code[pc + 1 : pc + size])
+            pc += size
+
+    def inputs(self):
+        """
+        Returns:
+            names (list): Variables the program reads without setting them first, which
+            have to be given a value to run it.
+        """
+        if self._inputs is None:
+            read, written = set(), set()
+            variable_count = len(self.names)
+            for _, opcode, arguments in self.instructions():
+                if opcode == STORE:
+                    written.add(arguments[0])
+                elif opcode == LOAD or opcode == INCREMENT:
+                    read.add(arguments[0])
+                elif opcode >= JUMP_UNLESS_MORE_THAN:
+                    read.update(arguments[:2])
+            self._inputs = [
+                self.names[register]
+                for register in sorted(read - written)
+                if register < variable_count
+            ]
+        return self._inputs
+
+    def disassemble(self):
+        """
+        Returns:
+            listing (str): One line per instruction, eg "    4 LOAD 0 (x)".
+        """
+        registers = self.names + self.constants
+        lines = []
+        for pc, opcode, arguments in self.instructions():
+            line = f"{pc:>5} {OPCODE_NAMES[opcode]} {' '.join(map(str, arguments))}"
+            if opcode in (LOAD, STORE, INCREMENT):
+                line += f" ({registers[arguments[0]]})"
+            elif opcode == PRINT:
+                line += f" ({self.strings[arguments[0]]!r})"
+            elif opcode >= JUMP_UNLESS_MORE_THAN:
+                line += f" ({registers[arguments[0]]}, {registers[arguments[1]]})"
+            lines.append(line)
+        return "\n".join(lines)
+
+    def to_bytes(self):
+        """
+        Returns:
+            data (bytes): The program in a portable (little-endian) binary format.
+        """
+        code = array("i", self.code)
+        if sys.byteorder == "big":
+            code.byteswap()
+        parts = [
+            _HEADER.pack(
+                BYTECODE_MAGIC, BYTECODE_VERSION, self.stack_size,
+                len(code), len(self.constants), len(self.names), len(self.strings),
+            ),
+            code.tobytes(),
+        ]
+        for item in [str(constant) for constant in self.constants] + self.names + self.strings:
+            encoded = item.encode("utf-8")
+            parts.append(_LENGTH.pack(len(encoded)))
+            parts.append(encoded)
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Reads a program written by to_bytes().
+
+        Raises:
+            ValueError: if data isn't bytecode, is from another version, or has been cut
+            short or corrupted.
+        """
+        data = memoryview(data)
+        if len(data) < _PREFIX.size or _PREFIX.unpack_from(data)[0] != BYTECODE_MAGIC:
+            raise ValueError("ERROR - Not a bytecode file.")
+        version = _PREFIX.unpack_from(data)[1]
+        if version != BYTECODE_VERSION:
+            raise ValueError(f"ERROR - Bytecode version {version} isn't supported (expected {BYTECODE_VERSION}).")
+        _check_length(data, 0, _HEADER.size)
+        _, _, stack_size, code_length, constant_count, name_count, string_count = _HEADER.unpack_from(data)
+        position = _HEADER.size
+        code = array("i")
+        code_bytes = code_length * code.itemsize
+        _check_length(data, position, code_bytes)
+        code.frombytes(data[position : position + code_bytes])
+        if sys.byteorder == "big":
+            code.byteswap()
+        position += code_bytes
+        items = []
+        for _ in range(constant_count + name_count + string_count):
+            _check_length(data, position, _LENGTH.size)
+            (length,) = _LENGTH.unpack_from(data, position)
+            position += _LENGTH.size
+            _check_length(data, position, length)
+            items.append(str(data[position : position + length], "utf-8"))
+            position += length
+        if position != len(data):
+            raise ValueError("ERROR - Bytecode has unexpected data after the end of the program.")
+        constants = [int(item) for item in items[:constant_count]]
+        names = items[constant_count : constant_count + name_count]
+        strings = items[constant_count + name_count :]
+        _check_code(code, constant_count + name_count, string_count, stack_size)
+        return cls(code, constants, names, strings, stack_size)
+
+
+def _check_length(data, position, length):
+    # raises, rather than reading past the end of data (or reading less than length):
+    if position + length > len(data):
+        raise ValueError("ERROR - Bytecode is truncated.")
+
+
+def _check_code(code, register_count, string_count, stack_size):
+    """
+    Checks that loaded code can be run: every instruction is whole and known, its
+    registers, strings and jump targets exist, it ends with HALT, and stack_size is
+    the deepest the stack gets.
+
+    Raises:
+        ValueError: for the first of these that doesn't hold.
+    """
+    depths = {}  # instruction start -> stack depth there
+    targets = []
+    depth = deepest = 0
+    pc = opcode = 0
+    while pc < len(code):
+        opcode = code[pc]
+        if opcode not in OPCODE_NAMES:
+            raise ValueError(f"ERROR - Bytecode has an unknown opcode {opcode} at {pc}.")
+        size = INSTRUCTION_SIZES[opcode]
+        if pc + size > len(code):
+            raise ValueError(f"ERROR - Bytecode's last instruction, at {pc}, is cut short.")
+        depths[pc] = depth
+        if opcode >= JUMP_UNLESS_MORE_THAN:
+            registers = code[pc + 1 : pc + 3]
+            targets.append((pc, code[pc + 3]))
+        elif opcode in (LOAD, STORE, INCREMENT):
+            registers = code[pc + 1 : pc + 2]
+        else:
+            registers = ()
+        if any(not 0 <= register < register_count for register in registers):
+            raise ValueError(f"ERROR - Bytecode uses a register that doesn't exist at {pc}.")
+        if opcode == PRINT and not 0 <= code[pc + 1] < string_count:
+            raise ValueError(f"ERROR - Bytecode prints a string that doesn't exist at {pc}.")
+        if opcode == JUMP:
+            targets.append((pc, code[pc + 1]))
+        # the compiler only jumps between statements, with nothing on the stack, so
+        # the depth at each instruction is the same whichever way it's reached:
+        if depth and (opcode == JUMP or opcode >= JUMP_UNLESS_MORE_THAN or opcode == HALT):
+            raise ValueError(f"ERROR - Bytecode jumps with values left on the stack at {pc}.")
+        depth += _STACK_EFFECTS.get(opcode, 0)
+        if depth < 0:
+            raise ValueError(f"ERROR - Bytecode takes a value off an empty stack at {pc}.")
+        deepest = max(deepest, depth)
+        pc += size
+    if opcode != HALT:
+        raise ValueError("ERROR - Bytecode doesn't end with HALT.")
+    for pc, target in targets:
+        if target not in depths:
+            raise ValueError(f"ERROR - Bytecode jumps to {target}, which isn't an instruction, at {pc}.")
+        if depths[target]:
+            raise ValueError(f"ERROR - Bytecode jumps into the middle of an expression at {pc}.")
+    if stack_size != deepest:
+        raise ValueError(f"ERROR - Bytecode's stack size {stack_size} doesn't match its code ({deepest}).")
+
+
+class _Label:
+    """A position in the code that jumps refer to, filled in once it's known."""
+
+    __slots__ = ("position",)
+
+    def __init__(self):
+        self.position = None
+
+
+def _variable_names(syntax_tree):
+    """Every variable name in the tree, in the order they first appear."""
+    names = {}
+    for statement in compiler.walk_statements(syntax_tree):
+        kind = type(statement)
+        if kind is compiler.IntDeclaration:
+            names.setdefault(statement.name)
+            continue
+        if kind is compiler.IfStatement:
+            expressions = [condition for condition, _ in statement.branches]
+        elif kind is compiler.WhileLoop:
+            expressions = [statement.condition, statement.counter]
+        elif kind is compiler.PrintStatement:
+            continue
+        else:
+            expressions = [statement]  # arithmetic
+        for expression in expressions:
+            for node in compiler.walk_expression(expression):
+                if type(node) is compiler.Variable:
+                    names.setdefault(node.name)
+    return list(names)
+
+
+def _expression_instructions(expression, register):
+    """
+    The instructions that push the value of an expression, working out its operands
+    (left first) before each operator. Built from an explicit stack, so expressions of
+    any length can be compiled.
+    """
+    instructions = []
+    pending = [expression]
+    while pending:
+        item = pending.pop()
+        kind = type(item)
+        if kind is tuple:
+            instructions.append(item)
+        elif kind is compiler.ArithmeticExpression:
+            pending.append((_ARITHMETIC_OPCODES[item.operator], 0))
+            pending.append(item.right)
+            pending.append(item.left)
+        else:
+            instructions.append((LOAD, register(item)))
+    return instructions
+
+
+def compile_program(syntax_tree):
+    """
+    Lowers a syntax tree into bytecode.
+
+    Statements are expanded into instructions off an explicit stack, like
+    compiler.generate_code(), so any depth of nesting works. Conditions become a single
+    compare-and-jump on two registers, and while loops test their condition at the
+    bottom, so one pass round a loop runs as few instructions as possible. A side of a
+    condition that is more than a number or variable is worked out on the stack first
+    and stored in one of two scratch registers, which come after the constants.
+
+    Args:
+        syntax_tree (Program): A tree from compiler.parse_tokens().
+    Returns:
+        bytecode (Bytecode): The compiled program.
+    """
+    names = _variable_names(syntax_tree)
+    registers = {name: register for register, name in enumerate(names)}
+    constants, strings = [], []
+    string_indexes = {}
+
+    def register(operand):
+        if type(operand) is compiler.Variable:
+            return registers[operand.name]
+        value = int(operand.value)
+        key = ("constant", value)  # can't clash with a variable name, which is a str
+        if key not in registers:
+            registers[key] = len(names) + len(constants)
+            constants.append(value)
+        return registers[key]
+
+    def scratch_register(number):
+        key = ("scratch", number)
+        if key not in registers:
+            registers[key] = len(names) + len(constants)
+            constants.append(0)  # overwritten before it's read
+        return registers[key]
+
+    def condition_registers(condition, before):
+        # registers holding the two sides of condition, adding the instructions that
+        # work out any side that isn't a number or variable to before:
+        operands = []
+        for number, side in enumerate((condition.left, condition.right)):
+            if type(side) is compiler.ArithmeticExpression:
+                before.extend(_expression_instructions(side, register))
+                before.append((STORE, scratch_register(number)))
+                operands.append(scratch_register(number))
+            else:
+                operands.append(register(side))
+        return operands
+
+    def string_index(text):
+        if text not in string_indexes:
+            string_indexes[text] = len(strings)
+            strings.append(text)
+        return string_indexes[text]
+
+    code = array("i")
+    jumps = []  # (position of a jump target, label)
+    depth = stack_size = 0
+    # pending holds nodes still to compile, instructions to emit and labels to place:
+    pending = [(HALT, 0)] + syntax_tree.statements[::-1]
+    while pending:
+        item = pending.pop()
+        kind = type(item)
+        if kind is tuple:
+            code.append(item[0])
+            for argument in item[1:]:
+                if type(argument) is _Label:
+                    jumps.append((len(code), argument))
+                    argument = 0
+                code.append(argument)
+            depth += _STACK_EFFECTS.get(item[0], 0)
+            stack_size = max(stack_size, depth)
+        elif kind is _Label:
+            item.position = len(code)
+        elif kind is compiler.PrintStatement:
+            pending.append((PRINT, string_index(item.text)))
+        elif kind is compiler.IntDeclaration:
+            pending.append((STORE, registers[item.name]))
+            pending.append((LOAD, register(item.value)))
+        elif kind is compiler.ArithmeticExpression or kind is compiler.Number or kind is compiler.Variable:
+            pending.append((SET_VALUE, 0))
+            pending.extend(reversed(_expression_instructions(item, register)))
+        elif kind is compiler.IfStatement:
+            end = _Label()
+            sequence = []
+            for number, (condition, block) in enumerate(item.branches):
+                next_branch = _Label()
+                operands = condition_registers(condition, sequence)
+                sequence.append((_JUMP_UNLESS_OPCODES[condition.operator], *operands, next_branch))
+                sequence.extend(block)
+                if number < len(item.branches) - 1 or item.else_block:
+                    sequence.append((JUMP, end))
+                sequence.append(next_branch)
+            if item.else_block:
+                sequence.extend(item.else_block)
+            sequence.append(end)
+            pending.extend(reversed(sequence))
+        elif kind is compiler.WhileLoop:
+            body, test = _Label(), _Label()
+            condition = item.condition
+            sequence = [
+                (JUMP, test),
+                body,
+                *item.block,
+                (INCREMENT, registers[item.counter.name]),
+                test,
+            ]
+            operands = condition_registers(condition, sequence)
+            sequence.append((_JUMP_IF_OPCODES[condition.operator], *operands, body))
+            pending.extend(reversed(sequence))
+        else:
+            raise Exception(f"ERROR - Can't compile {kind.__name__} to bytecode.")
+    for position, label in jumps:
+        code[position] = label.position
+    return Bytecode(code, constants, names, strings, stack_size)
+
+
+Execution = namedtuple("Execution", ["output", "variables", "value", "iterations"])
+Execution.__doc__ = """
+What running a program did.
+
+    output (list): Text printed by each printf(), in order.
+    variables (dict): Every variable's value once the program finished.
+    value (int): Value of the arithmetic statement, or None if there wasn't one.
+    iterations (int): Number of times while loops went round.
+"""
+
+
+def run(bytecode, variables=None, max_iterations=None):
+    """
+    Runs a program on the virtual machine.
+
+    The registers and the value stack are allocated once, at the sizes the compiler
+    worked out, and the dispatch loop keeps everything it uses in local variables,
+    testing the most frequent opcodes first.
+
+    Args:
+        bytecode (Bytecode): The program, from compile_program() or Bytecode.from_bytes().
+        variables (dict): Starting values of variables. Every variable in
+        bytecode.inputs(), eg the x in "while (x < 10)", needs one.
+        max_iterations (int): Stop with a RuntimeError once while loops have gone
+        round this many times (at least 1), for programs that might never finish (eg
+        x > 0 with x++). None for no limit.
+    Returns:
+        execution (Execution): The output, variables and value of the program.
+    Raises:
+        NameError: if a variable the program reads isn't given a value.
+        ZeroDivisionError: if the program divides by zero.
+        RuntimeError: if max_iterations is reached.
+        ValueError: if max_iterations is below 1.
+    """
+    if max_iterations is not None and max_iterations < 1:
+        raise ValueError(f"ERROR - max_iterations has to be at least 1, not {max_iterations}.")
+    variables = variables or {}
+    missing = [name for name in bytecode.inputs() if name not in variables]
+    if missing:
+        raise NameError(f"ERROR - Variables {', '.join(missing)} need a value to run the program.")
+    code = bytecode.code
+    strings = bytecode.strings
+    names = bytecode.names
+    registers = [variables.get(name, 0) for name in names] + bytecode.constants
+    stack = [None] * bytecode.stack_size
+    output = []
+    print_text = output.append
+    value = None
+    iterations = 0
+    limit = -1 if max_iterations is None else max_iterations
+    sp = 0
+    pc = 0
+    while True:
+        opcode = code[pc]
+        if opcode >= JUMP_UNLESS_MORE_THAN:
+            left = registers[code[pc + 1]]
+            right = registers[code[pc + 2]]
+            if opcode == JUMP_IF_LESS_THAN:
+                taken = left < right
+            elif opcode == JUMP_IF_MORE_THAN:
+                taken = left > right
+            elif opcode == JUMP_IF_LESS_THAN_OR_EQUALS:
+                taken = left <= right
+            elif opcode == JUMP_IF_MORE_THAN_OR_EQUALS:
+                taken = left >= right
+            elif opcode == JUMP_IF_EQUALS:
+                taken = left == right
+            elif opcode == JUMP_IF_NOT_EQUALS:
+                taken = left != right
+            elif opcode == JUMP_UNLESS_MORE_THAN:
+                taken = not left > right
+            elif opcode == JUMP_UNLESS_LESS_THAN:
+                taken = not left < right
+            elif opcode == JUMP_UNLESS_EQUALS:
+                taken = not left == right
+            elif opcode == JUMP_UNLESS_NOT_EQUALS:
+                taken = not left != right
+            elif opcode == JUMP_UNLESS_MORE_THAN_OR_EQUALS:
+                taken = not left >= right
+            else:
+                taken = not left <= right
+            pc = code[pc + 3] if taken else pc + 4
+            continue
+        argument = code[pc + 1]
+        pc += 2
+        if opcode == PRINT:
+            print_text(strings[argument])
+        elif opcode == INCREMENT:
+            registers[argument] += 1
+            iterations += 1
+            if iterations == limit:
+                raise RuntimeError(f"ERROR - Loop still running after {max_iterations} iterations.")
+        elif opcode == JUMP:
+            pc = argument
+        elif opcode == LOAD:
+            stack[sp] = registers[argument]
+            sp += 1
+        elif opcode == STORE:
+            sp -= 1
+            registers[argument] = stack[sp]
+        elif opcode == ADD:
+            sp -= 1
+            stack[sp - 1] += stack[sp]
+        elif opcode == SUBTRACT:
+            sp -= 1
+            stack[sp - 1] -= stack[sp]
+        elif opcode == MULTIPLY:
+            sp -= 1
+            stack[sp - 1] *= stack[sp]
+        elif opcode == DIVIDE:
+            sp -= 1
+            divisor = stack[sp]
+            if divisor == 0:
+                raise ZeroDivisionError("ERROR - Division by zero.")
+            quotient = abs(stack[sp - 1]) // abs(divisor)
+            stack[sp - 1] = quotient if (stack[sp - 1] < 0) == (divisor < 0) else -quotient
+        elif opcode == SET_VALUE:
+            sp -= 1
+            value = stack[sp]
+        elif opcode == HALT:
+            break
+        else:
+            raise ValueError(f"ERROR - Unknown opcode {opcode} at {pc - 2}.")
+    result_variables = dict(variables)
+    result_variables.update(zip(names, registers))
+    return Execution(output, result_variables, value, iterations)
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Compile a program to bytecode and run it.")
+    parser.add_argument("path", nargs="?", help="source file to compile and run")
+    parser.add_argument("--load", help="run a bytecode file saved with --save instead")
+    parser.add_argument("--save", help="write the compiled bytecode to this file")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE",
+                        help="starting value of a variable, eg --set x=0")
+    parser.add_argument("--max-iterations", type=int, default=None,
+                        help="stop once while loops have gone round this many times (at least 1)")
+    parser.add_argument("--disassemble", action="store_true", help="print the bytecode")
+    options = parser.parse_args(arguments)
+    if bool(options.path) == bool(options.load):
+        parser.error("give either a source file or --load")
+    if options.max_iterations is not None and options.max_iterations < 1:
+        parser.error("--max-iterations has to be at least 1")
+
+    if options.load:
+        with open(options.load, "rb") as bytecode_file:
+            program = Bytecode.from_bytes(bytecode_file.read())
+    else:
+        with open(options.path, encoding=compiler.SOURCE_ENCODING) as source_file:
+            result = compiler.compile_source(source_file.read())
+        if not result.ok:
+            for diagnostic in result.diagnostics:
+                sys.stderr.write(diagnostic.describe(options.path) + "\n")
+            return 1
+        program = compile_program(result.syntax_tree)
+    if options.save:
+        with open(options.save, "wb") as bytecode_file:
+            bytecode_file.write(program.to_bytes())
+    if options.disassemble:
+        print(program.disassemble())
+    variables = {}
+    for setting in options.set:
+        name, _, value = setting.partition("=")
+        variables[name] = int(value)
+    try:
+        execution = run(program, variables, options.max_iterations)
+    except (NameError, ZeroDivisionError, RuntimeError) as error:
+        sys.stderr.write(f"{error}\n")
+        return 1
+    for line in execution.output:
+        print(line)
+    if execution.value is not None:
+        print(execution.value)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
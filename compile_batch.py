@@ -0,0 +1,172 @@
+"""
+Batch compilation over a pool of worker processes.
+
+compile_many() compiles a list of source strings and compile_many_files() a list of
+paths, splitting the work into chunks so each task sent to a worker carries many
+sources rather than one. Nothing is printed: every input gives back a BatchResult
+holding either its pseudo code or a structured error.
+
+Also runnable from the command line:
+
+    python compile_batch.py programs/ other.txt -j 8 --unordered
+"""
+import argparse
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import json
+import os
+import sys
+
+import compiler
+
+
+BatchResult = namedtuple("BatchResult", ["index", "name", "pseudo_code", "error"])
+BatchResult.__doc__ = """
+Outcome of compiling one input of a batch.
+
+    index (int): Position of the input in the batch.
+    name (str): The path, or for compile_many() the index as a string.
+    pseudo_code (str): The generated pseudo code, or None if compilation failed.
+    error (dict): None on success, otherwise {"type", "message", "cause"} where cause
+    is the message of the underlying exception (the stages wrap e.g. ValueErrors).
+"""
+
+
+def error_details(error):
+    """
+    Returns:
+        details (dict): JSON-friendly description of a compilation error.
+    """
+    cause = error.__cause__ or error.__context__
+    return {
+        "type": type(error).__name__,
+        "message": str(error),
+        "cause": str(cause) if cause is not None else None,
+    }
+
+
+def _compile_one(index, name, source, is_path):
+    if not is_path:
+        result = compiler.compile_source(source)
+        if result.ok:
+            return BatchResult(index, name, result.pseudo_code, None)
+        return BatchResult(index, name, None, error_details(result.error))
+    try:
+        pseudo_code = compiler.compile_file(source, verbose=False)
+    except Exception as error:
+        return BatchResult(index, name, None, error_details(error))
+    return BatchResult(index, name, pseudo_code, None)
+
+
+def compile_chunk(start, items, is_path=False):
+    """
+    Compiles a chunk of a batch in this process. Sent to the workers as a task by
+    compile_many() (and by compile_server.py), so it stays a module-level function
+    that can be pickled.
+
+    Args:
+        start (int): Index in the batch of the chunk's first input.
+        items (list): (name, source) pairs, where source is a path if is_path.
+        is_path (bool): Compile files rather than source strings.
+    Returns:
+        results (list): One BatchResult per item.
+    """
+    return [
+        _compile_one(start + offset, name, source, is_path)
+        for offset, (name, source) in enumerate(items)
+    ]
+
+
+def _run_batch(items, is_path, workers, chunksize, ordered):
+    if workers == 1 or len(items) <= chunksize:
+        # not worth starting processes for, compiled in this one:
+        yield from compile_chunk(0, items, is_path)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(compile_chunk, start, items[start:start + chunksize], is_path)
+            for start in range(0, len(items), chunksize)
+        ]
+        for future in futures if ordered else as_completed(futures):
+            yield from future.result()
+
+
+def compile_many(sources, workers=None, chunksize=16, ordered=True):
+    """
+    Compiles many source strings in parallel without printing anything.
+
+    Args:
+        sources (iterable): Source strings to compile.
+        workers (int): Number of worker processes, defaults to the number of CPUs.
+        Pass 1 to compile in the calling process.
+        chunksize (int): Number of sources sent to a worker per task.
+        ordered (bool): Yield results in input order if True, otherwise as each
+        chunk completes (compare BatchResult.index to match them up).
+    Returns:
+        results (generator): One BatchResult per source.
+    """
+    items = [(str(index), source) for index, source in enumerate(sources)]
+    return _run_batch(items, False, workers, chunksize, ordered)
+
+
+def compile_many_files(paths, workers=None, chunksize=16, ordered=True):
+    """
+    Compiles many source files in parallel without printing anything.
+    Only the paths are sent to the workers, which map the files themselves.
+
+    Args:
+        paths (iterable): Paths of UTF-8 encoded source files.
+        workers, chunksize, ordered: As for compile_many().
+    Returns:
+        results (generator): One BatchResult per path.
+    """
+    items = [(path, path) for path in paths]
+    return _run_batch(items, True, workers, chunksize, ordered)
+
+
+def find_sources(paths):
+    """
+    Expands directories into the files they contain (recursively, sorted).
+
+    Returns:
+        files (list): Paths of files to compile.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, subdirectories, names in os.walk(path):
+                subdirectories.sort()
+                files.extend(os.path.join(directory, name) for name in sorted(names))
+        else:
+            files.append(path)
+    return files
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Compile many source files in parallel.")
+    parser.add_argument("paths", nargs="+", help="source files or directories of them")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("--chunksize", type=int, default=16,
+                        help="number of files sent to a worker per task")
+    parser.add_argument("--unordered", action="store_true",
+                        help="report results as they complete rather than in input order")
+    options = parser.parse_args(arguments)
+
+    failed = 0
+    # one JSON object per line, so output can be streamed into other tools:
+    for result in compile_many_files(
+        find_sources(options.paths),
+        workers=options.workers,
+        chunksize=options.chunksize,
+        ordered=not options.unordered,
+    ):
+        failed += result.error is not None
+        print(json.dumps(
+            {"path": result.name, "pseudo_code": result.pseudo_code, "error": result.error}
+        ))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""
+Content-addressed cache of compilations, for compile_input(source, cache=...).
+
+Entries are keyed by a hash of the source text plus VERSION_STAMP, so a change to
+the compiler version or the grammar never returns stale results. Each entry holds
+the tokens, syntax tree, pseudo code, symbol table and diagnostics (eg warnings
+about undeclared variables) of a successful compilation. Entries are
+kept in memory in least recently used order, bounded by both entry count and size,
+and can also be written to a cache directory so they outlive the process.
+
+Entries are kept pickled and unpickled on every hit, so each hit gets its own copy:
+changing a result (eg optimize_tree() folding its tree in place) can't change what
+later hits get.
+"""
+from collections import OrderedDict
+import hashlib
+import os
+import pickle
+import tempfile
+
+import compiler
+
+
+def _version_stamp():
+    """
+    Hash of everything that decides the compiler's output: COMPILER_VERSION plus the
+    token patterns and grammar tables, so editing either invalidates old entries.
+    """
+    grammar = repr(
+        (
+            compiler.COMPILER_VERSION,
+            compiler.TOKEN_PATTERNS,
+            compiler.PRODUCTIONS,
+            compiler.PARSING_TABLE,
+        )
+    )
+    return hashlib.sha256(grammar.encode("utf-8")).hexdigest()[:16]
+
+
+VERSION_STAMP = _version_stamp()
+
+
+class CompileCache:
+    """
+    LRU cache of (tokens, syntax_tree, pseudo_code, symbols, diagnostics) compilations.
+
+    Args:
+        max_entries (int): Most entries kept in memory.
+        max_bytes (int): Most bytes kept in memory, measured as the pickled size of
+        each entry.
+        directory (str): Optional directory to also store entries in. Entries found
+        there are loaded back into memory on use. Only point this at a directory you
+        trust, as entries are unpickled.
+
+    The hits, misses, disk_hits and evictions counters are also available
+    together from stats().
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, directory=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.entries = OrderedDict()  # key -> pickled entry
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(source):
+        return hashlib.sha256(f"{VERSION_STAMP}\0{source}".encode("utf-8")).hexdigest()
+
+    def get(self, source):
+        """
+        Returns:
+            entry (tuple): (tokens, syntax_tree, pseudo_code, symbols, diagnostics), a new
+            copy on every hit, or None on a miss.
+        """
+        key = self.key(source)
+        data = self.entries.get(key)
+        if data is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return pickle.loads(data)
+        if self.directory:
+            data = self._read(key)
+            if data is not None:
+                entry = pickle.loads(data)
+                self._remember(key, data)
+                self.hits += 1
+                self.disk_hits += 1
+                return entry
+        self.misses += 1
+        return None
+
+    def put(self, source, tokens, syntax_tree, pseudo_code, symbols=None, diagnostics=()):
+        key = self.key(source)
+        entry = (tokens, syntax_tree, pseudo_code, symbols, list(diagnostics))
+        data = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+        if self.directory:
+            self._write(key, data)
+        self._remember(key, data)
+
+    def clear(self):
+        """Empties the in-memory cache (files in the cache directory are kept)."""
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "evictions": self.evictions,
+        }
+
+    def _remember(self, key, data):
+        if len(data) > self.max_bytes:
+            return  # would evict everything else and still not fit
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous)
+        self.entries[key] = data
+        self.size += len(data)
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".pickle")
+
+    def _read(self, key):
+        try:
+            with open(self._path(key), "rb") as cache_file:
+                return cache_file.read()
+        except FileNotFoundError:
+            return None
+
+    def _write(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # written to a temporary file first so readers never see half an entry:
+        descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(descriptor, "wb") as cache_file:
+                cache_file.write(data)
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
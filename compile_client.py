@@ -0,0 +1,148 @@
+"""
+Client for compile_server.py.
+
+    async with await CompileClient.connect(path="/tmp/compiler.sock") as client:
+        response = await client.compile("int x = 10;")
+        response["pseudo_code"], response["error"]
+
+Any number of requests can be waiting on one connection at once (eg from
+asyncio.gather()): each is sent straight away and its response is matched back to it
+by id. Also runnable from the command line, printing the pseudo code of each file:
+
+    python compile_client.py program.txt other.txt --socket /tmp/compiler.sock
+    python compile_client.py --port 8765 --stats
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import sys
+
+import compiler
+from compile_server import ProtocolError, encode_message, read_message
+
+
+class CompileClient:
+    """A connection to a compile server. Make one with connect()."""
+
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+        self._ids = itertools.count(1)
+        self._waiting = {}  # request id -> future for its response
+        self._receiver = asyncio.create_task(self._receive())
+
+    @classmethod
+    async def connect(cls, path=None, host="127.0.0.1", port=8765):
+        """Connects to the Unix socket at path, or to host and port if no path is given."""
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def request(self, message):
+        """
+        Sends message (given an id) and waits for its response.
+
+        Returns:
+            response (dict): The server's response.
+        Raises:
+            ConnectionError: if the connection closes before the response arrives.
+        """
+        identifier = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[identifier] = future
+        self._writer.write(encode_message({**message, "id": identifier}))
+        await self._writer.drain()
+        return await future
+
+    async def compile(self, source, timeout=None):
+        """
+        Args:
+            source (str): The program to compile.
+            timeout (float): Seconds the server has to compile it, if not its default.
+        Returns:
+            response (dict): {"id", "pseudo_code", "error"}, see compile_server.py.
+        """
+        message = {"source": source}
+        if timeout is not None:
+            message["timeout"] = timeout
+        return await self.request(message)
+
+    async def stats(self):
+        """Returns the server's counters and latency percentiles."""
+        return (await self.request({"stats": True}))["stats"]
+
+    async def close(self):
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except ConnectionError:
+            pass
+        await self._receiver
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _receive(self):
+        error = ConnectionError("ERROR - Connection to the compile server closed.")
+        try:
+            while True:
+                response = await read_message(self._reader)
+                if response is None:
+                    break
+                future = self._waiting.pop(response.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+                elif response.get("id") is None and response.get("error"):
+                    # the server couldn't read a message, so closes the connection:
+                    error = ConnectionError(response["error"]["message"])
+        except (ProtocolError, ConnectionError) as reason:
+            error = ConnectionError(str(reason))
+        for future in self._waiting.values():
+            if not future.done():
+                future.set_exception(error)
+        self._waiting.clear()
+
+
+async def _compile_files(options):
+    client = await CompileClient.connect(options.socket, options.host, options.port)
+    async with client:
+        if options.stats:
+            print(json.dumps(await client.stats(), indent=2))
+            return 0
+        sources = []
+        for path in options.paths:
+            with open(path, encoding=compiler.SOURCE_ENCODING) as source_file:
+                sources.append(source_file.read())
+        responses = await asyncio.gather(*(client.compile(source, options.timeout) for source in sources))
+    status = 0
+    for path, response in zip(options.paths, responses):
+        if response["error"] is None:
+            sys.stdout.write(response["pseudo_code"] + "\n")
+        else:
+            sys.stderr.write(f"{path}: {response['error']['message']}\n")
+            status = 1
+    return status
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Compile source files on a compile server.")
+    parser.add_argument("paths", nargs="*", help="source files to compile")
+    parser.add_argument("--socket", help="path of the server's Unix socket")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765, help="the server's TCP port, if --socket isn't given")
+    parser.add_argument("--timeout", type=float, default=None, help="seconds each file has to compile")
+    parser.add_argument("--stats", action="store_true", help="print the server's stats instead")
+    options = parser.parse_args(arguments)
+    if not options.paths and not options.stats:
+        parser.error("give some files to compile, or --stats")
+    return asyncio.run(_compile_files(options))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
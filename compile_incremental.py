@@ -0,0 +1,174 @@
+"""
+Incremental compilation of a source that is edited a little at a time, eg in an editor.
+
+    document = IncrementalCompiler(source)
+    result = document.edit(offset, deleted, inserted)  # a compiler.CompileResult
+
+Each edit is re-lexed with compiler.relex_tokens(), which only lexes around the edit.
+A program is a single top-level statement, so that statement is always the one
+affected: when the edit leaves the token codes as they were (eg a number, name or
+printed text was changed) its syntax tree is kept and only the nodes for the changed
+tokens are updated; any other edit re-parses it.
+
+When no lexeme actually changed (eg whitespace or a comment was edited) the whole
+last result is reused, with its diagnostics moved to where their tokens are now. When
+only numbers or printed text changed the semantic analyser's result is kept, as it
+only looks at variable names, and just the pseudo code is generated again. Changing
+a name runs the semantic analyser and the generator over the whole tree.
+"""
+import compiler
+
+
+_VALUE_CODES = {compiler.TOKEN_CODES[name] for name in compiler.VALUE_TOKENS}
+
+
+def value_nodes(syntax_tree):
+    """
+    Finds the node that holds the lexeme of each PRINT, NUMBER, LETTERS and VARIABLE_NAME token.
+
+    Returns:
+        nodes (dict): Token index -> PrintStatement, Number, Variable or IntDeclaration.
+    """
+    nodes = {}
+    for statement in compiler.walk_statements(syntax_tree):
+        kind = type(statement)
+        if kind is compiler.PrintStatement:
+            nodes[statement.token_index] = statement
+        elif kind is compiler.IntDeclaration:
+            nodes[statement.token_index + 1] = statement  # INT <variable_name>
+            nodes[statement.value.token_index] = statement.value
+        else:
+            if kind is compiler.IfStatement:
+                expressions = [condition for condition, _ in statement.branches]
+            elif kind is compiler.WhileLoop:
+                expressions = [statement.condition, statement.counter]
+            else:
+                expressions = [statement]  # arithmetic
+            for expression in expressions:
+                for node in compiler.walk_expression(expression):
+                    if type(node) is compiler.Number or type(node) is compiler.Variable:
+                        nodes[node.token_index] = node
+    return nodes
+
+
+def _relocated(diagnostics, tokens):
+    """Moves each diagnostic with a token_index to where that token now is in tokens.source."""
+    moved = []
+    for diagnostic in diagnostics:
+        if diagnostic.token_index is not None:
+            line, column = tokens.location(diagnostic.token_index)
+            diagnostic = diagnostic._replace(line=line, column=column)
+        moved.append(diagnostic)
+    return moved
+
+
+def _update_node(node, lexeme):
+    kind = type(node)
+    if kind is compiler.Number:
+        node.value = lexeme
+    elif kind is compiler.Variable:
+        node.name = lexeme
+    elif kind is compiler.PrintStatement:
+        node.text = compiler.print_text(lexeme)
+    else:
+        node.name = lexeme  # IntDeclaration
+
+
+class IncrementalCompiler:
+    """
+    Keeps a source with its tokens and syntax tree, and recompiles it after each edit.
+
+    Args:
+        source (str): The starting source.
+
+    Attributes:
+        source (str): The current source.
+        result (compiler.CompileResult): The compilation of the current source. Its syntax
+        tree is updated in place by later edits, so earlier results shouldn't be kept.
+        full_compilations, reparses, tree_updates, reuses (int): How each edit so far was
+        handled. reuses counts edits that didn't change any lexeme, so weren't compiled.
+    """
+
+    def __init__(self, source=""):
+        self.full_compilations = 0
+        self.reparses = 0
+        self.tree_updates = 0
+        self.reuses = 0
+        self._compile(source)
+
+    def _compile(self, source):
+        self.source = source
+        self.result = compiler.compile_source(source)
+        self._nodes = None
+        self.full_compilations += 1
+        return self.result
+
+    def edit(self, offset, deleted, inserted):
+        """
+        Applies an edit and recompiles.
+
+        Args:
+            offset (int): Where in source the edit starts.
+            deleted (int): Number of characters removed from offset.
+            inserted (str): Text inserted at offset.
+        Returns:
+            result (compiler.CompileResult): The compilation of the edited source.
+        """
+        previous = self.result
+        if not 0 <= offset <= offset + deleted <= len(self.source):
+            raise ValueError(f"Edit at {offset} (deleting {deleted}) is outside the source")
+        if previous.tokens is None:
+            # the last version didn't tokenize, so there's nothing to start from:
+            return self._compile(self.source[:offset] + inserted + self.source[offset + deleted :])
+        try:
+            tokens, first, removed, added = compiler.relex_tokens(previous.tokens, offset, deleted, inserted)
+        except ValueError:
+            # gets the tokenizer failure reported exactly as compile_source() reports it:
+            return self._compile(self.source[:offset] + inserted + self.source[offset + deleted :])
+        self.source = tokens.source
+        result = compiler.CompileResult(tokens)
+        if (
+            previous.syntax_tree is not None
+            and removed == added
+            and previous.tokens.types[first : first + removed] == tokens.types[first : first + added]
+        ):
+            if self._nodes is None:
+                self._nodes = value_nodes(previous.syntax_tree)
+            changed = set()
+            for index in range(first, first + added):
+                if tokens.types[index] in _VALUE_CODES:
+                    lexeme = tokens.lexeme(index)
+                    if lexeme != previous.tokens.lexeme(index):
+                        node = self._nodes[index]
+                        _update_node(node, lexeme)
+                        changed.add(type(node))
+            result.syntax_tree = previous.syntax_tree
+            if not changed:
+                # the same program, only its tokens have moved:
+                result.symbols = previous.symbols
+                result.pseudo_code = previous.pseudo_code
+                result.stages = dict(previous.stages)
+                result.diagnostics = _relocated(previous.diagnostics, tokens)
+                result.error = previous.error
+                self.reuses += 1
+                self.result = result
+                return result
+            if (
+                compiler.Variable not in changed
+                and compiler.IntDeclaration not in changed
+                and previous.stages["semantic"] == compiler.STAGE_PASSED
+            ):
+                # the names are the same, so the semantic analyser would find the same:
+                result.symbols = previous.symbols
+                result.stages["semantic"] = compiler.STAGE_PASSED
+                result.diagnostics = _relocated(
+                    [diagnostic for diagnostic in previous.diagnostics if diagnostic.stage == "semantic"], tokens
+                )
+            else:
+                result.symbols = compiler.SymbolTable.from_tree(previous.syntax_tree)
+            self.tree_updates += 1
+        else:
+            self._nodes = None
+            self.reparses += 1
+        self.result = compiler.compile_stages(result)
+        return self.result
@@ -0,0 +1,128 @@
+"""
+Profiling for compile_input(source, hooks=...) and compile_source(source, hooks=...).
+
+A Profiler records how long each stage of each compilation took, how many tokens it
+handled and, from parse_tokens(), the parser stack's high-water mark and how often
+each production rule was expanded. The results can be read as a stats dict, or saved
+as Chrome trace-event JSON to open in chrome://tracing or https://ui.perfetto.dev.
+
+    profiler = Profiler()
+    for source in sources:
+        compiler.compile_source(source, hooks=profiler)
+    print(profiler.stats())
+    profiler.write_chrome_trace("compile.trace.json")
+"""
+import json
+import os
+import time
+
+import compiler
+
+
+class Profiler(compiler.CompileHooks):
+    """
+    Hooks that record the timings of every stage of every compilation they're passed to.
+
+    Args:
+        trace (bool): Keep an event per stage for chrome_trace(), as well as the totals.
+        Turn off when profiling a very long run where only stats() is wanted.
+    """
+
+    def __init__(self, trace=True):
+        self.parse_profile = compiler.ParseProfile()
+        self.trace = trace
+        self.events = []
+        self.totals = {stage: {"count": 0, "failed": 0, "tokens": 0, "nanoseconds": 0} for stage in compiler.STAGES}
+        self.compilations = 0
+        self.tokens = 0
+        self.slowest = None  # (nanoseconds, tokens) of the slowest compilation
+        self._started = {}
+        self._compilation_start = None
+        self._origin = time.perf_counter_ns()
+
+    def stage_start(self, stage, result):
+        now = time.perf_counter_ns()
+        if stage == "tokenize":
+            self._compilation_start = now
+        self._started[stage] = now
+
+    def stage_end(self, stage, result):
+        now = time.perf_counter_ns()
+        started = self._started.pop(stage, None)
+        if started is None:
+            return  # compile_tokens() starts after tokenizing, so only the end is seen
+        total = self.totals[stage]
+        total["count"] += 1
+        total["nanoseconds"] += now - started
+        failed = result.stages[stage] == compiler.STAGE_FAILED
+        if failed:
+            total["failed"] += 1
+        token_count = len(result.tokens) if result.tokens is not None else 0
+        total["tokens"] += token_count
+        if stage == "tokenize":
+            self.compilations += 1
+            self.tokens += token_count
+        if self.trace:
+            self.events.append((stage, started, now, token_count, result.stages[stage]))
+        if (failed or stage == "generate") and self._compilation_start is not None:
+            elapsed = now - self._compilation_start
+            if self.slowest is None or elapsed > self.slowest[0]:
+                self.slowest = (elapsed, token_count)
+            self._compilation_start = None
+
+    def stats(self):
+        """
+        Returns:
+            stats (dict): Per stage counts, failures, total seconds and tokens/s, the
+            parser's counters (see compiler.ParseProfile) and the slowest compilation.
+        """
+        stages = {}
+        for stage, total in self.totals.items():
+            seconds = total["nanoseconds"] / 1e9
+            stages[stage] = {
+                "count": total["count"],
+                "failed": total["failed"],
+                "tokens": total["tokens"],
+                "seconds": seconds,
+                "tokens_per_second": total["tokens"] / seconds if seconds else None,
+            }
+        return {
+            "compilations": self.compilations,
+            "tokens": self.tokens,
+            "stages": stages,
+            "parser": self.parse_profile.as_dict(),
+            "slowest": None if self.slowest is None else {
+                "seconds": self.slowest[0] / 1e9,
+                "tokens": self.slowest[1],
+            },
+        }
+
+    def chrome_trace(self):
+        """
+        Returns:
+            trace (dict): Chrome trace-event format, one complete ("X") event per stage
+            run, with timestamps in microseconds from when the profiler was created.
+        """
+        process = os.getpid()
+        trace_events = [
+            {
+                "name": stage,
+                "cat": "compiler",
+                "ph": "X",
+                "ts": (started - self._origin) / 1000,
+                "dur": (ended - started) / 1000,
+                "pid": process,
+                "tid": 0,
+                "args": {"tokens": token_count, "status": status},
+            }
+            for stage, started, ended, token_count, status in self.events
+        ]
+        return {
+            "traceEvents": trace_events,
+            "displayTimeUnit": "ms",
+            "otherData": {"rule_hits": self.parse_profile.as_dict()["rule_hits"]},
+        }
+
+    def write_chrome_trace(self, path):
+        with open(path, "w") as trace_file:
+            json.dump(self.chrome_trace(), trace_file)
@@ -0,0 +1,384 @@
+"""
+Compact binary format for token streams and parse results, so a later stage can pick
+up where an earlier one finished instead of tokenizing and parsing the source again.
+
+    data = dump_tokens(compiler.tokenize_string(source))
+    tokens = load_tokens(data)
+
+    data = dump_parse_result(tokens, syntax_tree)
+    tokens, syntax_tree = load_parse_result(data)
+    result = compiler.compile_stages(compiler.CompileResult(tokens, syntax_tree))  # not parsed again
+
+Layout, all lengths and counts as unsigned LEB128 varints:
+
+    header      magic b"PSTB", format version (u16), flags (u8), grammar stamp (8 bytes)
+    source      length, then the source text (UTF-8), which lexemes are sliced out of
+    types       token count, then one byte per token code
+    offsets     length, then per token the gap since the last token ended and its length
+    tree        (if FLAG_TREE) string pool: length, then the length of each string, then
+                the strings back to back; then the array typecode ("B", "H" or "I") and
+                length of the tree, as flatten_tree() operations in a little-endian
+                array of the smallest ints that fit them
+    checksum    CRC-32 of everything before it (u32), so data that's been cut short or
+                corrupted is refused
+
+The grammar stamp changes with the token patterns, grammar and node classes, so data
+from a different compiler is refused rather than misread. Loading is zero-copy where it
+can be: the source of the loaded TokenBuffer is a memoryview of data (so data mustn't
+change while it's in use), and runs of small varints are read a whole run at a time
+rather than byte by byte. The token codes are copied into an array in one go, so the
+tokens can be edited (relex_tokens()) and pickled like any others. The tree is stored as fixed-size ints
+instead, as most of its token indexes are too big for one byte and an array of them
+loads in one go. A str source that isn't ASCII is decoded, as its offsets count
+characters rather than bytes.
+
+Also runnable from the command line, eg to tokenize and parse once and reuse the result:
+
+    python compile_serialize.py program.txt -o program.pstb [--tree]
+    python compile_serialize.py --load program.pstb
+"""
+import argparse
+from array import array
+import hashlib
+from itertools import accumulate
+import re
+import struct
+import sys
+import zlib
+
+import compile_cache
+import compiler
+
+
+FORMAT_MAGIC = b"PSTB"
+FORMAT_VERSION = 2
+FLAG_TEXT = 1  # the source was a str, so its offsets count characters
+FLAG_TREE = 2  # a syntax tree follows the tokens
+_HEADER = struct.Struct("<4sHB8s")
+_CHECKSUM = struct.Struct("<I")
+# every byte that is a token code, for checking the loaded codes in one go:
+_TOKEN_CODE_BYTES = bytes(compiler.TokenType)
+
+
+def _grammar_stamp():
+    nodes = repr([(name, compiler._NODE_FIELDS[kind]) for name, kind in compiler._NODE_CLASSES.items()])
+    return hashlib.sha256(f"{compile_cache.VERSION_STAMP}\0{nodes}".encode("utf-8")).digest()[:8]
+
+
+GRAMMAR_STAMP = _grammar_stamp()
+
+# varints of more than one byte, which are the only ones that need decoding one by one:
+_MULTI_BYTE_VARINT = re.compile(rb"[\x80-\xff]+[\x00-\x7f]")
+
+# kinds of flatten_tree() operation, kept in the low 3 bits of each tree varint. A
+# _TREE_LEAF is a whole node with just a token index and a string (eg a Number), given
+# by the two varints after it, so the commonest nodes are read in one step:
+_TREE_INT, _TREE_STRING, _TREE_NONE, _TREE_LIST, _TREE_TUPLE, _TREE_NODE, _TREE_LEAF = range(7)
+_NODE_NAMES = list(compiler._NODE_CLASSES)
+_NODE_NUMBERS = {name: number for number, name in enumerate(_NODE_NAMES)}
+_NODE_BUILDERS = [(kind, len(compiler._NODE_FIELDS[kind])) for kind in compiler._NODE_CLASSES.values()]
+_LEAF_NAMES = {"Number", "Variable", "PrintStatement"}
+
+
+def encode_varints(values):
+    """
+    Returns:
+        data (bytes): Each non-negative int in values as an unsigned LEB128 varint.
+    """
+    if not values or max(values) < 0x80:
+        return bytes(values)  # every varint is a single byte
+    data = bytearray()
+    for value in values:
+        while value >= 0x80:
+            data.append(value & 0x7F | 0x80)
+            value >>= 7
+        data.append(value)
+    return bytes(data)
+
+
+def decode_varints(data):
+    """
+    Returns:
+        values (list): The ints encoded in data (bytes-like) by encode_varints().
+    """
+    values = []
+    position = 0
+    for match in _MULTI_BYTE_VARINT.finditer(data):
+        values.extend(data[position : match.start()])  # single byte varints are their value
+        value = 0
+        for shift, byte in enumerate(match.group()):
+            value |= (byte & 0x7F) << (7 * shift)
+        values.append(value)
+        position = match.end()
+    values.extend(data[position:])
+    return values
+
+
+def _read_varint(data, position):
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+def _section(data):
+    return encode_varints([len(data)]) + data
+
+
+def _take(data, position, length):
+    if position + length > len(data):
+        raise IndexError(position + length)
+    return data[position : position + length], position + length
+
+
+def _read_section(data, position):
+    length, position = _read_varint(data, position)
+    return _take(data, position, length)
+
+
+def _dump(tokens, syntax_tree):
+    source = tokens.source
+    flags = 0
+    if isinstance(source, str):
+        flags |= FLAG_TEXT
+        source = source.encode(compiler.SOURCE_ENCODING)
+    elif not isinstance(source, bytes):
+        source = bytes(source)  # eg an mmap
+    gaps_and_lengths = []
+    end = 0
+    for start, token_end in zip(tokens.starts, tokens.ends):
+        gaps_and_lengths.append(start - end)
+        gaps_and_lengths.append(token_end - start)
+        end = token_end
+    parts = [
+        b"",  # header, once the flags are known
+        _section(source),
+        _section(bytes(tokens.types)),
+        _section(encode_varints(gaps_and_lengths)),
+    ]
+    if syntax_tree is not None:
+        flags |= FLAG_TREE
+        parts.extend(_dump_tree(syntax_tree))
+    parts[0] = _HEADER.pack(FORMAT_MAGIC, FORMAT_VERSION, flags, GRAMMAR_STAMP)
+    data = b"".join(parts)
+    return data + _CHECKSUM.pack(zlib.crc32(data))
+
+
+def _dump_tree(syntax_tree):
+    strings = {}
+    operations = []
+    for operation, argument in compiler.flatten_tree(syntax_tree):
+        if operation == "node":
+            if (
+                argument in _LEAF_NAMES
+                and operations[-1] & 7 == _TREE_STRING
+                and operations[-2] & 7 == _TREE_INT
+            ):
+                text = operations.pop() >> 3
+                token_index = operations.pop() >> 3
+                operations.extend((_NODE_NUMBERS[argument] << 3 | _TREE_LEAF, token_index, text))
+            else:
+                operations.append(_NODE_NUMBERS[argument] << 3 | _TREE_NODE)
+        elif operation == "list":
+            operations.append(argument << 3 | _TREE_LIST)
+        elif operation == "tuple":
+            operations.append(argument << 3 | _TREE_TUPLE)
+        elif argument is None:
+            operations.append(_TREE_NONE)
+        elif type(argument) is str:
+            operations.append(strings.setdefault(argument, len(strings)) << 3 | _TREE_STRING)
+        elif type(argument) is int and argument >= 0:
+            operations.append(argument << 3 | _TREE_INT)
+        else:
+            raise ValueError(f"ERROR - Can't serialize {argument!r} in a syntax tree.")
+    encoded = [string.encode("utf-8") for string in strings]
+    largest = max(operations)
+    typecode = "B" if largest < 1 << 8 else "H" if largest < 1 << 16 else "I"
+    operations = array(typecode, operations)
+    if sys.byteorder == "big":
+        operations.byteswap()
+    return [
+        _section(encode_varints([len(string) for string in encoded])),
+        b"".join(encoded),
+        typecode.encode("ascii"),
+        _section(operations.tobytes()),
+    ]
+
+
+def dump_tokens(tokens):
+    """
+    Args:
+        tokens (TokenBuffer): Tokens from any of the compiler's tokenizers.
+    Returns:
+        data (bytes): The tokens and their source, for load_tokens().
+    """
+    return _dump(tokens, None)
+
+
+def dump_parse_result(tokens, syntax_tree):
+    """
+    Args:
+        tokens (TokenBuffer): The tokens syntax_tree was parsed from.
+        syntax_tree (Program): The tree from compiler.parse_tokens().
+    Returns:
+        data (bytes): Both, for load_parse_result().
+    """
+    return _dump(tokens, syntax_tree)
+
+
+def _load(data, with_tree=True):
+    data = memoryview(data).cast("B")
+    if len(data) < _HEADER.size:
+        raise ValueError("ERROR - Not serialized tokens.")
+    magic, version, flags, stamp = _HEADER.unpack_from(data)
+    if magic != FORMAT_MAGIC:
+        raise ValueError("ERROR - Not serialized tokens.")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"ERROR - Format version {version} isn't supported (expected {FORMAT_VERSION}).")
+    if stamp != GRAMMAR_STAMP:
+        raise ValueError("ERROR - Serialized by a compiler with a different grammar.")
+    end = len(data) - _CHECKSUM.size
+    if end < _HEADER.size or zlib.crc32(data[:end]) != _CHECKSUM.unpack_from(data, end)[0]:
+        raise ValueError("ERROR - Serialized tokens are cut short or corrupt.")
+    data = data[:end]
+    # past the checksum, anything inconsistent was written that way, so is checked as well:
+    try:
+        source, position = _read_section(data, _HEADER.size)
+        types, position = _read_section(data, position)
+        offsets, position = _read_section(data, position)
+        offsets = array("I", accumulate(decode_varints(offsets)))
+        if flags & FLAG_TEXT and not source.tobytes().isascii():
+            tokens = compiler.TokenBuffer(str(source, compiler.SOURCE_ENCODING))
+        else:
+            tokens = compiler.TokenBuffer(source, encoding=compiler.SOURCE_ENCODING)
+        codes = types.tobytes()
+        tokens.types = array("B", codes)
+        tokens.starts = offsets[0::2]
+        tokens.ends = offsets[1::2]
+        if (
+            codes.translate(None, _TOKEN_CODE_BYTES)
+            or len(tokens.starts) != len(types)
+            or len(tokens.ends) != len(types)
+            or (len(types) and tokens.ends[-1] > len(tokens.source))
+        ):
+            raise ValueError("ERROR - Serialized tokens are corrupt.")
+        syntax_tree = _load_tree(data, position) if with_tree and flags & FLAG_TREE else None
+    except (IndexError, TypeError, StopIteration):
+        raise ValueError("ERROR - Serialized tokens are corrupt.")
+    return tokens, syntax_tree
+
+
+def _load_tree(data, position):
+    lengths, position = _read_section(data, position)
+    strings = []
+    for length in decode_varints(lengths):
+        string, position = _take(data, position, length)
+        strings.append(str(string, "utf-8"))
+    typecode, position = _take(data, position, 1)
+    section, position = _read_section(data, position)
+    if typecode.tobytes() not in (b"B", b"H", b"I"):
+        raise ValueError("ERROR - Serialized syntax tree is corrupt.")
+    operations = array(typecode.tobytes().decode("ascii"))
+    operations.frombytes(section)
+    if sys.byteorder == "big":
+        operations.byteswap()
+    # the same as compiler.unflatten_tree(), without building the flat list first:
+    values = []
+    append = values.append
+    operations = iter(operations)
+    for value in operations:
+        kind = value & 7
+        argument = value >> 3
+        if kind == _TREE_LEAF:
+            token_index = next(operations)
+            append(_NODE_BUILDERS[argument][0](strings[next(operations)], token_index))
+        elif kind == _TREE_INT:
+            append(argument)
+        elif kind == _TREE_STRING:
+            append(strings[argument])
+        elif kind == _TREE_NODE:
+            node_class, count = _NODE_BUILDERS[argument]
+            fields = values[-count:]
+            del values[-count:]
+            if type(fields[0]) is not int:
+                raise ValueError("ERROR - Serialized syntax tree is corrupt.")
+            # constructors take the fields after token_index, then token_index:
+            append(node_class(*fields[1:], fields[0]))
+        elif kind == _TREE_NONE:
+            append(None)
+        else:
+            item = values[len(values) - argument :]
+            del values[len(values) - argument :]
+            append(item if kind == _TREE_LIST else tuple(item))
+    if len(values) != 1 or type(values[0]) is not compiler.Program:
+        raise ValueError("ERROR - Serialized syntax tree is corrupt.")
+    return values[0]
+
+
+def load_tokens(data):
+    """
+    Reads tokens written by dump_tokens() (or dump_parse_result()).
+
+    Args:
+        data (bytes-like): The serialized tokens, eg the bytes of a file or an mmap.
+    Returns:
+        tokens (TokenBuffer): The tokens, which compile_stages() and parse_tokens() can use
+        as they are. Their source is a view of data.
+    Raises:
+        ValueError: if data isn't serialized tokens, is from another format or grammar,
+        or has been cut short or corrupted.
+    """
+    return _load(data, with_tree=False)[0]
+
+
+def load_parse_result(data):
+    """
+    Reads tokens and a syntax tree written by dump_parse_result().
+
+    Returns:
+        (tokens, syntax_tree): As passed to dump_parse_result().
+    Raises:
+        ValueError: if data isn't a serialized parse result, is from another format or grammar,
+        or has been cut short or corrupted.
+    """
+    tokens, syntax_tree = _load(data)
+    if syntax_tree is None:
+        raise ValueError("ERROR - Serialized tokens don't include a syntax tree.")
+    return tokens, syntax_tree
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Save the tokens (and syntax tree) of a source file.")
+    parser.add_argument("path", nargs="?", help="source file to tokenize")
+    parser.add_argument("-o", "--output", help="file to write the serialized tokens to")
+    parser.add_argument("--tree", action="store_true", help="parse the tokens and save the syntax tree too")
+    parser.add_argument("--load", help="compile a file written by --output instead")
+    options = parser.parse_args(arguments)
+    if bool(options.path) == bool(options.load):
+        parser.error("give either a source file or --load")
+
+    if options.load:
+        with open(options.load, "rb") as serialized_file:
+            tokens, syntax_tree = _load(serialized_file.read())
+        result = compiler.compile_stages(compiler.CompileResult(tokens, syntax_tree))
+    else:
+        with open(options.path, encoding=compiler.SOURCE_ENCODING) as source_file:
+            result = compiler.compile_source(source_file.read())
+        if result.tokens is not None and options.output:
+            with open(options.output, "wb") as serialized_file:
+                serialized_file.write(_dump(result.tokens, result.syntax_tree if options.tree else None))
+    for diagnostic in result.diagnostics:
+        sys.stderr.write(diagnostic.describe(options.load or options.path) + "\n")
+    if not result.ok:
+        return 1
+    if options.load:
+        sys.stdout.write(result.pseudo_code + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,355 @@
+"""
+Compilation as a local service, so callers don't have to start a Python process (and
+import the compiler) for every program they compile.
+
+    python compile_server.py --socket /tmp/compiler.sock [-j 4]
+    python compile_server.py --port 8765
+
+Messages both ways are JSON objects, each sent as a 4-byte big-endian length followed
+by that many bytes of UTF-8. A request is
+
+    {"id": 1, "source": "if (a > b) { printf('a'); };", "timeout": 2.0}
+
+and its response, which can come back in any order (match them up by id), is
+
+    {"id": 1, "pseudo_code": "...", "error": null}
+
+where error is None or {"type", "message", "cause"} as in compile_batch.py. timeout
+(seconds, from when the request is read) is optional: it defaults to the server's, and
+can't be longer than it. A request that runs out of time gets a TimeoutError. {"id": 2, "stats": true} asks for
+the server's counters and latency percentiles instead. See compile_client.py for a
+client and benchmarks/load_test.py for a load test.
+
+Requests are queued and compiled by a pool of worker processes, so the event loop
+never waits on the compiler. Each worker takes everything waiting in the queue (up to
+the batch size) at once, so the busier the server the bigger the batches. The queue is
+bounded: while it's full the server stops reading from connections, which pushes back
+on clients through their sockets.
+"""
+import argparse
+import asyncio
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+import signal
+import struct
+import sys
+import time
+
+import compile_batch
+
+
+_FRAME = struct.Struct(">I")
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+
+
+class ProtocolError(Exception):
+    """A message that doesn't follow the protocol. The connection is closed after one."""
+
+
+def encode_message(message):
+    """
+    Returns:
+        data (bytes): message as JSON, after its length.
+    """
+    payload = json.dumps(message, separators=(",", ":")).encode("utf-8")
+    return _FRAME.pack(len(payload)) + payload
+
+
+async def read_message(reader, max_bytes=MAX_MESSAGE_BYTES):
+    """
+    Reads one message from an asyncio.StreamReader.
+
+    Returns:
+        message (dict): The decoded message, or None if the stream ended between messages.
+    Raises:
+        ProtocolError: if the stream ends part way through a message, or it's too long or not JSON.
+    """
+    try:
+        header = await reader.readexactly(_FRAME.size)
+    except asyncio.IncompleteReadError as error:
+        if not error.partial:
+            return None
+        raise ProtocolError("ERROR - Connection closed part way through a message.")
+    (length,) = _FRAME.unpack(header)
+    if length > max_bytes:
+        raise ProtocolError(f"ERROR - Message of {length} bytes is over the limit of {max_bytes}.")
+    try:
+        return json.loads(await reader.readexactly(length))
+    except asyncio.IncompleteReadError:
+        raise ProtocolError("ERROR - Connection closed part way through a message.")
+    except ValueError as error:
+        raise ProtocolError(f"ERROR - Message isn't JSON: {error}")
+
+
+def latency_percentiles(samples, points=(50, 90, 99)):
+    """
+    Args:
+        samples (iterable): Latencies in seconds.
+        points (tuple): Percentiles to work out (nearest rank).
+    Returns:
+        percentiles (dict): eg {"p50": ..., "p99": ..., "max": ...} in milliseconds,
+        or all None if there are no samples.
+    """
+    ordered = sorted(samples)
+    percentiles = {}
+    for point in points:
+        if ordered:
+            rank = max(0, -(-point * len(ordered) // 100) - 1)
+            percentiles[f"p{point}"] = ordered[rank] * 1000
+        else:
+            percentiles[f"p{point}"] = None
+    percentiles["max"] = ordered[-1] * 1000 if ordered else None
+    return percentiles
+
+
+def _error(error_type, message):
+    return {"type": error_type, "message": message, "cause": None}
+
+
+def _warm_up():
+    # run in each worker when the pool starts, so the first requests don't pay for
+    # starting processes and importing the compiler:
+    return os.getpid()
+
+
+class _Request:
+    __slots__ = ("source", "received", "future")
+
+    def __init__(self, source, received, future):
+        self.source = source
+        self.received = received
+        self.future = future
+
+
+class CompileServer:
+    """
+    Compiles requests from any number of connections on a pool of worker processes.
+
+    Args:
+        workers (int): Number of worker processes, defaults to the number of CPUs.
+        batch_size (int): Most requests a worker is given at once.
+        max_pending (int): Requests that can wait in the queue before the server stops
+        reading more.
+        timeout (float): Seconds a request has, from being read to being answered,
+        if it doesn't give its own, and the most it can give.
+        latency_samples (int): Number of the most recent latencies the percentiles
+        are worked out from.
+    """
+
+    def __init__(self, workers=None, batch_size=64, max_pending=1024, timeout=10.0, latency_samples=10000):
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.latencies = deque(maxlen=latency_samples)
+        self.counters = dict.fromkeys(
+            ["connections", "requests", "compiled", "failed", "timed_out", "rejected", "batches"], 0
+        )
+        self.started = time.monotonic()
+        self._queue = None
+        self._executor = None
+        self._dispatchers = []
+        self._server = None
+        self._writers = set()  # of open connections
+
+    async def start(self, path=None, host="127.0.0.1", port=0):
+        """
+        Starts the workers and listens on a Unix socket at path, or on host and port
+        if no path is given.
+
+        Returns:
+            server (asyncio.Server): The listening server, eg for its sockets.
+        """
+        loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(self.max_pending)
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        await asyncio.gather(*(
+            loop.run_in_executor(self._executor, _warm_up) for _ in range(self.workers)
+        ))
+        self._dispatchers = [asyncio.create_task(self._dispatch()) for _ in range(self.workers)]
+        if path is not None:
+            self._server = await asyncio.start_unix_server(self._handle_connection, path)
+        else:
+            self._server = await asyncio.start_server(self._handle_connection, host, port)
+        return self._server
+
+    async def close(self):
+        """Stops listening and closes connections, then stops the workers once they've finished their batches."""
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+        for dispatcher in self._dispatchers:
+            dispatcher.cancel()
+        await asyncio.gather(*self._dispatchers, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self):
+        """
+        Returns:
+            stats (dict): The counters, how many requests are queued, and latency
+            percentiles in milliseconds over the most recent requests.
+        """
+        return {
+            **self.counters,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "workers": self.workers,
+            "uptime_seconds": time.monotonic() - self.started,
+            "latency_ms": latency_percentiles(self.latencies),
+        }
+
+    async def _dispatch(self):
+        # one of these per worker: takes whatever is waiting and compiles it as a batch
+        loop = asyncio.get_running_loop()
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            # requests that ran out of time while queued have already been answered:
+            batch = [request for request in batch if not request.future.done()]
+            if not batch:
+                continue
+            self.counters["batches"] += 1
+            items = [(str(index), request.source) for index, request in enumerate(batch)]
+            try:
+                results = await loop.run_in_executor(
+                    self._executor, compile_batch.compile_chunk, 0, items
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                # eg a worker process died - the batch fails but the server carries on:
+                failure = compile_batch.BatchResult(0, "", None, compile_batch.error_details(error))
+                results = [failure] * len(batch)
+            for request, result in zip(batch, results):
+                if not request.future.done():
+                    request.future.set_result(result)
+
+    async def _handle_connection(self, reader, writer):
+        self.counters["connections"] += 1
+        self._writers.add(writer)
+        loop = asyncio.get_running_loop()
+        write_lock = asyncio.Lock()
+        responses = set()
+        try:
+            while True:
+                try:
+                    message = await read_message(reader)
+                except ProtocolError as error:
+                    async with write_lock:
+                        writer.write(encode_message({"id": None, "error": _error("ProtocolError", str(error))}))
+                        await writer.drain()
+                    break
+                if message is None:
+                    break
+                received = time.monotonic()
+                self.counters["requests"] += 1
+                if type(message) is not dict or not (
+                    message.get("stats") is True or type(message.get("source")) is str
+                ) or type(message.get("timeout")) not in (type(None), int, float):
+                    self.counters["rejected"] += 1
+                    response = self._respond(message, None, received, write_lock, writer, _error(
+                        "ValueError",
+                        "ERROR - A request needs a \"source\" string (and a number of seconds as \"timeout\"), or \"stats\": true.",
+                    ))
+                elif message.get("stats") is True:
+                    response = self._respond(message, None, received, write_lock, writer, None)
+                else:
+                    request = _Request(message["source"], received, loop.create_future())
+                    # waits while the queue is full, so nothing more is read from this connection:
+                    await self._queue.put(request)
+                    response = self._respond(message, request, received, write_lock, writer, None)
+                task = asyncio.create_task(response)
+                responses.add(task)
+                task.add_done_callback(responses.discard)
+        except ConnectionError:
+            pass
+        finally:
+            if responses:
+                await asyncio.gather(*responses, return_exceptions=True)
+            self._writers.discard(writer)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _respond(self, message, request, received, write_lock, writer, error):
+        identifier = message.get("id") if type(message) is dict else None
+        if error is not None:
+            response = {"id": identifier, "pseudo_code": None, "error": error}
+        elif request is None:
+            response = {"id": identifier, "stats": self.stats()}
+        else:
+            timeout = message.get("timeout")
+            # a missing or null timeout is the server's, and none can be longer:
+            if timeout is None or (self.timeout is not None and timeout > self.timeout):
+                timeout = self.timeout
+            remaining = None if timeout is None else timeout - (time.monotonic() - received)
+            try:
+                result = await asyncio.wait_for(asyncio.shield(request.future), remaining)
+            except asyncio.TimeoutError:
+                request.future.cancel()  # so it's skipped if it's still queued
+                self.counters["timed_out"] += 1
+                result = compile_batch.BatchResult(
+                    0, "", None, _error("TimeoutError", f"ERROR - Compilation took longer than {timeout} seconds.")
+                )
+            else:
+                self.counters["compiled" if result.error is None else "failed"] += 1
+            response = {"id": identifier, "pseudo_code": result.pseudo_code, "error": result.error}
+            self.latencies.append(time.monotonic() - received)
+        async with write_lock:
+            writer.write(encode_message(response))
+            await writer.drain()
+
+
+async def _serve(options):
+    server = CompileServer(
+        workers=options.workers,
+        batch_size=options.batch_size,
+        max_pending=options.max_pending,
+        timeout=options.timeout,
+    )
+    if options.socket and os.path.exists(options.socket):
+        os.unlink(options.socket)  # left behind by a server that didn't shut down cleanly
+    listening = await server.start(options.socket, options.host, options.port)
+    addresses = ", ".join(str(sock.getsockname()) for sock in listening.sockets)
+    sys.stderr.write(f"Compile server listening on {addresses} with {server.workers} workers\n")
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signal_number, stopping.set)
+    try:
+        await stopping.wait()
+    finally:
+        await server.close()
+        if options.socket and os.path.exists(options.socket):
+            os.unlink(options.socket)
+        sys.stderr.write(json.dumps(server.stats()) + "\n")
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Serve compilations over a Unix socket or localhost TCP.")
+    parser.add_argument("--socket", help="path of a Unix socket to listen on")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765, help="TCP port, if --socket isn't given")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("--batch-size", type=int, default=64,
+                        help="most requests given to a worker at once")
+    parser.add_argument("--max-pending", type=int, default=1024,
+                        help="requests queued before the server stops reading more")
+    parser.add_argument("--timeout", type=float, default=10.0,
+                        help="default seconds a request has before it gets a TimeoutError")
+    options = parser.parse_args(arguments)
+    asyncio.run(_serve(options))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
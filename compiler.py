@@ -1,44 +1,102 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from enum import IntEnum
+from functools import cache
+from itertools import accumulate
+import io
+import mmap
+import operator
+import os
 import re
+import sys
 
 
+# Bump when a change to the compiler alters its output (see compile_cache.py):
+COMPILER_VERSION = 3
+
 # TOKEN TYPES
-# keywords:
-TOKEN_IF = "IF"
-TOKEN_ELSE = "ELSE"
-TOKEN_ELIF = "ELIF"
-TOKEN_WHILE = "WHILE"
-TOKEN_PRINT = "PRINT"
-TOKEN_INT_INIT = "INT"
-# data types:
-TOKEN_NUMBER = "NUMBER"
-TOKEN_LETTERS = "LETTERS"
-TOKEN_VARIABLE_NAME = "VARIABLE_NAME"
-# comments:
-TOKEN_COMMENT = "COMMENT"
-TOKEN_MULTI_COMMENT = "MULTI_COMMENT"
-# handling invalid inputs:
-TOKEN_INVALID = "INVALID"
-TOKEN_QUOTATION = "QUOTE"
-# arhithmetic operators:
-TOKEN_ADDITION = "ADD"
-TOKEN_SUBTRACT = "SUBTRACT"
-TOKEN_DIVIDE = "DIVIDE"
-TOKEN_MULTIPLY = "MULTIPLY"
-# punctuation:
-TOKEN_LEFT_PARENT = "LEFT_PARENTHESIS"
-TOKEN_RIGHT_PARENT = "RIGHT_PARENTHESIS"
-TOKEN_LEFT_BRACKET = "LEFT_BRACKET"
-TOKEN_RIGHT_BRACKET = "RIGHT_BRACKET"
-TOKEN_SEMI_COLON = "SEMI_COLON"
-TOKEN_MORE_THAN = "MORE_THAN"
-TOKEN_LESS_THAN = "LESS_THAN"
-TOKEN_MORE_THAN_OR_EQUALS = "MORE_THAN_OR_EQUALS"
-TOKEN_LESS_THAN_OR_EQUALS = "LESS_THAN_OR_EQUALS"
-TOKEN_NOT_EQUALS = "NOT_EQUALS"
-TOKEN_EQUALS = "EQUALS"
-TOKEN_ASSIGN = "ASSIGN"
-TOKEN_INCREMENT = "INCREMENT"
-TOKEN_COMMA = "COMMA"
+# The code of each token type, as stored (a byte per token) in a TokenBuffer. Being an
+# IntEnum, the codes read back from a buffer compare equal to these, so the stages
+# compare small ints and the names are only needed for messages and (token, lexeme) pairs.
+
+
+class TokenType(IntEnum):
+    # keywords:
+    IF = 1
+    ELSE = 2
+    ELIF = 3
+    WHILE = 4
+    PRINT = 5
+    INT = 6
+    # data types:
+    NUMBER = 7
+    LETTERS = 8
+    VARIABLE_NAME = 9
+    # comments:
+    COMMENT = 10
+    MULTI_COMMENT = 11
+    # handling invalid inputs:
+    INVALID = 12
+    QUOTE = 13
+    # arhithmetic operators:
+    ADD = 14
+    SUBTRACT = 15
+    DIVIDE = 16
+    MULTIPLY = 17
+    # punctuation:
+    LEFT_PARENTHESIS = 18
+    RIGHT_PARENTHESIS = 19
+    LEFT_BRACKET = 20
+    RIGHT_BRACKET = 21
+    SEMI_COLON = 22
+    MORE_THAN = 23
+    LESS_THAN = 24
+    MORE_THAN_OR_EQUALS = 25
+    LESS_THAN_OR_EQUALS = 26
+    NOT_EQUALS = 27
+    EQUALS = 28
+    ASSIGN = 29
+    INCREMENT = 30
+    COMMA = 31
+
+
+# the names of the token types, as given in each (token, lexeme) pair:
+TOKEN_IF = TokenType.IF.name
+TOKEN_ELSE = TokenType.ELSE.name
+TOKEN_ELIF = TokenType.ELIF.name
+TOKEN_WHILE = TokenType.WHILE.name
+TOKEN_PRINT = TokenType.PRINT.name
+TOKEN_INT_INIT = TokenType.INT.name
+TOKEN_NUMBER = TokenType.NUMBER.name
+TOKEN_LETTERS = TokenType.LETTERS.name
+TOKEN_VARIABLE_NAME = TokenType.VARIABLE_NAME.name
+TOKEN_COMMENT = TokenType.COMMENT.name
+TOKEN_MULTI_COMMENT = TokenType.MULTI_COMMENT.name
+TOKEN_INVALID = TokenType.INVALID.name
+TOKEN_QUOTATION = TokenType.QUOTE.name
+TOKEN_ADDITION = TokenType.ADD.name
+TOKEN_SUBTRACT = TokenType.SUBTRACT.name
+TOKEN_DIVIDE = TokenType.DIVIDE.name
+TOKEN_MULTIPLY = TokenType.MULTIPLY.name
+TOKEN_LEFT_PARENT = TokenType.LEFT_PARENTHESIS.name
+TOKEN_RIGHT_PARENT = TokenType.RIGHT_PARENTHESIS.name
+TOKEN_LEFT_BRACKET = TokenType.LEFT_BRACKET.name
+TOKEN_RIGHT_BRACKET = TokenType.RIGHT_BRACKET.name
+TOKEN_SEMI_COLON = TokenType.SEMI_COLON.name
+TOKEN_MORE_THAN = TokenType.MORE_THAN.name
+TOKEN_LESS_THAN = TokenType.LESS_THAN.name
+TOKEN_MORE_THAN_OR_EQUALS = TokenType.MORE_THAN_OR_EQUALS.name
+TOKEN_LESS_THAN_OR_EQUALS = TokenType.LESS_THAN_OR_EQUALS.name
+TOKEN_NOT_EQUALS = TokenType.NOT_EQUALS.name
+TOKEN_EQUALS = TokenType.EQUALS.name
+TOKEN_ASSIGN = TokenType.ASSIGN.name
+TOKEN_INCREMENT = TokenType.INCREMENT.name
+TOKEN_COMMA = TokenType.COMMA.name
+
+# TOKEN_NAMES[code] is the token type, TOKEN_CODES[token type] its code:
+TOKEN_NAMES = (None,) + tuple(token_type.name for token_type in TokenType)
+TOKEN_CODES = {token_type.name: token_type for token_type in TokenType}
 
 # token patterns
 
@@ -86,477 +144,2366 @@ TOKEN_PATTERNS = [
     (r"\S+", TOKEN_INVALID),
 ]
 
+# All patterns compiled once into a single alternation. Each pattern becomes its own
+# capture group (none of them contain groups of their own), so match.lastindex - 1
+# is the index of the winning entry in TOKEN_PATTERNS. Alternatives are tried
+# left to right, which gives the same priority order as looping over the table,
+# and the \s+ / \S+ entries mean every position matches something.
+# Compiling it takes longer than compiling a small program, so it's only done on first
+# use (see _token_regex()) - TOKEN_REGEX is still there to read, by __getattr__().
+_TOKEN_PATTERN = "|".join(f"({pattern})" for pattern, _ in TOKEN_PATTERNS)
+# token code for each group of TOKEN_REGEX (0 for whitespace):
+_GROUP_CODES = (0,) + tuple(TOKEN_CODES.get(token_type, 0) for _, token_type in TOKEN_PATTERNS)
+
+
+@cache
+def _token_regex():
+    return re.compile(_TOKEN_PATTERN)
+
+
+# Memory-mapped input (compile_file): the same patterns over bytes, as TOKEN_REGEX_BYTES.
+# In bytes mode \s leaves out the ASCII separators \x1c-\x1f that it matches in a str,
+# so they're added back, and any ASCII source lexes the same either way. Non-ASCII
+# characters still differ: \s, \d and \S only match ASCII characters in bytes mode.
+_BYTES_WHITESPACE = r"\s\x1c-\x1f"
+
+
+def _bytes_pattern(pattern):
+    # a str pattern, turned into the same pattern for bytes:
+    pattern = pattern.replace(r"\s", f"[{_BYTES_WHITESPACE}]").replace(r"\S", f"[^{_BYTES_WHITESPACE}]")
+    return pattern.encode("ascii")
 
-def tokenize_string(input_string):
+
+@cache
+def _token_regex_bytes():
+    return re.compile(_bytes_pattern(_TOKEN_PATTERN))
+
+
+SOURCE_ENCODING = "utf-8"
+# tokens whose lexeme varies and has to be sliced (or decoded) from the source:
+VALUE_TOKENS = {TOKEN_PRINT, TOKEN_VARIABLE_NAME, TOKEN_NUMBER, TOKEN_LETTERS}
+# every other token is spelt one way only, eg "\+\+" -> "++", indexed by token code.
+# Each spelling is a single interned string that every token of its type shares:
+FIXED_LEXEMES = [None] * len(TOKEN_NAMES)
+for pattern, token_type in TOKEN_PATTERNS:
+    if token_type and token_type not in VALUE_TOKENS and token_type not in [
+        TOKEN_COMMENT,
+        TOKEN_MULTI_COMMENT,
+        TOKEN_INVALID,
+    ]:
+        # none of these patterns has an escaped backslash, so unescaping is dropping them:
+        FIXED_LEXEMES[TOKEN_CODES[token_type]] = sys.intern(pattern.replace("\\", ""))
+FIXED_LEXEMES = tuple(FIXED_LEXEMES)
+# names and numbers, whose lexemes go through the buffer's pool (see TokenBuffer.lexeme()):
+_POOLED_CODES = frozenset([TokenType.NUMBER, TokenType.LETTERS, TokenType.VARIABLE_NAME])
+
+# Streaming input:
+STREAM_CHUNK_SIZE = 64 * 1024
+# tokens that need a closing sequence (opener -> closer), and the TOKEN_REGEX groups
+# that match them whole:
+_UNTERMINATED_OPENERS = {"/*": "*/", "printf('": "')"}
+_UNTERMINATED_GROUPS = {
+    index + 1
+    for index, (_, token_type) in enumerate(TOKEN_PATTERNS)
+    if token_type in [TOKEN_MULTI_COMMENT, TOKEN_PRINT]
+}
+
+# Unclosed openers: a "printf('" or "/*" with no "')" or "*/" after it on its line is
+# lexed as "printf" + "(" + ... or "/" + "*" + ..., and finding that out reads the rest
+# of the line. So a line of them would take quadratic time, if every one were looked
+# for separately. Instead, once one hasn't matched, the rest of its line is lexed
+# without that pattern (none of the later ones there can match either).
+# (token type and length of what's matched instead, the opener, the token type it would have been):
+_UNCLOSED_OPENERS = [
+    (TOKEN_LETTERS, len("printf"), "printf('", TOKEN_PRINT),
+    (TOKEN_DIVIDE, len("/"), "/*", TOKEN_MULTI_COMMENT),
+]
+_PATTERN_GROUPS = {token_type: index + 1 for index, (_, token_type) in enumerate(TOKEN_PATTERNS)}
+
+
+@cache
+def _unclosed_retries(blocked, as_bytes):
     """
-    Creates a tuple of tokens and lexemes based on an input string.
+    Helper function for _scan_tokens(), for a regex with the groups in blocked never matching.
+
+    Returns:
+      retries (tuple): Indexed by group, None or (opener, length, blocked, newline) for the
+      groups that can match what's left of an opener. If that group matched length
+      characters where the source has opener, the rest of the line can be lexed with
+      blocked groups, up to a newline match.
+    """
+    retries = [None] * (len(TOKEN_PATTERNS) + 1)
+    for token_type, length, opener, closed_type in _UNCLOSED_OPENERS:
+        if _PATTERN_GROUPS[closed_type] not in blocked:
+            retries[_PATTERN_GROUPS[token_type]] = (
+                opener.encode("ascii") if as_bytes else opener,
+                length,
+                blocked | {_PATTERN_GROUPS[closed_type]},
+                re.compile(b"\n" if as_bytes else "\n"),  # a regex, as memoryviews have no find()
+            )
+    return tuple(retries)
+
+
+@cache
+def _token_regex_without(blocked, as_bytes):
+    # TOKEN_REGEX (or TOKEN_REGEX_BYTES) with the groups in blocked never matching,
+    # which keeps the group numbers the same:
+    pattern = "|".join(
+        "((?!))" if index + 1 in blocked else f"({pattern})" for index, (pattern, _) in enumerate(TOKEN_PATTERNS)
+    )
+    return re.compile(_bytes_pattern(pattern) if as_bytes else pattern)
+
+
+_INT_INIT_CODE = TokenType.INT
+_VARIABLE_NAME_CODE = TokenType.VARIABLE_NAME
+_COMMENT_CODE = TokenType.COMMENT
+_MULTI_COMMENT_CODE = TokenType.MULTI_COMMENT
+_INVALID_CODE = TokenType.INVALID
+
+
+def tokenize_string(input_string, errors=None):
+    """
+    Creates a buffer of tokens and lexemes based on an input string.
 
     Args:
       input_string (str): A string variable that represents a user's
       source code input to be compiled.
+      errors (list): If given, invalid tokens are skipped and their (start, end)
+      offsets appended to it, rather than raising at the first one.
 
     Returns:
-      tokens (tuple): Contains tokens and lexemes.
+      tokens (TokenBuffer): Contains token codes and lexeme offsets.
 
     Raises:
       ValueError: if the input string contains invalid tokens.
     """
+    tokens = TokenBuffer(input_string)
+    _scan_tokens(_token_regex(), input_string, 0, len(input_string), 0, tokens, errors=errors)
+    return tokens
+
+
+def tokenize_stream(source, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Lazily yields (token, lexeme) pairs from a file object or an iterable of strings,
+    the same as tokenize_string() gives for the joined input.
+
+    Args:
+      source (file or iterable): A text file object (anything with a read() method)
+      or an iterable of string chunks.
+      chunk_size (int): Number of characters read from a file object at a time.
+
+    Yields:
+      token (tuple): Token and lexeme pairs, in source order.
+
+    Raises:
+      ValueError: if the input contains invalid tokens.
+    """
+    for _, tokens, _ in _scan_stream(source, chunk_size):
+        yield from tokens
+
+
+def tokenize_stream_buffer(source, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Tokenizes a file object or an iterable of strings as tokenize_stream() does, into
+    a TokenBuffer.
+
+    The buffer's source is the input put back together from the chunks as they're
+    lexed, so the stream is only read once and the tokens, lexemes and locations are
+    the same as tokenize_string() gives for the whole input.
+
+    Returns:
+      tokens (TokenBuffer): Contains token codes and lexeme offsets.
+
+    Raises:
+      ValueError: if the input contains invalid tokens.
+    """
+    tokens = TokenBuffer(None)
+    lexed = []
+    length = 0  # of the input lexed so far, where the next buffer starts
+    for buffer, scanned, position in _scan_stream(source, chunk_size):
+        tokens.types.extend(scanned.types)
+        tokens.starts.extend(_shift_offsets(scanned.starts, length))
+        tokens.ends.extend(_shift_offsets(scanned.ends, length))
+        lexed.append(buffer[:position])
+        length += position
+    tokens.source = "".join(lexed)
+    return tokens
+
+
+def _scan_stream(source, chunk_size):
+    """
+    The loop behind tokenize_stream(). Yields (buffer, tokens, position) each time it has
+    lexed the buffer: the tokens found in buffer, which was lexed up to position. The
+    next buffer carries on from there.
+    """
+    # only the current chunk plus any unfinished token is held, so a large source is
+    # never read into a single string.
+    if hasattr(source, "read"):
+        chunks = iter(lambda: source.read(chunk_size), "")
+    else:
+        chunks = (chunk for chunk in source if chunk)
+    buffer = ""
     position = 0
-    tokens = []
-    previous_token = None
-    # loops through input string chars:
-    while position < len(input_string):
-        match_output = None
-        match_len = 0
-        for pattern, token_type in TOKEN_PATTERNS:
-            regex = re.compile(pattern)
-            match_output = regex.match(input_string, position)
-            if match_output and token_type:  # skips whitespaces
-                match_len = match_output.end() - match_output.start()
-                if token_type in [TOKEN_INVALID]:
-                    # raises error if any tokens are invalid
-                    invalid_token = input_string[position : position + match_len]
-                    raise ValueError(
-                        f"ERROR - The input contains the following invalid tokens: '{invalid_token}'"
-                    )
-                token_value = match_output.group()
-                # assigning strings as variable name if preceeded by an variable initialisation (INT token):
-                if previous_token == TOKEN_INT_INIT:
-                    token_type = TOKEN_VARIABLE_NAME
-                # only captures tokens that are NOT comments:
-                if token_type not in [TOKEN_COMMENT, TOKEN_MULTI_COMMENT]:
-                    tokens.append((token_type, token_value))
-                # captures previous increment for the purpose of checking for variable names
-                previous_token = token_type
+    previous_code = 0
+    more_input = True
+    regex = _token_regex()
+    while True:
+        # no token but whitespace continues past a newline (none of the patterns use
+        # re.DOTALL), so everything up to the last one is lexed straight away. Past it
+        # a match is only taken once more input can't change it, see _match_is_final().
+        safe_end = buffer.rfind("\n") + 1 if more_input else len(buffer)
+        tokens = TokenBuffer(buffer)
+        position, previous_code = _scan_tokens(
+            regex, buffer, position, safe_end, previous_code, tokens
+        )
+        yield buffer, tokens, position
+        if not more_input:
+            return
+        # an unfinished match isn't tried again for every chunk, which would read a long
+        # line over and over: chunks are collected until one could change it (see
+        # _stream_resumes()), so lexing takes linear time however the input is split.
+        pending = [buffer[position:]]
+        closer = None
+        for opener, opener_closer in _UNTERMINATED_OPENERS.items():
+            if pending[0].startswith(opener) and opener_closer not in pending[0][len(opener) :]:
+                closer = opener_closer  # searched for as far as the buffer goes, so only in new chunks
+        read = 0
+        while True:
+            chunk = next(chunks, None)
+            if chunk is None:
+                more_input = False
                 break
-        if match_len != 0:
-            position += match_len
-        else:
-            position += 1
+            pending.append(chunk)
+            read += len(chunk)
+            if _stream_resumes(pending, closer, read):
+                break
+        buffer = "".join(pending)
+        position = 0
+
+
+def tokenize_bytes(source):
+    """
+    Tokenizes a bytes-like source (eg an mmap) without decoding it to a str first.
+
+    Uses TOKEN_REGEX_BYTES, and the same rules as tokenize_string() otherwise.
+
+    Args:
+      source (bytes-like): UTF-8 encoded source code.
+
+    Returns:
+      tokens (TokenBuffer): Tokens that decode their lexemes on access.
+
+    Raises:
+      ValueError: if the input contains invalid tokens.
+    """
+    tokens = TokenBuffer(source, encoding=SOURCE_ENCODING)
+    _scan_tokens(_token_regex_bytes(), source, 0, len(source), 0, tokens)
     return tokens
 
 
+def relex_tokens(tokens, offset, deleted, inserted):
+    """
+    Updates the tokens of a source for an edit, only lexing the part of it that changed.
+
+    Args:
+      tokens (TokenBuffer): Tokens from tokenize_string() (or an earlier relex_tokens()).
+      offset (int): Where in tokens.source the edit starts.
+      deleted (int): Number of characters removed from offset.
+      inserted (str): Text inserted at offset.
+
+    Returns:
+      (new_tokens, first, removed, added): The tokens of the edited source, and which of
+      them changed: tokens[first:first + removed] became new_tokens[first:first + added].
+
+    Raises:
+      ValueError: if the edited source contains invalid tokens.
+    """
+    source = tokens.source
+    if not isinstance(source, str):
+        raise TypeError("relex_tokens() needs tokens from tokenize_string()")
+    if not 0 <= offset <= offset + deleted <= len(source):
+        raise ValueError(f"Edit at {offset} (deleting {deleted}) is outside the source")
+    new_source = source[:offset] + inserted + source[offset + deleted :]
+    shift = len(inserted) - deleted
+    types, starts, ends = tokens.types, tokens.starts, tokens.ends
+    # restarts from the last token before the edited line: no token but whitespace
+    # crosses a newline, so nothing earlier can change, while a "printf('" or "/*"
+    # earlier on the same line could be closed by the edit.
+    first = bisect_left(starts, source.rfind("\n", 0, offset) + 1)
+    if first:
+        position, previous_code = ends[first - 1], types[first - 1]
+    else:
+        position, previous_code = 0, 0
+    edit_end = offset + len(inserted)
+    end_of_input = len(new_source)
+    changed = TokenBuffer(new_source)
+    regex = _token_regex()
+    window_end = edit_end
+    # new lines are lexed a few at a time (doubling), so an unclosed comment only costs
+    # what it swallows:
+    lines = 1
+    while True:
+        for _ in range(lines):
+            newline = new_source.find("\n", window_end)
+            window_end = end_of_input if newline == -1 else newline + 1
+        checked = len(changed)
+        position, previous_code = _scan_tokens(
+            regex, new_source, position, window_end, previous_code, changed, window_end
+        )
+        # done once past the edit a token ends where an old one ended, with the same
+        # code: from there the lexer is in the same state (position and previous token,
+        # so the INT context carries over) on the same text, so the old tokens are reused.
+        for index in range(checked, len(changed)):
+            old_end = changed.ends[index] - shift
+            if old_end < offset + deleted:
+                continue
+            match = bisect_left(ends, old_end, first)
+            if match < len(ends) and ends[match] == old_end and types[match] == changed.types[index]:
+                kept = index + 1
+                resume = match + 1
+                break
+        else:
+            if window_end < end_of_input:
+                lines *= 2
+                continue
+            kept = len(changed)
+            resume = len(types)
+        break
+    new_tokens = TokenBuffer(new_source)
+    new_tokens.types = types[:first] + changed.types[:kept] + types[resume:]
+    new_tokens.starts = starts[:first] + changed.starts[:kept] + _shift_offsets(starts[resume:], shift)
+    new_tokens.ends = ends[:first] + changed.ends[:kept] + _shift_offsets(ends[resume:], shift)
+    return new_tokens, first, resume - first, kept
+
+
+def _shift_offsets(offsets, shift):
+    """
+    Helper function for relex_tokens() that adds shift to every offset in an array.
+
+    Adding one element at a time in Python would make every edit cost as much as the rest
+    of the file, so the array is read as one big integer with an offset in each 32-bit
+    lane and shift is added to all the lanes in one go. No lane can carry or borrow:
+    offsets after an edit are at least as big as what it deleted, and fit in 32 bits.
+    """
+    if not shift or not offsets:
+        return offsets
+    lanes = int.from_bytes(offsets.tobytes(), sys.byteorder)
+    ones = int.from_bytes(array(offsets.typecode, [1]).tobytes() * len(offsets), sys.byteorder)
+    shifted = array(offsets.typecode)
+    shifted.frombytes((lanes + shift * ones).to_bytes(len(offsets) * offsets.itemsize, sys.byteorder))
+    return shifted
+
+
+def _scan_tokens(regex, source, position, safe_end, previous_code, tokens, end=None, errors=None,
+                 blocked=frozenset()):
+    """
+    The lexing loop shared by the tokenizers. Appends every token found in source
+    from position onwards (up to end, if given) to the tokens buffer.
+    Invalid tokens raise, unless an errors list is passed to collect their offsets in.
+
+    Matches at or after safe_end are only kept if _match_is_final() agrees, so
+    pass len(source) to lex everything.
+
+    blocked is the groups that regex never matches (see _UNCLOSED_OPENERS), when the rest
+    of a line is lexed by calling this again.
+
+    Returns:
+      (position, previous_code): Where lexing stopped and the last token code seen.
+
+    Raises:
+      ValueError: if the input contains invalid tokens.
+    """
+    match = regex.match
+    group_codes = _GROUP_CODES
+    as_bytes = isinstance(regex.pattern, bytes)
+    retries = _unclosed_retries(blocked, as_bytes)
+    types_append = tokens.types.append
+    starts_append = tokens.starts.append
+    ends_append = tokens.ends.append
+    end_of_input = len(source) if end is None else end
+    while position < end_of_input:
+        match_output = match(source, position, end_of_input)
+        if position >= safe_end and not _match_is_final(source, position, match_output):
+            break  # token might continue into the next chunk
+        group = match_output.lastindex
+        code = group_codes[group]
+        end = match_output.end()
+        if code:  # skips whitespaces
+            if code == _INVALID_CODE:
+                if errors is not None:
+                    errors.append((position, end))
+                    position = end
+                    continue
+                # raises error if any tokens are invalid
+                invalid_token = match_output.group()
+                if tokens.encoding:
+                    invalid_token = invalid_token.decode(tokens.encoding, "replace")
+                raise ValueError(
+                    f"ERROR - The input contains the following invalid tokens: '{invalid_token}'"
+                )
+            # assigning strings as variable name if preceeded by an variable initialisation (INT token):
+            if previous_code == _INT_INIT_CODE:
+                code = _VARIABLE_NAME_CODE
+            # only captures tokens that are NOT comments:
+            if code != _COMMENT_CODE and code != _MULTI_COMMENT_CODE:
+                types_append(code)
+                starts_append(position)
+                ends_append(end)
+            # captures previous increment for the purpose of checking for variable names
+            previous_code = code
+        retry = retries[group]
+        if retry is not None and end - position == retry[1] and source[position : position + len(retry[0])] == retry[0]:
+            # an opener that didn't match, so nothing later on its line will either:
+            _, _, retry_blocked, newline = retry
+            line_end = newline.search(source, end, end_of_input)
+            if line_end is not None or safe_end >= end_of_input:
+                line_end = end_of_input if line_end is None else line_end.start()
+                end, previous_code = _scan_tokens(
+                    _token_regex_without(retry_blocked, as_bytes), source, end, safe_end, previous_code,
+                    tokens, line_end, errors, retry_blocked,
+                )
+        position = end
+    return position, previous_code
+
+
+def _stream_resumes(pending, closer, read):
+    """
+    Helper function for tokenize_stream(), which has stopped at an unfinished match
+    (pending[0]) and read the chunks after it, up to pending[-1]. Returns whether it's
+    worth lexing again: once a newline has been read, after which everything can be
+    lexed up to it, or for an opener that didn't match, its closer. Any other match is
+    tried again once it has at least doubled in length, so a long one (eg a comment)
+    is read a bounded number of times over.
+    """
+    chunk = pending[-1]
+    if "\n" in chunk:
+        return True
+    if closer is not None:
+        # the closer could be split over two chunks, eg "'" + ")":
+        return closer in pending[-2][-1:] + chunk
+    return read >= len(pending[0])
+
+
+def _match_is_final(buffer, position, match_output):
+    """
+    Helper function for tokenize_stream() to check whether a match found on the last
+    (unfinished) line of the buffer would still be the same with more input.
+
+    A match running up to the end of the buffer could grow (eg 'whi' + 'le'), and a
+    '/*' or "printf('" that didn't match as a whole might still be closed later on.
+    """
+    if match_output.end() == len(buffer):
+        return False
+    if match_output.lastindex in _UNTERMINATED_GROUPS:
+        return True
+    for opener in _UNTERMINATED_OPENERS:
+        # also catches a buffer ending part way through the opener, eg "printf("
+        if opener.startswith(buffer[position : position + len(opener)]):
+            return False
+    return True
+
+
+class TokenBuffer:
+    """
+    Compact token stream: a byte per token code plus start/end offsets into the source.
+
+    The compiler stages read the integer codes in `types` directly. Lexemes are only
+    built when asked for - fixed-spelling tokens share the strings in FIXED_LEXEMES
+    and the rest are sliced out of the source (and decoded, for bytes sources), so
+    the source must stay open while the tokens are in use. Names and numbers are
+    pooled, so however many times one is used (eg in the syntax tree) it's kept once.
+    Indexing or iterating still gives (token, lexeme) pairs.
+
+    Lines aren't counted while lexing. The first location() builds an index of where
+    each line starts (see line_starts()), and every lookup after that is a binary search.
+    """
+
+    __slots__ = ("source", "types", "starts", "ends", "encoding", "pool", "_line_starts")
+
+    def __init__(self, source, encoding=None):
+        self.source = source
+        self.types = array("B")
+        self.starts = array("I")
+        self.ends = array("I")
+        self.encoding = encoding
+        self.pool = {}  # lexeme -> the one copy of it handed out
+        self._line_starts = None  # built by the first location()
+
+    def __getstate__(self):
+        # the pool and line index are rebuilt when needed, so aren't pickled (eg by compile_cache.py),
+        # and a source that's a view (eg an mmap, or from compile_serialize.load_tokens()) is copied:
+        source = self.source
+        if source is not None and not isinstance(source, (str, bytes)):
+            source = bytes(source)
+        return (source, self.types, self.starts, self.ends, self.encoding)
+
+    def __setstate__(self, state):
+        self.source, self.types, self.starts, self.ends, self.encoding = state
+        self.pool = {}
+        self._line_starts = None
+
+    @classmethod
+    def from_pairs(cls, pairs):
+        """
+        Builds a buffer from (token, lexeme) pairs, eg the output of tokenize_stream().
+        The source becomes the lexemes written back to back, so locations are only
+        right for pairs that were that way round to begin with; for a stream, see
+        tokenize_stream_buffer().
+        """
+        text = io.StringIO()
+        tokens = cls(None)
+        position = 0
+        for token_type, lexeme in pairs:
+            tokens.types.append(TOKEN_CODES[token_type])
+            tokens.starts.append(position)
+            position += len(lexeme)
+            tokens.ends.append(position)
+            text.write(lexeme)
+        tokens.source = text.getvalue()
+        return tokens
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, index):
+        return (TOKEN_NAMES[self.types[index]], self.lexeme(index))
+
+    def __iter__(self):
+        for index in range(len(self.types)):
+            yield self[index]
+
+    def lexeme(self, index):
+        code = self.types[index]
+        lexeme = FIXED_LEXEMES[code]
+        if lexeme is None:
+            lexeme = self.source[self.starts[index] : self.ends[index]]
+            if self.encoding:
+                lexeme = str(lexeme, self.encoding)
+            if code in _POOLED_CODES:
+                lexeme = self.pool.setdefault(lexeme, lexeme)
+        return lexeme
+
+    def location(self, index):
+        """
+        Returns:
+          (line, column): Where token index starts in the source, both counted from 1.
+          An index past the last token gives the end of the last token.
+        """
+        if index < len(self.starts):
+            offset = self.starts[index]
+        else:
+            offset = self.ends[-1] if len(self.ends) else 0
+        return self.offset_location(offset)
+
+    def offset_location(self, offset):
+        """
+        Returns:
+          (line, column): Where offset is in the source, both counted from 1.
+        """
+        if self._line_starts is None:
+            self._line_starts = line_starts(self.source)
+        return source_location(self.source, offset, self._line_starts)
+
+
+def line_starts(source):
+    """
+    Helper function that finds the offset each line of source starts at, for source_location().
+    Splitting and adding up the line lengths all happens in C, so building it costs about
+    as much as one more pass over the source.
+    """
+    if isinstance(source, str):
+        newline = "\n"
+    else:
+        newline = b"\n"
+        if not isinstance(source, bytes):
+            source = bytes(source)  # eg an mmap, or a memoryview from compile_serialize.load_tokens()
+    lines = source.split(newline)
+    del lines[-1]  # the last line doesn't end in a newline, so nothing starts after it
+    return array("I", accumulate(map((1).__add__, map(len, lines)), initial=0))
+
+
+def source_location(source, offset, starts=None):
+    """
+    Helper function that turns an offset in a source into a (line, column) pair, counted from 1.
+    Columns of bytes sources are counted in bytes.
+
+    starts is the source's line_starts(), so that looking up many locations only reads
+    the source once. Without it the source is read up to offset.
+    """
+    if starts is None:
+        newline = "\n" if isinstance(source, str) else b"\n"
+        if not isinstance(source, (str, bytes)):
+            source = bytes(source[:offset])
+        return source.count(newline, 0, offset) + 1, offset - source.rfind(newline, 0, offset)
+    line = bisect_right(starts, offset)
+    return line, offset - starts[line - 1] + 1
+
+
+def _located(error, token_index):
+    # records which token an error is about, for CompileResult.fail() to find in the source:
+    error.token_index = token_index
+    return error
+
+
 def print_tokens(tokens):
     """
-    Helper function that prints each token in the passed tuple.
+    Helper function that prints each token in the passed buffer.
 
     Args:
-      tokens (tuple): A tuple containing tokens and lexemes.
+      tokens (TokenBuffer): A buffer containing tokens and lexemes.
     """
     for token in tokens:
         print(token)
 
 
-def parse_tokens(tokens):
+# SYNTAX TREE
+# Nodes built by parse_tokens(). Each keeps the index of its first token.
+
+
+class Node:
+    """
+    Base class for syntax tree nodes. Nodes compare equal if their fields do.
+
+    Comparing and pickling go through flatten_tree(), so neither recurses and both
+    work on trees of any depth.
+    """
+
+    __slots__ = ("token_index",)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and flatten_tree(self) == flatten_tree(other)
+
+    def __reduce__(self):
+        return (unflatten_tree, (flatten_tree(self),))
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in type(self).__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class Program(Node):
+    __slots__ = ("statements",)
+
+    def __init__(self, statements, token_index=0):
+        self.statements = statements
+        self.token_index = token_index
+
+
+class IfStatement(Node):
+    """if/elif/else chain. branches holds (condition, block) pairs, if first then each elif."""
+
+    __slots__ = ("branches", "else_block")
+
+    def __init__(self, branches, else_block, token_index):
+        self.branches = branches
+        self.else_block = else_block
+        self.token_index = token_index
+
+
+class WhileLoop(Node):
+    """while loop, counter is the variable incremented (x++) at the end of the block."""
+
+    __slots__ = ("condition", "block", "counter")
+
+    def __init__(self, condition, block, counter, token_index):
+        self.condition = condition
+        self.block = block
+        self.counter = counter
+        self.token_index = token_index
+
+
+class PrintStatement(Node):
+    """printf('...') statement, text is what's between the quotes."""
+
+    __slots__ = ("text",)
+
+    def __init__(self, text, token_index):
+        self.text = text
+        self.token_index = token_index
+
+
+class IntDeclaration(Node):
+    __slots__ = ("name", "value")
+
+    def __init__(self, name, value, token_index):
+        self.name = name
+        self.value = value
+        self.token_index = token_index
+
+
+class ArithmeticExpression(Node):
+    """
+    operator is the token code of ADD, SUBTRACT, MULTIPLY or DIVIDE, and left and right
+    are expressions: Number, Variable or ArithmeticExpression nodes. A statement of its
+    own, or one side of a Condition.
+    """
+
+    __slots__ = ("left", "operator", "right")
+
+    def __init__(self, left, operator, right, token_index):
+        self.left = left
+        self.operator = operator
+        self.right = right
+        self.token_index = token_index
+
+
+class Condition(Node):
+    """operator is the token code of a relative operator, eg MORE_THAN, between two expressions."""
+
+    __slots__ = ("left", "operator", "right")
+
+    def __init__(self, left, operator, right, token_index):
+        self.left = left
+        self.operator = operator
+        self.right = right
+        self.token_index = token_index
+
+
+class Number(Node):
+    """Number literal, value is the lexeme."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value, token_index):
+        self.value = value
+        self.token_index = token_index
+
+
+class Variable(Node):
+    """Variable used in an expression or as a while loop counter (a LETTERS token)."""
+
+    __slots__ = ("name",)
+
+    def __init__(self, name, token_index):
+        self.name = name
+        self.token_index = token_index
+
+
+def flatten_tree(node):
+    """
+    Flattens a node and everything under it into a list of (operation, argument) pairs
+    in post-order, which unflatten_tree() turns back into the same tree:
+    ("value", v) is a plain value, ("list", n) / ("tuple", n) collect the last n items
+    and ("node", class name) builds a node out of its last len(fields) items.
+    """
+    flat = []
+    pending = [node]
+    while pending:
+        item = pending.pop()
+        kind = type(item)
+        if kind is _FlatOperation:
+            flat.append(item.operation)
+        elif kind in _NODE_FIELDS:
+            pending.append(_FlatOperation(("node", kind.__name__)))
+            pending.extend(getattr(item, name) for name in reversed(_NODE_FIELDS[kind]))
+        elif kind is list or kind is tuple:
+            pending.append(_FlatOperation((kind.__name__, len(item))))
+            pending.extend(reversed(item))
+        else:
+            flat.append(("value", item))
+    return flat
+
+
+def unflatten_tree(flat):
+    """Rebuilds the node that flatten_tree() returned flat for."""
+    values = []
+    for operation, argument in flat:
+        if operation == "value":
+            values.append(argument)
+            continue
+        if operation == "node":
+            kind = _NODE_CLASSES[argument]
+            item = kind.__new__(kind)
+            count = len(_NODE_FIELDS[kind])
+            for name, value in zip(_NODE_FIELDS[kind], values[len(values) - count :]):
+                setattr(item, name, value)
+        else:
+            count = argument
+            item = values[len(values) - count :]
+            if operation == "tuple":
+                item = tuple(item)
+        del values[len(values) - count :]
+        values.append(item)
+    return values[0]
+
+
+class _FlatOperation:
+    """Marks where flatten_tree() writes out an operation, after the items it collects."""
+
+    __slots__ = ("operation",)
+
+    def __init__(self, operation):
+        self.operation = operation
+
+
+def walk_statements(program):
+    """
+    Yields every statement in a syntax tree, each one before the statements in its blocks.
+    Uses an explicit stack rather than recursion, so nesting depth isn't limited.
+    """
+    stack = program.statements[::-1]
+    while stack:
+        statement = stack.pop()
+        yield statement
+        if type(statement) is IfStatement:
+            if statement.else_block:
+                stack.extend(reversed(statement.else_block))
+            for _, block in reversed(statement.branches):
+                stack.extend(reversed(block))
+        elif type(statement) is WhileLoop:
+            stack.extend(reversed(statement.block))
+
+
+def walk_expression(expression):
+    """
+    Yields every node of a Condition or expression, each one before its operands and
+    left operands first, so the Numbers and Variables come out in source order. Uses an
+    explicit stack like walk_statements(), so expressions of any length work.
+    """
+    stack = [expression]
+    while stack:
+        node = stack.pop()
+        yield node
+        if type(node) is ArithmeticExpression or type(node) is Condition:
+            stack.append(node.right)
+            stack.append(node.left)
+
+
+_NODE_CLASSES = {
+    kind.__name__: kind
+    for kind in [
+        Program,
+        IfStatement,
+        WhileLoop,
+        PrintStatement,
+        IntDeclaration,
+        ArithmeticExpression,
+        Condition,
+        Number,
+        Variable,
+    ]
+}
+# every field of each node class, including the token_index from Node:
+_NODE_FIELDS = {kind: Node.__slots__ + kind.__slots__ for kind in _NODE_CLASSES.values()}
+_NUMBER_CODE = TokenType.NUMBER
+
+
+class SymbolTable:
+    """
+    The variables of a program, filled in by the parser actions as they're parsed (or
+    from a finished tree by from_tree()) for semantic_analyzer() to check.
+
+    Names are interned with sys.intern(), so the nodes for a variable all share one
+    string, and each is looked up in a dict once, when its token is parsed.
+
+    Attributes:
+        declarations (dict): Name -> token index of its int declaration.
+        undeclared (dict): Name -> token index of the first use of a variable that
+        hadn't been declared.
+        duplicates (list): (name, token index) of each declaration of a name that was
+        already declared.
+        counter_mismatches (list): (counter, condition) of each while loop whose counter
+        Variable isn't a variable in its Condition.
+    """
+
+    __slots__ = ("declarations", "undeclared", "duplicates", "counter_mismatches")
+
+    def __init__(self):
+        self.declarations = {}
+        self.undeclared = {}
+        self.duplicates = []
+        self.counter_mismatches = []
+
+    def declare(self, name, token_index):
+        """Records an int declaration. Returns the name, interned."""
+        name = sys.intern(name)
+        if name in self.declarations:
+            self.duplicates.append((name, token_index))
+        else:
+            self.declarations[name] = token_index
+        return name
+
+    def use(self, name, token_index):
+        """Records a variable used in a condition or as a counter. Returns the name, interned."""
+        name = sys.intern(name)
+        if name not in self.declarations and name not in self.undeclared:
+            self.undeclared[name] = token_index
+        return name
+
+    def check_counter(self, counter, condition):
+        """Records a while loop whose counter isn't one of the variables in its condition."""
+        for node in walk_expression(condition):
+            if type(node) is Variable and node.name == counter.name:
+                return
+        self.counter_mismatches.append((counter, condition))
+
+    @classmethod
+    def from_tree(cls, syntax_tree):
+        """
+        Builds the table for a tree that didn't come straight from the parser, visiting
+        variables in source order as the parser does.
+        """
+        symbols = cls()
+        stack = syntax_tree.statements[::-1]
+        while stack:
+            item = stack.pop()
+            kind = type(item)
+            if kind is Variable:
+                symbols.use(item.name, item.token_index)
+            elif kind is Condition or kind is ArithmeticExpression:
+                stack.extend((item.right, item.left))
+            elif kind is IntDeclaration:
+                symbols.declare(item.name, item.token_index + 1)
+            elif kind is IfStatement:
+                pending = []
+                for condition, block in item.branches:
+                    pending.append(condition)
+                    pending.extend(block)
+                if item.else_block:
+                    pending.extend(item.else_block)
+                stack.extend(reversed(pending))
+            elif kind is WhileLoop:
+                stack.append((item.counter, item.condition))  # checked once the counter is used
+                stack.append(item.counter)
+                stack.extend(reversed(item.block))
+                stack.append(item.condition)
+            elif kind is tuple:
+                symbols.check_counter(*item)
+        return symbols
+
+
+# Parser actions. These are pushed onto the parser stack as part of a production and
+# run when popped, by which point the tokens of the production before them have been
+# consumed. Apart from <exe_block> and <end_if>, every non-terminal here matches exactly
+# one token, so the actions find their tokens by counting back from token_index.
+# Finished nodes are kept on the values stack until the enclosing production uses them
+# (conditions and expressions are put there by _parse_expression()), and variables are
+# recorded in symbols (a SymbolTable) as they are met.
+
+
+def _action_if(tokens, token_index, values, symbols):
+    # IF ( <condition> ) { <exe_block> }  - the <end_if> that follows adds to this node
+    block = [values.pop()]
+    condition = values.pop()
+    values.append(IfStatement([(condition, block)], None, condition.token_index - 2))
+
+
+def _action_elif(tokens, token_index, values, symbols):
+    block = [values.pop()]
+    condition = values.pop()
+    values[-1].branches.append((condition, block))
+
+
+def _action_else(tokens, token_index, values, symbols):
+    values[-1].else_block = [values.pop()]
+
+
+def _action_print(tokens, token_index, values, symbols):
+    # PRINT ;
+    start = token_index - 2
+    values.append(PrintStatement(print_text(tokens.lexeme(start)), start))
+
+
+def print_text(lexeme):
+    """Helper function that takes the text to print out of a PRINT token's lexeme."""
+    return lexeme.replace("printf('", "").replace("')", "")
+
+
+def _action_int_declaration(tokens, token_index, values, symbols):
+    # INT <variable_name> = <number> ;
+    start = token_index - 5
+    name = symbols.declare(tokens.lexeme(start + 1), start + 1)
+    values.append(IntDeclaration(name, Number(tokens.lexeme(start + 3), start + 3), start))
+
+
+def _action_while(tokens, token_index, values, symbols):
+    # WHILE ( <condition> ) { <exe_block> LETTERS ++ } ;
+    counter = token_index - 4
+    block = [values.pop()]
+    condition = values.pop()
+    counter = Variable(symbols.use(tokens.lexeme(counter), counter), counter)
+    symbols.check_counter(counter, condition)
+    values.append(WhileLoop(condition, block, counter, condition.token_index - 2))
+
+
+PARSER_ACTIONS = {
+    "@if": _action_if,
+    "@elif": _action_elif,
+    "@else": _action_else,
+    "@print": _action_print,
+    "@int_declaration": _action_int_declaration,
+    "@while": _action_while,
+}
+
+
+# GRAMMAR
+# The rows of the parser table:
+NON_TERMINALS = [
+    "<program>",
+    "<if_statement>",
+    "<letters>",
+    "<variable_name>",
+    "<rel_op>",
+    "<exe_block>",
+    "<end_if>",
+    "<print_statement>",
+    "<int_variable>",
+    "<number>",
+    "<arithemtic_exp>",
+    "<arithmetic_op>",
+    "<while_loop>",
+]
+
+# Production rules, written left to right. Symbols starting with @ are PARSER_ACTIONS, and
+# <condition> and <expression> are EXPRESSION_SYMBOLS, read by _parse_expression().
+PRODUCTIONS = {
+    # if statement - allows you to end with a ; or continue with else/elif clauses
+    6: ["IF", "LEFT_BRACKET", "<condition>", "RIGHT_BRACKET", "LEFT_PARENTHESIS", "<exe_block>", "RIGHT_PARENTHESIS", "@if", "<end_if>"],
+    9: ["LETTERS"],
+    10: ["VARIABLE_NAME"],
+    11: ["MORE_THAN"],
+    12: ["LESS_THAN"],
+    15: ["ELSE", "LEFT_PARENTHESIS", "<exe_block>", "RIGHT_PARENTHESIS", "@else", "SEMI_COLON"],  # <end_if> (else)
+    16: ["ELIF", "LEFT_BRACKET", "<condition>", "RIGHT_BRACKET", "LEFT_PARENTHESIS", "<exe_block>", "RIGHT_PARENTHESIS", "@elif", "<end_if>"],  # <end_if> (elif)
+    # Print statement
+    # Originally I had this rule seperating out all of the elements of the print statement, but it was tricky
+    # allowing more than one word at a time within the ('') of the statement. Therefore, I created a seperate
+    # token that captures the whole print statement so that regex would allow the statement to contain
+    # all characters and any number of words.
+    17: ["PRINT", "SEMI_COLON", "@print"],
+    18: ["INT", "<variable_name>", "ASSIGN", "<number>", "SEMI_COLON", "@int_declaration"],  # int variable declaration
+    19: ["NUMBER"],
+    21: ["<expression>", "SEMI_COLON"],  # arithmetic expressions
+    22: ["ADD"],
+    23: ["SUBTRACT"],
+    24: ["MULTIPLY"],
+    25: ["DIVIDE"],
+    # while loop
+    26: ["WHILE", "LEFT_BRACKET", "<condition>", "RIGHT_BRACKET", "LEFT_PARENTHESIS", "<exe_block>", "LETTERS", "INCREMENT", "RIGHT_PARENTHESIS", "SEMI_COLON", "@while"],
+    27: ["SEMI_COLON"],  # <end_if> (ends)
+    28: ["LESS_THAN_OR_EQUALS"],
+    29: ["MORE_THAN_OR_EQUALS"],
+    30: ["NOT_EQUALS"],
+    31: ["EQUALS"],
+}
+
+# Parsing table: the production rule for each non-terminal and next token
+PARSING_TABLE = {
+    "<program>": {"IF": 6, "PRINT": 17, "INT": 18, "WHILE": 26, "NUMBER": 21, "LETTERS": 21, "LEFT_BRACKET": 21},
+    "<if_statement>": {"IF": 6, "NUMBER": 19},
+    "<letters>": {"LETTERS": 9},
+    "<variable_name>": {"VARIABLE_NAME": 10},
+    "<rel_op>": {"MORE_THAN": 11, "LESS_THAN": 12, "LESS_THAN_OR_EQUALS": 28, "MORE_THAN_OR_EQUALS": 29, "NOT_EQUALS": 30, "EQUALS": 31},
+    "<exe_block>": {"IF": 6, "PRINT": 17},
+    "<end_if>": {"SEMI_COLON": 27, "ELSE": 15, "ELIF": 16},
+    "<print_statement>": {"PRINT": 17},
+    "<int_variable>": {"INT": 18},
+    "<number>": {"NUMBER": 19},
+    "<arithemtic_exp>": {"NUMBER": 21, "LETTERS": 21, "LEFT_BRACKET": 21},
+    "<arithmetic_op>": {"ADD": 22, "SUBTRACT": 23, "MULTIPLY": 24, "DIVIDE": 25},
+    "<while_loop>": {"WHILE": 26},
+}
+
+# Non-terminals that aren't in the table: the parser hands each of these to
+# _parse_expression(), which reads the whole condition or expression in one go.
+EXPRESSION_SYMBOLS = ["<condition>", "<expression>"]
+# the tokens a condition or expression can start with:
+EXPRESSION_FIRST = {"NUMBER", "LETTERS", "LEFT_BRACKET"}
+
+# Grammar symbols as small integers: terminals are their token codes, non-terminals
+# are numbered from NON_TERMINAL_BASE, parser actions from ACTION_BASE and expression
+# symbols from EXPRESSION_BASE, so telling them apart is one comparison.
+NON_TERMINAL_BASE = len(TOKEN_NAMES)
+ACTION_BASE = NON_TERMINAL_BASE + len(NON_TERMINALS)
+EXPRESSION_BASE = ACTION_BASE + len(PARSER_ACTIONS)
+SYMBOL_CODES = dict(TOKEN_CODES)
+for index, non_terminal in enumerate(NON_TERMINALS):
+    SYMBOL_CODES[non_terminal] = NON_TERMINAL_BASE + index
+for index, action in enumerate(PARSER_ACTIONS):
+    SYMBOL_CODES[action] = ACTION_BASE + index
+for index, expression_symbol in enumerate(EXPRESSION_SYMBOLS):
+    SYMBOL_CODES[expression_symbol] = EXPRESSION_BASE + index
+START_SYMBOL = SYMBOL_CODES["<program>"]
+_CONDITION_SYMBOL = SYMBOL_CODES["<condition>"]
+# indexed by symbol code - ACTION_BASE:
+_ACTION_FUNCTIONS = tuple(PARSER_ACTIONS.values())
+
+
+@cache
+def _build_parse_table():
+    """
+    Turns PARSING_TABLE and PRODUCTIONS into the dense table used by parse_tokens(),
+    the first time it's asked for (after that the same table is returned).
+
+    Returns:
+        table (list): Indexed by [symbol][token code]. Each cell is the production's
+        right-hand side as symbol codes, already reversed so it can be pushed onto the
+        stack with one extend(), or None where the grammar has no rule. Rows for
+        terminals are None.
+    """
+    table = [None] * ACTION_BASE
+    for non_terminal, rules in PARSING_TABLE.items():
+        row = [None] * len(TOKEN_NAMES)
+        for terminal, production_rule in rules.items():
+            row[TOKEN_CODES[terminal]] = tuple(
+                SYMBOL_CODES[symbol] for symbol in reversed(PRODUCTIONS[production_rule])
+            )
+        table[SYMBOL_CODES[non_terminal]] = row
+    return table
+
+
+@cache
+def _build_first_and_follow_sets():
+    """
+    Works out the FIRST and FOLLOW set of every non-terminal in PARSING_TABLE, for
+    the error recovery in parse_tokens(), the first time a parse recovers. No production
+    is empty, so FIRST(A) is just the tokens in A's row of the table (or EXPRESSION_FIRST,
+    for EXPRESSION_SYMBOLS), and None in a FOLLOW set is the end of input.
+
+    Returns:
+        (first_sets, follow_sets): dicts of non-terminal -> set of token names.
+    """
+    first_sets = {non_terminal: set(rules) for non_terminal, rules in PARSING_TABLE.items()}
+    for expression_symbol in EXPRESSION_SYMBOLS:
+        first_sets[expression_symbol] = set(EXPRESSION_FIRST)
+    follow_sets = {non_terminal: set() for non_terminal in PARSING_TABLE}
+    follow_sets["<program>"].add(None)
+    changed = True
+    while changed:
+        changed = False
+        for non_terminal, rules in PARSING_TABLE.items():
+            for production_rule in set(rules.values()):
+                symbols = [symbol for symbol in PRODUCTIONS[production_rule] if symbol[0] != "@"]
+                for position, symbol in enumerate(symbols):
+                    if symbol not in follow_sets:
+                        continue  # terminal
+                    if position + 1 < len(symbols):
+                        following = symbols[position + 1]
+                        found = first_sets.get(following, {following})
+                    else:
+                        found = follow_sets[non_terminal]
+                    if not found <= follow_sets[symbol]:
+                        follow_sets[symbol] |= found
+                        changed = True
+    return first_sets, follow_sets
+
+
+_END_OF_INPUT = 0  # token code 0 isn't used by any token
+_SEMI_COLON_CODE = TokenType.SEMI_COLON
+
+
+@cache
+def _recovery_codes():
+    # the same sets as token codes, as (first, follow) lists indexed by symbol code:
+    first_sets, follow_sets = _build_first_and_follow_sets()
+    first_codes = [frozenset()] * ACTION_BASE
+    follow_codes = [frozenset()] * ACTION_BASE
+    for non_terminal in PARSING_TABLE:
+        first_codes[SYMBOL_CODES[non_terminal]] = frozenset(
+            TOKEN_CODES[name] for name in first_sets[non_terminal]
+        )
+        follow_codes[SYMBOL_CODES[non_terminal]] = frozenset(
+            _END_OF_INPUT if name is None else TOKEN_CODES[name] for name in follow_sets[non_terminal]
+        )
+    return first_codes, follow_codes
+
+
+# Tables that are only built when first used, for a quicker start (eg a --tokens-only
+# run never builds the parser's), but can still be read as module attributes:
+_LAZY_TABLES = {
+    "TOKEN_REGEX": _token_regex,
+    "TOKEN_REGEX_BYTES": _token_regex_bytes,
+    "PARSE_TABLE": _build_parse_table,
+    "FIRST_SETS": lambda: _build_first_and_follow_sets()[0],
+    "FOLLOW_SETS": lambda: _build_first_and_follow_sets()[1],
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_TABLES:
+        return _LAZY_TABLES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# EXPRESSIONS
+# How tightly each arithmetic operator binds - higher is applied first, and operators
+# of the same precedence are applied left to right:
+OPERATOR_PRECEDENCE = {TOKEN_ADDITION: 1, TOKEN_SUBTRACT: 1, TOKEN_MULTIPLY: 2, TOKEN_DIVIDE: 2}
+# the same by token code, 0 for tokens that aren't arithmetic operators:
+_PRECEDENCES = [0] * len(TOKEN_NAMES)
+for token_type, precedence in OPERATOR_PRECEDENCE.items():
+    _PRECEDENCES[TOKEN_CODES[token_type]] = precedence
+_RELATIONAL_CODES = frozenset(TOKEN_CODES[name] for name in PARSING_TABLE["<rel_op>"])
+_LETTERS_CODE = TokenType.LETTERS
+_LEFT_BRACKET_CODE = TokenType.LEFT_BRACKET
+_RIGHT_BRACKET_CODE = TokenType.RIGHT_BRACKET
+
+
+def _operand(tokens, index, symbols):
+    """Helper function for _parse_expression() that makes a Number or Variable node out of a single token."""
+    if tokens.types[index] == _NUMBER_CODE:
+        return Number(tokens.lexeme(index), index)
+    return Variable(symbols.use(tokens.lexeme(index), index), index)
+
+
+class _ExpressionError(SyntaxError):
+    """
+    Raised by _parse_expression() at a token that can't come next. The message is the
+    same as for any other unexpected token; expected is what could have come instead.
+    """
+
+    def __init__(self, token_index, found, expected):
+        super().__init__(f"PARSER ERROR - Unexpected token {found}")
+        self.token_index = token_index
+        self.expected = expected
+
+
+def _parse_expression(tokens, token_index, values, symbols, condition):
+    """
+    Reads the arithmetic expression (or with condition, the condition: two expressions
+    either side of a relational operator) starting at token_index, and appends its
+    node to values.
+
+    Expressions are numbers and LETTERS variables joined by + - * / and grouped with
+    brackets, eg a + b * (3 - c) / 2. They're read by precedence climbing without
+    recursion: operands and operators wait on stacks of their own, and each operator is
+    applied (building an ArithmeticExpression) once the operator after it doesn't bind
+    more tightly. Every token is pushed and popped at most once, so the time taken is
+    linear in the length of the expression however long or deeply bracketed it is.
+
+    Returns:
+        token_index (int): Index of the first token after the expression. If the tokens
+        run out part way through it, len(tokens) and nothing is appended to values.
+    Raises:
+        _ExpressionError: at a token that can't come next.
+    """
+    token_types = tokens.types
+    token_count = len(token_types)
+    precedences = _PRECEDENCES
+    start = token_index
+    operands = []
+    operand_starts = []  # index of the first token of each operand, brackets included
+    operators = []  # operators waiting for their right operand, and LEFT_BRACKET for each open bracket
+    bracket_starts = []
+    left_side = None  # a condition's left expression and relational operator, once read
+    if condition and token_index + 3 < token_count:
+        # most conditions compare two lone numbers or variables (eg x < 10), which don't need the stacks:
+        left, operator, right, after = token_types[token_index : token_index + 4]
+        if (
+            (left == _NUMBER_CODE or left == _LETTERS_CODE)
+            and operator in _RELATIONAL_CODES
+            and (right == _NUMBER_CODE or right == _LETTERS_CODE)
+            and not precedences[after]
+        ):
+            values.append(Condition(
+                _operand(tokens, token_index, symbols),
+                operator,
+                _operand(tokens, token_index + 2, symbols),
+                token_index,
+            ))
+            return token_index + 3
+    while True:
+        # an operand, after any opening brackets:
+        while token_index < token_count and token_types[token_index] == _LEFT_BRACKET_CODE:
+            operators.append(_LEFT_BRACKET_CODE)
+            bracket_starts.append(token_index)
+            token_index += 1
+        if token_index >= token_count:
+            return token_count
+        code = token_types[token_index]
+        if code != _NUMBER_CODE and code != _LETTERS_CODE:
+            raise _ExpressionError(token_index, TOKEN_NAMES[code], "a NUMBER, LETTERS or LEFT_BRACKET")
+        operands.append(_operand(tokens, token_index, symbols))
+        operand_starts.append(token_index)
+        token_index += 1
+        # then any closing brackets, up to the next operator:
+        while True:
+            code = token_types[token_index] if token_index < token_count else _END_OF_INPUT
+            precedence = precedences[code]
+            if precedence:
+                while operators and precedences[operators[-1]] >= precedence:
+                    right = operands.pop()
+                    del operand_starts[-1]
+                    operands[-1] = ArithmeticExpression(operands[-1], operators.pop(), right, operand_starts[-1])
+                operators.append(code)
+                token_index += 1
+                break
+            if code == _RIGHT_BRACKET_CODE and bracket_starts:
+                while operators[-1] != _LEFT_BRACKET_CODE:
+                    right = operands.pop()
+                    del operand_starts[-1]
+                    operands[-1] = ArithmeticExpression(operands[-1], operators.pop(), right, operand_starts[-1])
+                operators.pop()
+                operand_starts[-1] = bracket_starts.pop()
+                token_index += 1
+                continue
+            # the end of the expression:
+            if bracket_starts:
+                if code == _END_OF_INPUT:
+                    return token_count
+                raise _ExpressionError(token_index, TOKEN_NAMES[code], "an operator or RIGHT_BRACKET")
+            while operators:
+                right = operands.pop()
+                del operand_starts[-1]
+                operands[-1] = ArithmeticExpression(operands[-1], operators.pop(), right, operand_starts[-1])
+            expression = operands.pop()
+            del operand_starts[-1]
+            if not condition:
+                values.append(expression)
+                return token_index
+            if left_side is not None:
+                values.append(Condition(left_side, left_operator, expression, start))
+                return token_index
+            if code not in _RELATIONAL_CODES:
+                if code == _END_OF_INPUT:
+                    return token_count
+                raise _ExpressionError(token_index, TOKEN_NAMES[code], "an operator or a relational operator")
+            left_side, left_operator = expression, code
+            token_index += 1
+            break
+
+
+def parse_tokens(tokens, profile=None, errors=None, symbols=None):
     '''
-    Checks that the sequence of tokens follows the defined LL(1) grammar. 
+    Checks that the sequence of tokens follows the defined LL(1) grammar, and builds its syntax tree.
 
-    Creates a parser table out of non-terminals and terminals,
-    loops through tokens and if the top of the stack is a non-terminal
-    the function will go to the parsing table to find it's production rule. 
-    If the production rule is matched with the input - stack will be extended.
-    If the top is a terminal the token is consumed and the function moves to the next.
-    
+    Args:
+        tokens (TokenBuffer): The tokens to parse.
+        profile (ParseProfile): Optional profile to count steps, stack depth and rule hits in.
+        errors (list): If given, each syntax error is appended as a Diagnostic instead of raised.
+        symbols (SymbolTable): If given, filled in with the program's variables.
     Returns:
-        parser_passed (bool): Signifies whether the tokenized input has passed the parser successfully. 
+        syntax_tree (Program): The parsed program, or None if the tokens don't form a complete program.
     Raises:
-        SyntaxError: raises if there's a mismatch between the top of the stack and the current token
-        SyntaxError: raises if there's a mismatched production rule
+        SyntaxError: raises if a token doesn't fit the grammar, with its token_index.
     '''
+    if symbols is None:
+        symbols = SymbolTable()
+    if errors is not None:
+        return _parse_tokens_recovering(tokens, errors, symbols)  # recovers to find more errors
+    if not tokens.types:
+        return None  # the tokens run out before the program has even started
+    if profile is not None:
+        # a separate copy of the loop, so this one pays nothing for profiling:
+        return _parse_tokens_profiled(tokens, profile, symbols)
+    # Loops through tokens and if the top of the stack is a non-terminal the parsing
+    # table gives its production rule, which extends the stack. A terminal is consumed
+    # and the parser moves to the next token, a parser action builds a node out of the
+    # tokens just consumed, and <condition> or <expression> is read by _parse_expression().
+    # The table is built once, on first use (see _build_parse_table()).
     token_index = 0
-    stack = ["<program>"] # starting point of stack
-    # The rows of the parser table:
-    non_terminals = [
-        "<program>",
-        "<if_statement>",
-        "<condition>",
-        "<letters>",
-        "<variable_name>",
-        "<rel_op>",
-        "<exe_block>",
-        "<end_if>",
-        "<print_statement>",
-        "<int_variable>",
-        "<number>",
-        "<arithemtic_exp>",
-        "<arithmetic_op>",
-        "<while_loop>",
-    ]
-    # The cols of the parser table:
-    terminals = [
-        "IF",
-        "LEFT_BRACKET",
-        "RIGHT_BRACKET",
-        "LEFT_PARENTHESIS",
-        "RIGHT_PARENTHESIS",
-        "SEMI_COLON",
-        "LETTERS",
-        "VARIABLE_NAME",
-        "MORE_THAN",
-        "LESS_THAN",
-        "ELSE",
-        "ELIF",
-        "PRINT",
-        "ASSIGN",
-        "INT",
-        "WHILE",
-        "NUMBER",
-        "ADD",
-        "SUBTRACT",
-        "MULTIPLY",
-        "DIVIDE",
-        "INCREMENT",
-        "LESS_THAN_OR_EQUALS",
-        "MORE_THAN_OR_EQUALS",
-        "NOT_EQUALS",
-        "EQUALS"
-    ]
-    column_indices = {terminal: i for i, terminal in enumerate(terminals)}
-    row_indices = {non_terminal: i for i, non_terminal in enumerate(non_terminals)}
-    # Parsing table with production rules
-    parsing_table = [
-        [6, None, None, None, None, None, None, None, None, None, None, None, 17, None, 18, 26, 21, None, None, None, None, None, None, None, None, None],
-        [6, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, 19, None, None, None, None, None, None, None, None, None],
-        [None, None, None, None, None, None, 8, None, None, None, None, None, None, None, None, None, 7, None, None, None, None, None, None, None, None, None],
-        [None, None, None, None, None, None, 9, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None],
-        [None, None, None, None, None, None, None, 10, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None],
-        [None, None, None, None, None, None, None, None, 11, 12, None, None, None, None, None, None, None, None, None, None, None, None, 28, 29, 30, 31],
-        [6, None, None, None, None, None, None, None, None, None, None, None, 17, None, None, None, None, None, None, None, None, None, None, None, None, None],
-        [None, None, None, None, None, 27, None, None, None, None, 15, 16, None, None, None, None, None, None, None, None, None, None, None, None, None, None],
-        [None, None, None, None, None, None, None, None, None, None, None, None, 17, None, None, None, None, None, None, None, None, None, None, None, None, None],
-        [None, None, None, None, None, None, None, None, None, None, None, None, None, None, 18, None, None, None, None, None, None, None, None, None, None, None],
-        [None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, 19, None, None, None, None, None, None, None, None, None],
-        [None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, 21, None, None, None, None, None, None, None, None, None],
-        [None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, 22, 23, 24, 25, None, None, None, None, None],
-        [None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, 26, None, None, None, None, None, None, None, None, None, None],
-    ]
+    token_types = tokens.types
+    token_count = len(token_types)
+    parse_table = _build_parse_table()
+    actions = _ACTION_FUNCTIONS
+    stack = [START_SYMBOL] # starting point of stack
+    values = []  # nodes built by the parser actions
     while stack:
-        top = stack[-1]
-        current_token = tokens[token_index][0]
-        # cross-referencing with production rules:
-        if top in non_terminals:
-            row_index = row_indices[top]
-            column_index = column_indices[current_token]
-            production_rule = parsing_table[row_index][column_index]
-            if production_rule is None:
-                raise SyntaxError('Parsing error: Unexpected token {}'.format(current_token))
-            stack.pop() 
-            if production_rule == 6:
-                stack.extend( # if statement - allows you to end with a ; or continue with else/elif clauses
-                    [
-                        "<end_if>",
-                        "RIGHT_PARENTHESIS",
-                        "<exe_block>",
-                        "LEFT_PARENTHESIS",
-                        "RIGHT_BRACKET",
-                        "<condition>",
-                        "LEFT_BRACKET",
-                        "IF",
-                    ]
-                )
-            elif production_rule == 7: # <condition> rule (numbers)
-                stack.extend(["NUMBER", "<rel_op>", "NUMBER"])
-            elif production_rule == 8: # <condition> rule (letters)
-                stack.extend(["LETTERS", "<rel_op>", "LETTERS"])
-            elif production_rule == 9:
-                stack.extend(["LETTERS"])
-            elif production_rule == 10:
-                stack.extend(["VARIABLE_NAME"])
-            elif production_rule == 11:
-                stack.extend(["MORE_THAN"])
-            elif production_rule == 12:
-                stack.extend(["LESS_THAN"])
-            elif production_rule == 15:  # <end_if> (else)
-                stack.extend(
-                    [
-                        "SEMI_COLON",
-                        "RIGHT_PARENTHESIS",
-                        "<exe_block>",
-                        "LEFT_PARENTHESIS",
-                        "ELSE",
-                    ]
-                )
-            elif production_rule == 16:  # end_if (elif)
-                stack.extend(
-                    [
-                        "<end_if>",
-                        "RIGHT_PARENTHESIS",
-                        "<exe_block>",
-                        "LEFT_PARENTHESIS",
-                        "RIGHT_BRACKET",
-                        "<condition>",
-                        "LEFT_BRACKET",
-                        "ELIF",
-                    ]
-                )
-                
-            elif production_rule == 17:
-                """
-                Print statement
-                Originally I had this rule seperating out all of the elements of the print statement, but it was tricky
-                allowing more than one word at a time within the ('') of the statement. Therefore, I created a seperate
-                token that captures the whole print statement so that regex would allow the statement to contain
-                all characters and any number of words.
-                """
-                stack.extend(["SEMI_COLON", "PRINT"])  # print statement
-            elif production_rule == 18:
-                stack.extend( # int variable declaration
-                    ["SEMI_COLON", "<number>", "ASSIGN", "<variable_name>", "INT"]
-                )
-            elif production_rule == 19:
-                stack.extend(["NUMBER"])
-            elif production_rule == 21:  # arithmetic expressions
-                stack.extend(["SEMI_COLON", "NUMBER", "<arithmetic_op>", "NUMBER"])
-            elif production_rule == 22:
-                stack.extend(["ADD"])
-            elif production_rule == 23:
-                stack.extend(["SUBTRACT"])
-            elif production_rule == 24:
-                stack.extend(["MULTIPLY"])
-            elif production_rule == 25:
-                stack.extend(["DIVIDE"])
-            elif production_rule == 26:  # while loop
-                stack.extend(
-                    [
-                        "SEMI_COLON",
-                        "RIGHT_PARENTHESIS",
-                        "INCREMENT",
-                        "LETTERS",
-                        "<exe_block>",
-                        "LEFT_PARENTHESIS",
-                        "RIGHT_BRACKET",
-                        "NUMBER",
-                        "<rel_op>",
-                        "LETTERS",
-                        "LEFT_BRACKET",
-                        "WHILE",
-                    ]
-                )
-            elif production_rule == 27:
-                stack.extend( # end_if (ends)
-                    ["SEMI_COLON"]
-                )
-            elif production_rule == 28:
-                stack.extend(["LESS_THAN_OR_EQUALS"])
-            elif production_rule == 29:
-                stack.extend(["MORE_THAN_OR_EQUALS"])
-            elif production_rule == 30:
-                stack.extend(["NOT_EQUALS"])
-            elif production_rule == 31:
-                stack.extend(["EQUALS"])
-            else:
-                raise SyntaxError(
-                    "PARSER ERROR - Unexpected production rule {}".format(
-                        production_rule
-                    )
-                )
-        elif top == current_token:
+        top = stack.pop()
+        current_token = token_types[token_index]
+        if top < NON_TERMINAL_BASE:
+            if top != current_token:
+                raise _located(SyntaxError(
+                    "PARSER ERROR - Unexpected token {}".format(TOKEN_NAMES[current_token])
+                ), token_index)
             # Terminal symbol matches the current token, consume it and move to the next token
-            stack.pop()
             token_index += 1
-            if token_index >= len(tokens):
+            if token_index >= token_count:
                 break
+        # cross-referencing with production rules:
+        elif top < ACTION_BASE:
+            production = parse_table[top][current_token]
+            if production is None:
+                raise _located(SyntaxError('Parsing error: Unexpected token {}'.format(TOKEN_NAMES[current_token])), token_index)
+            stack.extend(production)
+        elif top < EXPRESSION_BASE:
+            actions[top - ACTION_BASE](tokens, token_index, values, symbols)
         else:
-            raise SyntaxError(
-                "PARSER ERROR - Unexpected token {}".format(current_token)
-            )
-    if token_index >= len(tokens) and not stack:
-        print("\nParser: Successful\n")
-        parser_passed = True
-        return parser_passed
+            token_index = _parse_expression(tokens, token_index, values, symbols, top == _CONDITION_SYMBOL)
+            if token_index >= token_count:
+                break
+    return _finish_parse(tokens, token_index, token_count, stack, values, symbols)
+
+
+def _finish_parse(tokens, token_index, token_count, stack, values, symbols):
+    # actions at the very end of a production are still on the stack after the last token:
+    actions = _ACTION_FUNCTIONS
+    while stack and ACTION_BASE <= stack[-1] < EXPRESSION_BASE:
+        actions[stack.pop() - ACTION_BASE](tokens, token_index, values, symbols)
+    if token_index >= token_count and not stack:
+        syntax_tree = Program(values)
+        return syntax_tree
     else:
-        parser_passed = False
-        return parser_passed
+        return None
+
+
+def _parse_tokens_recovering(tokens, errors, symbols):
+    """
+    parse_tokens() with panic-mode error recovery, so one pass finds every syntax error.
+
+    A token that doesn't match the terminal on top of the stack is reported and the
+    terminal taken as missing. A token with no production rule for the non-terminal on
+    top is reported, then tokens are skipped up to one that is in the FIRST set (the
+    non-terminal is tried again), the FOLLOW set (it's given up on) or a SEMI_COLON
+    (parsing starts over on a fresh statement after it). Tokens left over once the
+    program is complete are reported (once) and parsed as further statements, to check
+    those too.
+    After an error nothing more is reported until a token has matched, so one mistake
+    doesn't cascade into several errors.
+
+    Returns:
+        syntax_tree (Program): The parsed program, or None if there were any errors.
+    """
+    token_types = tokens.types
+    token_count = len(token_types)
+    parse_table = _build_parse_table()
+    actions = _ACTION_FUNCTIONS
+    stack = [START_SYMBOL]
+    values = []
+    token_index = 0
+    error_count = len(errors)
+    recovering = False
+    reported_extra = False
+    first_codes, follow_codes = _recovery_codes()
+    program_first = first_codes[START_SYMBOL]
+
+    def report(message, at=None):
+        # at the current token, unless another index is given:
+        at = token_index if at is None else at
+        line, column = tokens.location(at)
+        errors.append(Diagnostic("parse", "error", message, at, line, column))
+
+    while True:
+        current_token = token_types[token_index] if token_index < token_count else _END_OF_INPUT
+        found = TOKEN_NAMES[current_token] or "end of input"
+        if not stack:
+            if current_token == _END_OF_INPUT:
+                break
+            if not recovering and not reported_extra:
+                report(f"PARSER ERROR - Unexpected token {found} after the end of the program")
+                reported_extra = True
+            if current_token in program_first:
+                stack.append(START_SYMBOL)
+            else:
+                token_index += 1
+            continue
+        top = stack.pop()
+        if top < NON_TERMINAL_BASE:
+            if top == current_token:
+                token_index += 1
+                recovering = False
+            elif not recovering:
+                # carries on as if the expected token had been there:
+                report(f"PARSER ERROR - Expected {TOKEN_NAMES[top]} but found {found}")
+                recovering = True
+        elif top < ACTION_BASE:
+            production = parse_table[top][current_token]
+            if production is not None:
+                stack.extend(production)
+                continue
+            if not recovering:
+                report(f"PARSER ERROR - Unexpected token {found}")
+                recovering = True
+            first = first_codes[top]
+            follow = follow_codes[top]
+            while (
+                current_token not in first
+                and current_token not in follow
+                and current_token != _SEMI_COLON_CODE
+                and current_token != _END_OF_INPUT
+            ):
+                token_index += 1
+                current_token = token_types[token_index] if token_index < token_count else _END_OF_INPUT
+            if current_token in first:
+                stack.append(top)
+            elif current_token not in follow and current_token == _SEMI_COLON_CODE:
+                token_index += 1
+                stack = [START_SYMBOL]
+        elif top < EXPRESSION_BASE:
+            if len(errors) == error_count:
+                # once there's been an error the tokens no longer line up with the actions:
+                actions[top - ACTION_BASE](tokens, token_index, values, symbols)
+        elif token_index < token_count:
+            try:
+                start = token_index
+                token_index = _parse_expression(tokens, token_index, values, symbols, top == _CONDITION_SYMBOL)
+                recovering = False
+                if token_index >= token_count:
+                    unclosed = _unclosed_bracket(token_types, start)
+                    if unclosed is not None:
+                        # rather than a missing token at the end of input, which is all the stack has left:
+                        report(f"PARSER ERROR - Unclosed {TOKEN_NAMES[_LEFT_BRACKET_CODE]}, expected a "
+                               f"{TOKEN_NAMES[_RIGHT_BRACKET_CODE]} before the end of input", unclosed)
+                        recovering = True
+            except _ExpressionError as error:
+                # carries on from the token at fault, as if the expression had ended there:
+                token_index = error.token_index
+                if not recovering:
+                    found = TOKEN_NAMES[token_types[token_index]]
+                    report(f"PARSER ERROR - Expected {error.expected} but found {found}")
+                    recovering = True
+    if len(errors) > error_count:
+        return None
+    return Program(values)
+
+
+def _unclosed_bracket(token_types, start):
+    """
+    Helper function for _parse_tokens_recovering(), for an expression from start that
+    ran to the end of the tokens. Returns the index of the innermost LEFT_BRACKET that
+    was never closed, or None.
+    """
+    open_brackets = []
+    for index in range(start, len(token_types)):
+        code = token_types[index]
+        if code == _LEFT_BRACKET_CODE:
+            open_brackets.append(index)
+        elif code == _RIGHT_BRACKET_CODE and open_brackets:
+            open_brackets.pop()
+    return open_brackets[-1] if open_brackets else None
+
 
+class ParseProfile:
+    """
+    Counters filled in by parse_tokens(tokens, profile). They add up over every parse
+    the same profile is passed to.
+
+    Attributes:
+        parses (int): Number of parses profiled.
+        steps (int): Symbols popped off the parser stack.
+        max_stack_depth (int): Highest the parser stack has grown to.
+        rule_hits (dict): Production rule number -> times it was expanded.
+    """
+
+    __slots__ = ("parses", "steps", "max_stack_depth", "rule_hits")
 
-def semantic_analyzer(tokens):
+    def __init__(self):
+        self.parses = 0
+        self.steps = 0
+        self.max_stack_depth = 0
+        self.rule_hits = {}
+
+    def as_dict(self):
+        return {
+            "parses": self.parses,
+            "steps": self.steps,
+            "max_stack_depth": self.max_stack_depth,
+            "rule_hits": dict(sorted(self.rule_hits.items())),
+        }
+
+
+def _parse_tokens_profiled(tokens, profile, symbols):
+    # the same loop as parse_tokens(), counting as it goes:
+    token_index = 0
+    token_types = tokens.types
+    token_count = len(token_types)
+    parse_table = _build_parse_table()
+    actions = _ACTION_FUNCTIONS
+    stack = [START_SYMBOL]
+    values = []
+    steps = 0
+    max_depth = 1
+    expansions = {}  # (non-terminal, token code) -> count, turned into rule numbers at the end
+    try:
+        while stack:
+            steps += 1
+            top = stack.pop()
+            current_token = token_types[token_index]
+            if top < NON_TERMINAL_BASE:
+                if top != current_token:
+                    raise _located(SyntaxError(
+                        "PARSER ERROR - Unexpected token {}".format(TOKEN_NAMES[current_token])
+                    ), token_index)
+                token_index += 1
+                if token_index >= token_count:
+                    break
+            elif top < ACTION_BASE:
+                production = parse_table[top][current_token]
+                if production is None:
+                    raise _located(SyntaxError('Parsing error: Unexpected token {}'.format(TOKEN_NAMES[current_token])), token_index)
+                stack.extend(production)
+                if len(stack) > max_depth:
+                    max_depth = len(stack)
+                key = (top, current_token)
+                expansions[key] = expansions.get(key, 0) + 1
+            elif top < EXPRESSION_BASE:
+                actions[top - ACTION_BASE](tokens, token_index, values, symbols)
+            else:
+                token_index = _parse_expression(tokens, token_index, values, symbols, top == _CONDITION_SYMBOL)
+                if token_index >= token_count:
+                    break
+        return _finish_parse(tokens, token_index, token_count, stack, values, symbols)
+    finally:
+        profile.parses += 1
+        profile.steps += steps
+        profile.max_stack_depth = max(profile.max_stack_depth, max_depth)
+        rule_hits = profile.rule_hits
+        for (top, current_token), count in expansions.items():
+            rule = PARSING_TABLE[NON_TERMINALS[top - NON_TERMINAL_BASE]][TOKEN_NAMES[current_token]]
+            rule_hits[rule] = rule_hits.get(rule, 0) + count
+
+
+def semantic_analyzer(syntax_tree, symbols=None, warnings=None):
     '''
-    Checks whether the lexeme of the VARIABLE_NAME token contains any integers. 
+    Checks the program's variables with the symbol table filled in by the parser:
+    int variable names can't contain any integers, a variable can only be declared
+    once, and a while loop has to increment (x++) a variable in its condition.
 
+    Variables used in a condition or while loop without being declared are warnings,
+    not errors - a program is a single statement, so it has nowhere to declare them.
+    Every check reads the table rather than the tree, so each variable is looked at once.
+
+    Args:
+        syntax_tree (Program): The tree returned by parse_tokens().
+        symbols (SymbolTable): The table from parse_tokens(..., symbols=...). Built from
+        syntax_tree if not given.
+        warnings (list): If given, (token_index, message) is appended for each warning.
     Returns:
         semantic_passed (bool): Signifies the input has passed the analyser.
+    Raises:
+        Exception: raises on the first error found, with the token_index of the
+        declaration or counter at fault.
     '''
-    for token in tokens:
-        if token[0] == "VARIABLE_NAME":
-            if any(char.isdigit() for char in str(token[1])):
-                semantic_passed = False
-                raise Exception("ERROR - Variable name cannot contain any numbers.")
-        else:
-            semantic_passed = True
+    if symbols is None:
+        symbols = SymbolTable.from_tree(syntax_tree)
+    for name, token_index in symbols.declarations.items():
+        if any(char.isdigit() for char in name):
+            raise _located(Exception("ERROR - Variable name cannot contain any numbers."), token_index)
+    for name, token_index in symbols.duplicates:
+        raise _located(Exception(f"ERROR - Variable {name} is declared more than once."), token_index)
+    for counter, condition in symbols.counter_mismatches:
+        raise _located(Exception(
+            f"ERROR - While loop increments {counter.name}, which isn't in its condition {_condition_text(condition)}."
+        ), counter.token_index)
+    if warnings is not None:
+        for name, token_index in symbols.undeclared.items():
+            warnings.append((token_index, f"WARNING - Variable {name} is used without being declared."))
+    semantic_passed = True
     return semantic_passed
 
 
-def generate_code(tokens):
+def _divide(left, right):
+    """Integer division rounding towards zero, as in C (and bytecode.py)."""
+    quotient = abs(left) // abs(right)
+    return quotient if (left < 0) == (right < 0) else -quotient
+
+
+# Functions optimize_tree() evaluates operators with, indexed by token code:
+ARITHMETIC_FUNCTIONS = {
+    TokenType.ADD: operator.add,
+    TokenType.SUBTRACT: operator.sub,
+    TokenType.MULTIPLY: operator.mul,
+    TokenType.DIVIDE: _divide,
+}
+RELATIONAL_FUNCTIONS = {
+    TokenType.MORE_THAN: operator.gt,
+    TokenType.LESS_THAN: operator.lt,
+    TokenType.MORE_THAN_OR_EQUALS: operator.ge,
+    TokenType.LESS_THAN_OR_EQUALS: operator.le,
+    TokenType.EQUALS: operator.eq,
+    TokenType.NOT_EQUALS: operator.ne,
+}
+
+
+def _expression_words(expression, operators):
+    """
+    Helper function that writes out an expression with operators[code] between its
+    operands, bracketing an operand only where the operators' precedence needs it.
+    Works from an explicit stack, so expressions of any length can be written out.
+    """
+    precedences = _PRECEDENCES
+    words = []
+    pending = [expression]
+    while pending:
+        item = pending.pop()
+        kind = type(item)
+        if kind is str:
+            words.append(item)
+        elif kind is Number:
+            words.append(item.value)
+        elif kind is Variable:
+            words.append(item.name)
+        else:
+            precedence = precedences[item.operator]
+            left, right = item.left, item.right
+            if type(right) is ArithmeticExpression and precedences[right.operator] <= precedence:
+                pending.extend((")", right, "("))
+            else:
+                pending.append(right)
+            pending.append(operators[item.operator])
+            if type(left) is ArithmeticExpression and precedences[left.operator] < precedence:
+                pending.extend((")", left, "("))
+            else:
+                pending.append(left)
+    return "".join(words)
+
+
+# operators as they're written in the source, indexed by token code:
+_SOURCE_OPERATORS = tuple(lexeme and f" {lexeme} " for lexeme in FIXED_LEXEMES)
+
+
+def _expression_text(expression):
+    """Helper function for optimize_tree() that writes an expression as it is in the source."""
+    return _expression_words(expression, _SOURCE_OPERATORS)
+
+
+def _condition_text(condition):
+    """Helper function for optimize_tree() that writes a Condition as it is in the source."""
+    return f"({_expression_text(condition.left)}{_SOURCE_OPERATORS[condition.operator]}{_expression_text(condition.right)})"
+
+
+def _fold_expression(expression, optimizations):
+    """
+    Helper function for optimize_tree() that replaces every part of an expression made
+    only of numbers with a Number holding its value, adding a message to optimizations
+    for each part replaced. Returns the expression, which is a new Number if all of it
+    was folded.
+    """
+    folded = []  # (node, value) for each operand worked out, value None unless it's a constant
+    pending = [expression]
+    while pending:
+        item = pending.pop()
+        kind = type(item)
+        if kind is ArithmeticExpression:
+            pending.append((item,))  # combines its operands once both are worked out
+            pending.append(item.right)
+            pending.append(item.left)
+        elif kind is tuple:
+            node = item[0]
+            right, right_value = folded.pop()
+            left, left_value = folded.pop()
+            value = None
+            if left_value is not None and right_value is not None:
+                # dividing by zero is left as it is, to fail when it's run:
+                if not (node.operator == TokenType.DIVIDE and right_value == 0):
+                    value = ARITHMETIC_FUNCTIONS[node.operator](left_value, right_value)
+            if value is None:
+                # this node stays, so any operand that is a constant is folded on its own:
+                node.left = _folded_number(left, left_value, optimizations)
+                node.right = _folded_number(right, right_value, optimizations)
+            folded.append((node, value))
+        elif kind is Number:
+            folded.append((item, int(item.value)))
+        else:
+            folded.append((item, None))
+    return _folded_number(*folded.pop(), optimizations)
+
+
+def _folded_number(node, value, optimizations):
+    """Helper function for _fold_expression() that replaces a constant expression with a Number."""
+    if value is None or type(node) is Number:
+        return node
+    optimizations.append((node.token_index, f"Folded {_expression_text(node)} to {value}."))
+    return Number(str(value), node.token_index)
+
+
+def _constant_condition(condition):
+    """Helper function for optimize_tree(): True or False for NUMBER <rel_op> NUMBER, else None."""
+    if type(condition.left) is Number and type(condition.right) is Number:
+        return RELATIONAL_FUNCTIONS[condition.operator](int(condition.left.value), int(condition.right.value))
+    return None
+
+
+def optimize_tree(syntax_tree):
     '''
-    Loops through the tokens tuple and consumes the token values (lexemes) when matches are found.
-    It then prints these lexemes to the console. 
+    Folds constant arithmetic and removes branches that can never run, changing the
+    syntax tree in place. Runs between semantic_analyzer() and generate_code(), when
+    asked for with compile_source(source, optimize=True).
+
+    Args:
+        syntax_tree (Program): The tree returned by parse_tokens().
+    Returns:
+        optimizations (list): (token_index, message) for each change made, in source order.
+    '''
+    optimizations = []
+    # blocks are handled from an explicit stack, so nesting depth isn't limited, and
+    # each statement is looked at once:
+    pending = [syntax_tree.statements]
+    while pending:
+        block = pending.pop()
+        optimized = []
+        statements = block[::-1]
+        while statements:
+            statement = statements.pop()
+            kind = type(statement)
+            if kind is ArithmeticExpression:
+                optimized.append(_fold_expression(statement, optimizations))
+            elif kind is IfStatement:
+                # a branch whose condition is always false is removed, and one that is
+                # always true becomes the else block, removing every branch after it. If
+                # only the else block is left, it replaces the if statement.
+                branches = []
+                else_block = statement.else_block
+                keyword = "if"
+                for number, (condition, branch_block) in enumerate(statement.branches):
+                    if number:
+                        keyword = "elif"
+                    condition.left = _fold_expression(condition.left, optimizations)
+                    condition.right = _fold_expression(condition.right, optimizations)
+                    constant = _constant_condition(condition)
+                    if constant is None:
+                        branches.append((condition, branch_block))
+                        continue
+                    if not constant:
+                        optimizations.append((
+                            condition.token_index,
+                            f"Removed {keyword} branch, its condition {_condition_text(condition)} is always false.",
+                        ))
+                        continue
+                    # every branch after this one, and the else block, can't run:
+                    text = _condition_text(condition)
+                    for later, _ in statement.branches[number + 1 :]:
+                        optimizations.append((
+                            later.token_index,
+                            f"Removed elif branch, it comes after {text}, which is always true.",
+                        ))
+                    if else_block:
+                        optimizations.append((
+                            else_block[0].token_index,
+                            f"Removed else block, it comes after {text}, which is always true.",
+                        ))
+                    else_block = branch_block
+                    if not branches:
+                        optimizations.append((
+                            statement.token_index,
+                            f"Replaced if statement with the block of {keyword} {text}, which is always true.",
+                        ))
+                    break
+                if branches:
+                    statement.branches = branches
+                    statement.else_block = else_block
+                    optimized.append(statement)
+                    pending.extend(branch_block for _, branch_block in branches)
+                    if else_block:
+                        pending.append(else_block)
+                elif else_block:
+                    if else_block is statement.else_block:
+                        optimizations.append((
+                            statement.token_index,
+                            "Replaced if statement with its else block, none of its conditions can be true.",
+                        ))
+                    statements.extend(reversed(else_block))  # optimized in this block instead
+            elif kind is WhileLoop:
+                condition = statement.condition
+                condition.left = _fold_expression(condition.left, optimizations)
+                condition.right = _fold_expression(condition.right, optimizations)
+                if _constant_condition(condition) is False:
+                    optimizations.append((
+                        statement.token_index,
+                        f"Removed while loop, its condition {_condition_text(statement.condition)} is always false.",
+                    ))
+                    continue
+                optimized.append(statement)
+                pending.append(statement.block)
+            else:
+                optimized.append(statement)
+        block[:] = optimized
+    optimizations.sort(key=lambda optimization: optimization[0])
+    return optimizations
+
+
+# Pseudo code written out for keywords and operators by generate_code(), indexed by token code:
+PSEUDO_CODE_FRAGMENTS = [""] * len(TOKEN_NAMES)
+for token_type, fragment in [
+    (TOKEN_IF, "IF "),
+    (TOKEN_MORE_THAN, " IS MORE THAN "),
+    (TOKEN_LESS_THAN_OR_EQUALS, " IS LESS THAN OR EQUAL TO "),
+    (TOKEN_MORE_THAN_OR_EQUALS, " IS MORE THAN OR EQUAL TO "),
+    (TOKEN_EQUALS, " IS EQUAL TO "),
+    (TOKEN_NOT_EQUALS, " IS NOT EQUAL TO "),
+    (TOKEN_LESS_THAN, " IS LESS THAN "),
+    (TOKEN_ELIF, "ELSE IF "),
+    (TOKEN_INCREMENT, "++ "),
+    (TOKEN_ELSE, "ELSE"),
+    (TOKEN_ADDITION, " ADDED TO "),
+    (TOKEN_SUBTRACT, " SUBTRACT "),
+    (TOKEN_DIVIDE, " DIVIDED BY "),
+    (TOKEN_MULTIPLY, " MULTIPLIED BY "),
+    (TOKEN_WHILE, "WHILE "),
+]:
+    PSEUDO_CODE_FRAGMENTS[TOKEN_CODES[token_type]] = fragment
+
+
+def _condition_code(condition):
+    """Helper function for generate_code() that writes out a Condition."""
+    return (
+        _expression_words(condition.left, PSEUDO_CODE_FRAGMENTS)
+        + PSEUDO_CODE_FRAGMENTS[condition.operator]
+        + _expression_words(condition.right, PSEUDO_CODE_FRAGMENTS)
+    )
+
+
+_IF_CODE = TokenType.IF
+_ELIF_CODE = TokenType.ELIF
+_ELSE_CODE = TokenType.ELSE
+_WHILE_CODE = TokenType.WHILE
+_INCREMENT_CODE = TokenType.INCREMENT
 
-    I chose to use a for loop for this function over the while loop we went over in class as it removes the need to manually
-    move the index and only captures the specific tokens it's looking for, rathering than 'skipping'
-    over those it doesn't need.
+
+# Indentation added by generate_code() for the lines inside a block, as
+# (statement lines, if/else lines) - inside a while loop, if statements sit one
+# column further in than print statements and the counter.
+IF_BLOCK_INDENT = (3, 3)
+ELIF_BLOCK_INDENT = (6, 6)  # for if statements with an elif
+WHILE_BLOCK_INDENT = (2, 3)
+
+
+def generate_code(syntax_tree):
+    '''
+    Walks the syntax tree once and writes out pseudo code for each statement in source order.
 
     Args:
-        tokens (tuple): A tuple containing tokens and lexemes.
+        syntax_tree (Program): The tree returned by parse_tokens().
+    Returns:
+        pseudo_code (str): The generated pseudo code.
     Raises:
-        Exception: raises if any part of the generator code fails. 
+        Exception: raises if any part of the generator code fails, with the token_index
+        of the statement it was writing, if it got that far.
     '''
+    statement = None
+    try:
+        pseudo_code = io.StringIO()
+        write = pseudo_code.write
+        fragments = PSEUDO_CODE_FRAGMENTS
+        # every line is written straight into one buffer, so the time taken is linear in
+        # the size of the output. Blocks are expanded in place on this stack rather than
+        # by recursion, so deep nesting doesn't hit the recursion limit, and indentation
+        # comes from the blocks a statement is in (see IF_BLOCK_INDENT etc).
+        # (statement, indent, if_indent, in_if_block) still to be written out, last first,
+        # along with lines that are already worked out (as plain strings):
+        pending = [(statement, 0, 0, False) for statement in reversed(syntax_tree.statements)]
+        while pending:
+            item = pending.pop()
+            if type(item) is str:
+                write(item)
+                continue
+            statement, indent, if_indent, in_if_block = item
+            kind = type(statement)
+            if kind is PrintStatement:
+                write(f"\n{' ' * indent}PRINT {statement.text} ")
+            elif kind is IntDeclaration:
+                write(f"INT {statement.name} {statement.value.value}")
+            elif kind is ArithmeticExpression or kind is Number or kind is Variable:
+                # bracketed only where the order of the operators needs it:
+                write(_expression_words(statement, fragments))
+            elif kind is IfStatement:
+                margin = "\n" + " " * if_indent
+                block_indent, block_if_indent = (
+                    ELIF_BLOCK_INDENT if len(statement.branches) > 1 else IF_BLOCK_INDENT
+                )
+                block_context = (indent + block_indent, if_indent + block_if_indent, True)
+                lines = []
+                keyword = fragments[_IF_CODE]
+                for condition, block in statement.branches:
+                    lines.append(margin + keyword + _condition_code(condition))
+                    lines.extend((nested,) + block_context for nested in block)
+                    keyword = fragments[_ELIF_CODE]
+                if statement.else_block:
+                    lines.append(margin + fragments[_ELSE_CODE])
+                    lines.extend((nested,) + block_context for nested in statement.else_block)
+                if not in_if_block:
+                    # an if statement directly inside another's block shares its END IF:
+                    lines.append(margin + "END IF")
+                pending.extend(reversed(lines))
+            elif kind is WhileLoop:
+                margin = "\n" + " " * if_indent
+                block_indent, block_if_indent = WHILE_BLOCK_INDENT
+                block_context = (indent + block_indent, if_indent + block_if_indent, False)
+                lines = [margin + fragments[_WHILE_CODE] + _condition_code(statement.condition)]
+                lines.extend((nested,) + block_context for nested in statement.block)
+                lines.append(
+                    "\n" + " " * (indent + block_indent) + statement.counter.name + fragments[_INCREMENT_CODE]
+                )
+                if any(type(nested) is IfStatement for nested in statement.block):
+                    lines.append("\n")  # blank line after a nested if statement
+                lines.append(margin + "END WHILE")
+                pending.extend(reversed(lines))
+        return pseudo_code.getvalue()
+    except Exception as e:
+        raise _located(Exception(
+            "ERROR - Code generator has failed."
+        ), getattr(statement, "token_index", None))
+
+
+# Stages of a compilation, in the order they run:
+# (optimize only runs when asked for, see optimize_tree())
+STAGES = ("tokenize", "parse", "semantic", "optimize", "generate")
+STAGE_PASSED = "passed"
+STAGE_FAILED = "failed"
+STAGE_NOT_RUN = "not run"
+
+TOKENIZATION_FAILED = "ERROR - Tokenization has failed. Review any ValueErrors and ensure the input string is not empty."
+
+
+class Diagnostic(
+    namedtuple(
+        "Diagnostic",
+        ["stage", "severity", "message", "token_index", "line", "column"],
+        defaults=(None, None, None),
+    )
+):
+    """
+    A problem found while compiling.
+
+    Args:
+        stage (str): One of STAGES.
+        severity (str): "error", "warning", or "info" for changes made by optimize_tree().
+        message (str): Description of the problem.
+        token_index (int): Index of the token at fault, if known. Invalid tokens
+        aren't kept in the token buffer, so don't have one.
+        line, column (int): Where in the source the problem is, counted from 1, if known.
+    """
+    __slots__ = ()
+
+    def describe(self, path):
+        """Returns the diagnostic as a "path:line:column: stage severity: message" line."""
+        location = path if self.line is None else f"{path}:{self.line}:{self.column}"
+        return f"{location}: {self.stage} {self.severity}: {self.message}"
+
+
+class CompileResult:
+    """
+    Everything a compilation produced, returned by compile_source().
+
+    Compiling never prints or raises for errors in the input: each stage's status is
+    recorded in stages, problems in diagnostics, and the first error in error, so it
+    can still be raised by raise_for_error().
+
+    Attributes:
+        tokens (TokenBuffer): The tokens, or None if tokenization failed.
+        syntax_tree (Program): The parsed program, or None.
+        symbols (SymbolTable): The program's variables, filled in while parsing, or None.
+        pseudo_code (str): The generated pseudo code, or None.
+        stages (dict): Maps each of STAGES to STAGE_PASSED, STAGE_FAILED or STAGE_NOT_RUN.
+        diagnostics (list): Diagnostic tuples, in the order they were found.
+        error (Exception): The exception that stopped compilation, or None.
+    """
 
+    __slots__ = ("tokens", "syntax_tree", "symbols", "pseudo_code", "stages", "diagnostics", "error")
+
+    def __init__(self, tokens=None, syntax_tree=None, pseudo_code=None):
+        self.tokens = tokens
+        self.syntax_tree = syntax_tree
+        self.symbols = None
+        self.pseudo_code = pseudo_code
+        self.stages = dict.fromkeys(STAGES, STAGE_NOT_RUN)
+        self.diagnostics = []
+        self.error = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def fail(self, stage, error, message=None, token_index=None, line=None, column=None):
+        """
+        Marks stage as failed because of error (message defaults to the error's own).
+        Only the first error is kept to raise, later ones just add diagnostics.
+        If token_index isn't given it's taken from the error, as raised by the parser,
+        semantic analyser and generator, and the line and column looked up from it.
+        """
+        self.stages[stage] = STAGE_FAILED
+        if token_index is None:
+            token_index = getattr(error, "token_index", None)
+        if line is None and token_index is not None and self.tokens is not None:
+            line, column = self.tokens.location(token_index)
+        self.diagnostics.append(
+            Diagnostic(stage, "error", message or str(error), token_index, line, column)
+        )
+        if self.error is None:
+            self.error = error
 
-    def check_if_statement(str, pattern):
-        '''
-        Helper function to check whether there's a nested if
-        statement within another if statement
-        '''
-        if str.count(pattern) >= 3:
-            return True
+    def add_diagnostics(self, stage, severity, found):
+        """Adds a diagnostic for each (token_index, message) in found, located in the source."""
+        for token_index, message in found:
+            line, column = self.tokens.location(token_index)
+            self.diagnostics.append(Diagnostic(stage, severity, message, token_index, line, column))
+
+    def raise_for_error(self):
+        """Raises the exception that stopped compilation, if there was one."""
+        if self.error is not None:
+            raise self.error
+
+    def report(self):
+        """
+        Returns:
+            report (str): The stage by stage output compile_input() prints when verbose.
+        """
+        report = io.StringIO()
+        if self.stages["tokenize"] != STAGE_PASSED:
+            return ""
+        report.write("\nTokeniser: Successful. See tokens:\n\n")
+        for token in self.tokens:
+            report.write(f"{token}\n")
+        if self.stages["parse"] == STAGE_PASSED:
+            report.write("\nParser: Successful\n\n")
+        if self.stages["generate"] == STAGE_PASSED:
+            # the semantic analyser's message has always come after the generator has run:
+            report.write("\nSemantic analyser: Successful\n\n")
+            report.write("\nGenerator: Successful. See code generated:\n\n")
+            report.write(self.pseudo_code + "\n\n")
+        return report.getvalue()
+
+
+class CompileHooks:
+    """
+    Base class for instrumenting compile_source(..., hooks=...); see compile_profile.py.
+
+    stage_start() and stage_end() are called around each of STAGES that runs, and
+    parse_profile, if set to a ParseProfile, is passed on to parse_tokens(). Without
+    hooks none of this is done, so it costs nothing.
+    """
+
+    parse_profile = None
+
+    def stage_start(self, stage, result):
+        pass
+
+    def stage_end(self, stage, result):
+        """Called once the stage has passed or failed, see result.stages[stage]."""
+        pass
+
+
+def compile_source(source, cache=None, hooks=None, recover=False, optimize=False, last_stage="generate"):
+    '''
+    Compiles source without printing anything or raising for errors in it.
+
+    Args:
+        source (str): The source text, or bytes, an mmap, a text file object or an
+        iterable of string chunks.
+        cache (compile_cache.CompileCache): Optional cache of previous compilations.
+        hooks (CompileHooks): Optional hooks called around each stage that runs.
+        recover (bool): Report every invalid token and syntax error, not just the first.
+        optimize (bool): Run optimize_tree() before generating the pseudo code.
+        last_stage (str): One of STAGES to stop after, eg "semantic" to only check the program.
+    Returns:
+        result (CompileResult): The tokens, syntax tree and pseudo code, with the status
+        of each stage and any diagnostics.
+    '''
+    # only complete, unoptimized compilations of a str are cached (and hits run no
+    # stages, so call no hooks):
+    cacheable = cache is not None and isinstance(source, str) and not optimize and last_stage == "generate"
+    if cacheable:
+        cached = cache.get(source)
+        if cached is not None:
+            tokens, syntax_tree, pseudo_code, symbols, diagnostics = cached
+            result = CompileResult(tokens, syntax_tree, pseudo_code)
+            result.symbols = symbols
+            result.diagnostics = diagnostics
+            result.stages = dict.fromkeys(STAGES, STAGE_PASSED)
+            result.stages["optimize"] = STAGE_NOT_RUN
+            return result
+    result = CompileResult()
+    invalid_tokens = [] if recover else None
+    if hooks is not None:
+        hooks.stage_start("tokenize", result)
+    try:
+        if isinstance(source, str):
+            result.tokens = tokenize_string(source, invalid_tokens)
+        elif isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+            # tokenized without decoding it first:
+            result.tokens = tokenize_bytes(source)
         else:
-            return False
+            result.tokens = tokenize_stream_buffer(source)
+    except Exception as e:
+        # reported with the tokenizer's own message, but raised as it always has been:
+        error = Exception(TOKENIZATION_FAILED)
+        error.__context__ = e
+        result.fail("tokenize", error, str(e))
+        if hooks is not None:
+            hooks.stage_end("tokenize", result)
+        return result
+    for start, end in invalid_tokens or ():
+        message = f"ERROR - The input contains the following invalid tokens: '{source[start:end]}'"
+        error = Exception(TOKENIZATION_FAILED)
+        error.__context__ = ValueError(message)
+        line, column = result.tokens.offset_location(start)
+        result.fail("tokenize", error, message, None, line, column)
+    compile_stages(result, hooks, recover, optimize, last_stage)
+    if cacheable and result.ok:
+        cache.put(source, result.tokens, result.syntax_tree, result.pseudo_code, result.symbols, result.diagnostics)
+    return result
+
+
+def compile_stages(result, hooks=None, recover=False, optimize=False, last_stage="generate"):
+    '''
+    Runs the parser, semantic analyser, and code generator over result.tokens,
+    filling in the rest of result. Shared by compile_source() and compile_tokens().
 
+    Each stage only runs if the previous stage (eg parser) has been successfully completed:
+    an empty token buffer, or a stage that raises, stops the compilation there.
+    hooks (CompileHooks) are told where each stage ends, including tokenize, which
+    is only finished once the tokens are known not to be empty.
+    If result already has a syntax tree (see compile_incremental.py) it isn't parsed again,
+    and if its semantic stage is already STAGE_PASSED it isn't analysed again either.
+    With recover, tokens that are left after a failed tokenize are still parsed (see
+    compile_source()), and every syntax error is added to result.diagnostics.
+    With optimize, optimize_tree() runs between the semantic analyser and the generator.
+    No stage after last_stage runs.
+    '''
+    runs = STAGES[: STAGES.index(last_stage) + 1]
+    if result.stages["tokenize"] == STAGE_FAILED:
+        pass  # invalid tokens found by compile_source(..., recover=True)
+    elif not result.tokens:
+        result.fail("tokenize", ValueError(
+            "ERROR - The input string contains only comments, please review."
+        ))
+    else:
+        result.stages["tokenize"] = STAGE_PASSED
+    if hooks is not None:
+        hooks.stage_end("tokenize", result)
+    if (not result.ok and not (recover and result.tokens)) or "parse" not in runs:
+        return result
+    # Calling parser function, unless the tree was kept from an earlier compilation:
+    if result.syntax_tree is not None:
+        result.stages["parse"] = STAGE_PASSED
+    else:
+        if hooks is not None:
+            hooks.stage_start("parse", result)
+        syntax_errors = [] if recover else None
+        result.symbols = SymbolTable()
+        try:
+            result.syntax_tree = parse_tokens(
+                result.tokens, hooks.parse_profile if hooks is not None else None, syntax_errors, result.symbols
+            )
+            if syntax_errors:
+                for diagnostic in syntax_errors:
+                    result.fail("parse", SyntaxError(diagnostic.message), *diagnostic[2:])
+            elif not result.syntax_tree:
+                # the tokens ran out part way through the program:
+                line, column = result.tokens.location(len(result.tokens))
+                result.fail("parse", Exception("ERROR - Parser has failed."), None, None, line, column)
+            else:
+                result.stages["parse"] = STAGE_PASSED
+        except Exception as e:
+            result.fail("parse", e)
+        if hooks is not None:
+            hooks.stage_end("parse", result)
+        if not result.ok:
+            return result
+    if "semantic" not in runs:
+        return result
+    # Calling semantic analyser, unless its result was kept too:
+    if result.stages["semantic"] != STAGE_PASSED:
+        if hooks is not None:
+            hooks.stage_start("semantic", result)
+        warnings = []
+        try:
+            semantic_analyzer(result.syntax_tree, result.symbols, warnings)
+            result.add_diagnostics("semantic", "warning", warnings)
+            result.stages["semantic"] = STAGE_PASSED
+        except Exception as e:
+            result.fail("semantic", e)
+        if hooks is not None:
+            hooks.stage_end("semantic", result)
+    if not result.ok or "optimize" not in runs:
+        return result
+    # Calling optimizer, if asked for:
+    if optimize:
+        if hooks is not None:
+            hooks.stage_start("optimize", result)
+        try:
+            result.add_diagnostics("optimize", "info", optimize_tree(result.syntax_tree))
+            result.stages["optimize"] = STAGE_PASSED
+        except Exception as e:
+            result.fail("optimize", e)
+        if hooks is not None:
+            hooks.stage_end("optimize", result)
+        if not result.ok:
+            return result
+    if "generate" not in runs:
+        return result
+    # Calling generator:
+    if hooks is not None:
+        hooks.stage_start("generate", result)
     try:
-        pseudo_code = []
-        for t in tokens:
-            # Appends most tokens to be printed:
-            token = t[0]
-            lexeme = t[1]
-            if token == 'PRINT':
-                print_value = lexeme.replace("printf('", "")
-                print_value = print_value.replace("')", "")
-                pseudo_code.append(f"\nPRINT {print_value} ")
-            elif token == 'VARIABLE_NAME':
-                pseudo_code.append(f"INT {lexeme} ")
-            elif token == 'NUMBER':
-                pseudo_code.append(f"{lexeme}")
-            elif token == 'IF':
-                pseudo_code.append("\nIF ")
-            elif token == 'MORE_THAN':
-                pseudo_code.append(f" IS MORE THAN ")
-            elif token == 'LESS_THAN_OR_EQUALS':
-                pseudo_code.append(f" IS LESS THAN OR EQUAL TO ")
-            elif token == 'MORE_THAN_OR_EQUALS':
-                pseudo_code.append(f" IS MORE THAN OR EQUAL TO ")
-            elif token == 'EQUALS':
-                pseudo_code.append(f" IS EQUAL TO ")
-            elif token == 'NOT_EQUALS':
-                pseudo_code.append(f" IS NOT EQUAL TO ")
-            elif token == 'LESS_THAN':
-                pseudo_code.append(f" IS LESS THAN ")
-            elif token == 'LETTERS':
-                pseudo_code.append(f"{lexeme}")
-            elif token == 'ELIF':
-                pseudo_code.append(f"\nELSE IF ")
-            elif token == 'INCREMENT':
-                pseudo_code.append(f"++ ")
-            elif token == 'ELSE':
-                pseudo_code.append(f"\nELSE")
-            elif token == 'ADD':
-                pseudo_code.append(f" ADDED TO ")
-            elif token == 'SUBTRACT':
-                pseudo_code.append(f" SUBTRACT ")
-            elif token == 'DIVIDE':
-                pseudo_code.append(f" DIVIDED BY ")
-            elif token == 'MULTIPLY':
-                pseudo_code.append(f" MULTIPLIED BY ")
-            elif token == 'WHILE':
-                pseudo_code.append(f"\nWHILE ")
-        pseudo_code = [str(i) for i in pseudo_code]
-        pseudo_code_str = ''.join(pseudo_code)
-        '''
-        The following code makes sure the pseudo code is properly
-        indented depending on what type of expression is being passed
-        '''
-        if_str = "IF"
-        while_str = "WHILE"
-        end_if_str = "END IF"
-        end_while_str = "END WHILE"
-        nested_if_statements = False
-        # Printing if statement:
-        if if_str in pseudo_code_str:
-            pseudo_code_str = pseudo_code_str.replace("PRINT", "   PRINT")
-            pseudo_code_str = pseudo_code_str + "\n" + end_if_str
-            nested_if_statements = check_if_statement(pseudo_code_str, if_str)
-        '''
-        Following code checks whether there is a nested if statement within an if statement and indented 
-        the second if statement accordingly
-        '''    
-        if nested_if_statements:
-            matches = re.finditer(if_str, pseudo_code_str)
-            match_positions = [match.start() for match in matches]
-            if len(match_positions) >= 2:
-                second_index = match_positions[1]
-            pseudo_code_str = pseudo_code_str[:second_index] + "   " + pseudo_code_str[second_index:]
-            pseudo_code_str = pseudo_code_str.replace("PRINT", "   PRINT")
-            pseudo_code_str = pseudo_code_str.replace("ELSE    IF", "ELSE IF")
-        # Printing while loop:
-        if while_str in pseudo_code_str:
-            # Indenting:
-            pseudo_code_str = pseudo_code_str.replace("IF", "   IF")
-            pseudo_code_str = pseudo_code_str.replace("ELSE", "   ELSE")
-            pseudo_code_str = pseudo_code_str.replace("PRINT", "  PRINT")
-            pseudo_code_str = pseudo_code_str.replace("END    IF", "   END IF")
-            pseudo_code_str = pseudo_code_str + "\n" + end_while_str
-            # Making sure increment is on the same line within while loop:
-            increment_pattern = r'(.)(?=\+\+)'
-            match = re.search(increment_pattern, pseudo_code_str)
-            if match:
-                '''
-                The increment pattern (eg 'x++') in a while loop was challenging to indent
-                while not disrupting the indented pattern of an 'if' statement if
-                present in the while loop. This logic executes when the increment 
-                pattern is found and ensures the indents are in the correct location for that instance:
-                '''
-                pseudo_code_str = pseudo_code_str.replace("   END IF","")
-                i = match.start(1)
-                if if_str in pseudo_code_str:
-                    pseudo_code_str = pseudo_code_str[:i] + "\n   END IF"+"\n  " + pseudo_code_str[i:] 
-                else:
-                    pseudo_code_str = pseudo_code_str[:i] + "\n  " + pseudo_code_str[i:] 
-        print(pseudo_code_str + "\n")
+        result.pseudo_code = generate_code(result.syntax_tree)
+        result.stages["generate"] = STAGE_PASSED
     except Exception as e:
-        raise Exception(
-            "ERROR - Code generator has failed."
-        )
+        result.fail("generate", e)
+    if hooks is not None:
+        hooks.stage_end("generate", result)
+    return result
 
 
-def compile_input(input_string):
+def compile_input(input_string, cache=None, verbose=True, hooks=None):
     '''
     Passes an input string to the tokenizer, parser, semantic analyser, and code generator.
 
     The function checks whether the previous stage (eg parser) 
     has been successfully completed before moving on to the next stage (eg semantic).
-    It does this by checking for the True value of returned boolean variables from
-    the various functions (with the exception of tokenize_string() as that's returning a tuple
-    needed for the other functions)
+    See compile_source() for the version that returns a CompileResult instead of
+    printing and raising.
+
+    input_string can also be a text file object or an iterable of string chunks, which
+    compile_source() lexes with tokenize_stream_buffer(): the whole stream is read in
+    (and kept, for the locations of diagnostics) before the later stages run.
 
+    If a cache (compile_cache.CompileCache) is passed, strings that have been compiled
+    before are printed from the cache without running any of the stages.
+    hooks (CompileHooks), eg a compile_profile.Profiler, are called around each stage.
+
+    Returns:
+        pseudo_code (str): The generated pseudo code.
     Raises:
         Exception: if input is empty.
         ValueError: if input contains only comments.
     '''
-    # Calling tokeniser function:
-    try:
-        tokens = tokenize_string(input_string)
-    except Exception as e:
-        raise Exception(
-            "ERROR - Tokenization has failed. Review any ValueErrors and ensure the input string is not empty."
-        )
-    if tokens:
-        print("\nTokeniser: Successful. See tokens:\n")
-        print_tokens(tokens)
-        # Calling parser function:
-        parser_passed = parse_tokens(tokens)
-    else:
-        raise ValueError(
-            "ERROR - The input string contains only comments, please review."
-        )
-    if parser_passed:
-        # Calling semantic analyser:
-        semantic_passed = semantic_analyzer(tokens)
-        if semantic_passed:
-            print("\nSemantic analyser: Successful\n")
-            print("\nGenerator: Successful. See code generated:\n")
-            # Calling generator:
-            generate_code(tokens)
-    else:
-        raise Exception("ERROR - Parser has failed.")
+    result = compile_source(input_string, cache, hooks)
+    if verbose:
+        print(result.report(), end="")
+    result.raise_for_error()
+    return result.pseudo_code
+
+
+def compile_file(path, verbose=True):
+    '''
+    Compiles a source file by memory-mapping it and tokenizing the mapped bytes.
+
+    The file is never read into a str - tokenize_bytes() works on the mapping and
+    lexemes are only decoded when a later stage uses them. The mapping is closed
+    once the generator has finished.
+
+    Args:
+        path (str): Path to a UTF-8 encoded source file.
+        verbose (bool): Print each stage's output, as compile_input() does.
+    Returns:
+        pseudo_code (str): The generated pseudo code.
+    Raises:
+        Exception: if tokenization fails.
+        ValueError: if the file contains only comments.
+    '''
+    with open(path, "rb") as source_file:
+        if os.fstat(source_file.fileno()).st_size == 0:
+            source = b""  # empty files can't be mapped
+        else:
+            source = mmap.mmap(source_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            result = compile_source(source)
+            if verbose:
+                print(result.report(), end="")
+            result.raise_for_error()
+            return result.pseudo_code
+        finally:
+            if isinstance(source, mmap.mmap):
+                source.close()
+
+
+def compile_tokens(tokens, verbose=True):
+    '''
+    Passes already tokenized input to the parser, semantic analyser, and code generator.
+    Each stage's output is printed, unless verbose is False.
+
+    Returns:
+        (syntax_tree, pseudo_code): The results of the parser and generator.
+    Raises:
+        ValueError: if there are no tokens (the input contained only comments).
+        Exception: if the parser fails.
+    '''
+    result = compile_stages(CompileResult(tokens))
+    if verbose:
+        print(result.report(), end="")
+    result.raise_for_error()
+    return result.syntax_tree, result.pseudo_code
 
 
 def main():
@@ -598,5 +2545,57 @@ def main():
     compile_input(test_if_statement_1)
 
 
+def run_cli(arguments=None):
+    '''
+    Command line wrapper around compile_source(): prints only the pseudo code, or with
+    --verbose the output of every stage as compile_input() prints it. Errors go to stderr.
+    Without any paths, runs main() instead.
+
+    --tokens-only prints each file's tokens instead, and --check-only prints nothing but
+    the errors, stopping after the tokenizer or semantic analyser so the later stages'
+    tables are never built.
+
+    Returns:
+        status (int): Exit status, 1 if any file failed to compile.
+    '''
+    import argparse  # only here, as importing it takes longer than compiling a small program
+
+    parser = argparse.ArgumentParser(description="Compile source files to pseudo code.")
+    parser.add_argument("paths", nargs="*", help="source files to compile")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="print the tokens and each stage's status as well as the code")
+    parser.add_argument("--all-errors", action="store_true",
+                        help="report every invalid token and syntax error, not just the first")
+    parser.add_argument("-O", "--optimize", action="store_true",
+                        help="fold constant arithmetic and remove branches that can't run, reporting each change")
+    modes = parser.add_mutually_exclusive_group()
+    modes.add_argument("--tokens-only", action="store_const", dest="last_stage", const="tokenize",
+                       default="generate", help="only tokenize, printing the tokens")
+    modes.add_argument("--check-only", action="store_const", dest="last_stage", const="semantic",
+                       help="only tokenize, parse and check the program, printing just the errors")
+    options = parser.parse_args(arguments)
+    if not options.paths:
+        main()
+        return 0
+    status = 0
+    for path in options.paths:
+        with open(path, encoding=SOURCE_ENCODING) as source_file:
+            result = compile_source(
+                source_file.read(), recover=options.all_errors, optimize=options.optimize, last_stage=options.last_stage
+            )
+        if options.verbose:
+            sys.stdout.write(result.report())
+        elif options.last_stage == "tokenize":
+            if result.tokens is not None:
+                sys.stdout.writelines(f"{token}\n" for token in result.tokens)
+        elif result.ok and options.last_stage == "generate":
+            sys.stdout.write(result.pseudo_code + "\n")
+        for diagnostic in result.diagnostics:
+            sys.stderr.write(diagnostic.describe(path) + "\n")
+        if not result.ok:
+            status = 1
+    return status
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(run_cli())
\ No newline at end of file
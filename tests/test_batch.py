@@ -0,0 +1,54 @@
+"""Checks compile_many() and compile_many_files() keep their inputs in order and report errors per input."""
+import pytest
+
+import compile_batch
+import compiler
+
+
+SOURCES = ["int x = 5;", "if (a > b", "$$", "// only a comment"] * 5
+
+
+def expected(index, source):
+    result = compiler.compile_source(source)
+    error = None if result.ok else compile_batch.error_details(result.error)
+    return compile_batch.BatchResult(index, str(index), result.pseudo_code if result.ok else None, error)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_results_are_in_input_order(workers):
+    results = list(compile_batch.compile_many(SOURCES, workers=workers, chunksize=3))
+    assert results == [expected(index, source) for index, source in enumerate(SOURCES)]
+
+
+def test_unordered_results_cover_every_input():
+    results = list(compile_batch.compile_many(SOURCES, workers=2, chunksize=3, ordered=False))
+    assert sorted(results) == [expected(index, source) for index, source in enumerate(SOURCES)]
+
+
+def test_each_error_is_reported_with_its_input():
+    results = list(compile_batch.compile_many(SOURCES[:4], workers=1))
+    assert [result.error and result.error["type"] for result in results] == [None, "Exception", "Exception", "ValueError"]
+    assert results[2].error["cause"] == "ERROR - The input contains the following invalid tokens: '$$'"
+    assert results[0].pseudo_code == "INT x 5"
+
+
+def test_files_are_compiled_in_order(tmp_path):
+    paths = []
+    for index, source in enumerate(SOURCES[:4]):
+        path = tmp_path / f"{index}.txt"
+        path.write_text(source, encoding="utf-8")
+        paths.append(str(path))
+    paths.append(str(tmp_path / "missing.txt"))
+    results = list(compile_batch.compile_many_files(paths, workers=2, chunksize=2))
+    assert [result.name for result in results] == paths
+    assert [result.index for result in results] == list(range(len(paths)))
+    assert results[0].pseudo_code == "INT x 5"
+    assert [result.error["type"] for result in results[1:]] == ["Exception", "Exception", "ValueError", "FileNotFoundError"]
+
+
+def test_find_sources_expands_directories(tmp_path):
+    (tmp_path / "b").mkdir()
+    for name in ["b/2.txt", "b/1.txt", "a.txt"]:
+        (tmp_path / name).write_text("int x = 5;", encoding="utf-8")
+    found = compile_batch.find_sources([str(tmp_path)])
+    assert [path[len(str(tmp_path)) + 1 :] for path in found] == ["a.txt", "b/1.txt", "b/2.txt"]
@@ -0,0 +1,86 @@
+"""Checks that bytecode survives Bytecode.to_bytes() and from_bytes(), and bad data is rejected."""
+import pytest
+
+import bytecode
+import compiler
+
+
+def compiled(source):
+    return bytecode.compile_program(compiler.compile_source(source).syntax_tree)
+
+
+def test_round_trip():
+    program = compiled("while (x < 10) { if (x > i) { printf('x é'); } else { printf('i'); }; x++ };")
+    assert bytecode.Bytecode.from_bytes(program.to_bytes()) == program
+
+
+def test_deep_expression_round_trips():
+    # needs a stack more than 65535 values deep:
+    depth = 70000
+    program = compiled("1 - (" * depth + "1" + ")" * depth + ";")
+    assert program.stack_size > 0xFFFF
+    assert bytecode.Bytecode.from_bytes(program.to_bytes()) == program
+
+
+def test_every_truncation_is_rejected():
+    data = compiled("if (a > b) { printf('héllo'); };").to_bytes()
+    for end in range(len(data)):
+        with pytest.raises(ValueError):
+            bytecode.Bytecode.from_bytes(data[:end])
+
+
+def test_trailing_data_is_rejected():
+    data = compiled("int x = 10;").to_bytes()
+    with pytest.raises(ValueError):
+        bytecode.Bytecode.from_bytes(data + b"\0")
+
+
+def test_other_versions_are_rejected():
+    data = bytearray(compiled("int x = 10;").to_bytes())
+    data[4] = bytecode.BYTECODE_VERSION + 1
+    with pytest.raises(ValueError, match="version"):
+        bytecode.Bytecode.from_bytes(bytes(data))
+
+
+def corrupted(change):
+    program = compiled("while (x < 10) { if (x > 1 + 2) { printf('x'); }; x++ };")
+    instructions = {opcode: pc for pc, opcode, _ in program.instructions()}
+    change(program, instructions)
+    return program.to_bytes()
+
+
+def set_code(opcode, offset, value):
+    def change(program, instructions):
+        program.code[instructions[opcode] + offset] = value
+    return change
+
+
+@pytest.mark.parametrize(
+    "change, message",
+    [
+        (set_code(bytecode.PRINT, 0, 99), "unknown opcode"),
+        (set_code(bytecode.LOAD, 1, 50), "register"),
+        (set_code(bytecode.STORE, 1, -1), "register"),
+        (set_code(bytecode.INCREMENT, 1, 50), "register"),
+        (set_code(bytecode.JUMP_UNLESS_MORE_THAN, 2, 50), "register"),
+        (set_code(bytecode.PRINT, 1, 1), "string"),
+        (set_code(bytecode.JUMP, 1, 1), "isn't an instruction"),
+        (set_code(bytecode.JUMP_IF_LESS_THAN, 3, 10**6), "isn't an instruction"),
+        (set_code(bytecode.HALT, 0, bytecode.PRINT), "HALT"),
+        (lambda program, _: program.code.pop(), "cut short"),
+        (lambda program, _: setattr(program, "stack_size", program.stack_size - 1), "stack size"),
+        (lambda program, _: setattr(program, "stack_size", 2**32 - 1), "stack size"),
+    ],
+)
+def test_corrupted_code_is_rejected(change, message):
+    with pytest.raises(ValueError, match=message):
+        bytecode.Bytecode.from_bytes(corrupted(change))
+
+
+def test_max_iterations_has_to_be_positive():
+    program = compiled("while (x > 0) { printf('x'); x++ };")
+    with pytest.raises(RuntimeError):
+        bytecode.run(program, {"x": 1}, max_iterations=1)
+    for limit in (0, -1):
+        with pytest.raises(ValueError):
+            bytecode.run(program, {"x": 1}, max_iterations=limit)
@@ -0,0 +1,109 @@
+"""Checks CompileCache: its LRU limits, counters, on-disk store, and that hits never share objects."""
+import os
+import subprocess
+import sys
+
+import compiler
+from compile_cache import CompileCache
+
+
+SOURCE = "while (x < 10) { if (x > 3) { printf('x'); }; x++ };"
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def program(number):
+    return f"printf('program {number}');"
+
+
+def test_hit_matches_a_fresh_compilation():
+    cache = CompileCache()
+    first = compiler.compile_source(SOURCE, cache=cache)
+    hit = compiler.compile_source(SOURCE, cache=cache)
+    assert (hit.pseudo_code, hit.syntax_tree, list(hit.tokens)) == (first.pseudo_code, first.syntax_tree, list(first.tokens))
+    assert hit.diagnostics == first.diagnostics  # the warning for x
+    assert hit.symbols.undeclared == first.symbols.undeclared
+    assert cache.stats() == {"entries": 1, "bytes": cache.size, "hits": 1, "misses": 1, "disk_hits": 0, "evictions": 0}
+
+
+def test_each_hit_is_an_independent_copy():
+    cache = CompileCache()
+    compiler.compile_source(SOURCE, cache=cache)
+    hit = compiler.compile_source(SOURCE, cache=cache)
+    hit.syntax_tree.statements.clear()
+    hit.diagnostics.clear()
+    hit.symbols.undeclared.clear()
+    hit.tokens.types[0] = 0
+    again = compiler.compile_source(SOURCE, cache=cache)
+    assert again.syntax_tree == compiler.compile_source(SOURCE).syntax_tree
+    assert again.diagnostics and again.symbols.undeclared
+    assert list(again.tokens) == list(compiler.tokenize_string(SOURCE))
+    assert again.syntax_tree is not hit.syntax_tree
+
+
+def test_least_recently_used_entry_is_evicted_by_count():
+    cache = CompileCache(max_entries=2)
+    for number in range(3):
+        compiler.compile_source(program(number), cache=cache)
+    compiler.compile_source(program(1), cache=cache)  # now the most recently used
+    compiler.compile_source(program(3), cache=cache)  # evicts program 2
+    assert cache.get(program(1)) is not None
+    assert cache.get(program(2)) is None
+    assert cache.stats()["evictions"] == 2
+
+
+def test_entries_are_evicted_to_stay_within_max_bytes():
+    probe = CompileCache()
+    compiler.compile_source(program(0), cache=probe)
+    entry_size = probe.size
+    cache = CompileCache(max_bytes=entry_size * 2 + entry_size // 2)
+    for number in range(5):
+        compiler.compile_source(program(number), cache=cache)
+        assert cache.size <= cache.max_bytes
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["evictions"] == 3
+    assert cache.get(program(4)) is not None and cache.get(program(0)) is None
+
+
+def test_entry_bigger_than_max_bytes_is_not_kept():
+    cache = CompileCache(max_bytes=10)
+    compiler.compile_source(SOURCE, cache=cache)
+    assert cache.stats()["entries"] == 0 and cache.stats()["evictions"] == 0
+
+
+def test_failed_and_partial_compilations_are_not_cached():
+    cache = CompileCache()
+    for source, options in [
+        ("if (a > b) { printf('x');", {}),  # syntax error
+        ("while (x < 10) { printf('a'); y++ };", {}),  # semantic error
+        (SOURCE, {"optimize": True}),
+        (SOURCE, {"last_stage": "semantic"}),
+    ]:
+        compiler.compile_source(source, cache=cache, **options)
+    assert cache.stats()["entries"] == 0
+    # optimized and partial compilations don't look in the cache either:
+    assert cache.stats()["misses"] == 2
+
+
+def test_disk_store_survives_a_new_process(tmp_path):
+    directory = str(tmp_path / "cache")
+    compiler.compile_source(SOURCE, cache=CompileCache(directory=directory))
+    assert not [name for _, _, names in os.walk(directory) for name in names if not name.endswith(".pickle")]
+    script = (
+        "import compiler, compile_cache, sys\n"
+        f"cache = compile_cache.CompileCache(directory={directory!r})\n"
+        f"result = compiler.compile_source({SOURCE!r}, cache=cache)\n"
+        "print(cache.stats()['disk_hits'], cache.stats()['misses'], repr(result.pseudo_code))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    assert output == f"1 0 {compiler.compile_source(SOURCE).pseudo_code!r}\n"
+
+
+def test_clear_keeps_the_disk_store(tmp_path):
+    cache = CompileCache(directory=str(tmp_path))
+    compiler.compile_source(SOURCE, cache=cache)
+    cache.clear()
+    assert cache.stats()["entries"] == 0
+    assert compiler.compile_source(SOURCE, cache=cache).ok
+    assert cache.stats()["disk_hits"] == 1
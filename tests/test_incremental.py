@@ -0,0 +1,44 @@
+"""Checks that IncrementalCompiler.edit() gives what compiling the edited source from scratch does."""
+import pytest
+
+import compiler
+from compile_incremental import IncrementalCompiler
+
+
+SOURCE = "while (x < 10) {\n  printf('x is 10');\n  x++\n};\n"
+
+
+def assert_same(document):
+    expected = compiler.compile_source(document.source)
+    result = document.result
+    assert result.stages == expected.stages
+    assert result.diagnostics == expected.diagnostics
+    assert result.pseudo_code == expected.pseudo_code
+    assert result.syntax_tree == expected.syntax_tree
+
+
+@pytest.mark.parametrize(
+    "old, new, counter",
+    [
+        ("while", "\n\nwhile", "reuses"),  # moves the warning for x down
+        ("x++", "x++ /* counter */", "reuses"),
+        ("x is 10", "x is 20", "tree_updates"),
+        ("10)", "12)", "tree_updates"),
+        ("x < 10", "y < 10", "tree_updates"),  # the counter no longer matches
+        ("x++", "y++", "tree_updates"),
+        ("x < 10", "x < 10 + 1", "reparses"),
+    ],
+)
+def test_edit_matches_full_compile(old, new, counter):
+    document = IncrementalCompiler(SOURCE)
+    document.edit(SOURCE.index(old), len(old), new)
+    assert getattr(document, counter) == 1
+    assert_same(document)
+
+
+def test_edits_in_a_row_match_full_compile():
+    document = IncrementalCompiler(SOURCE)
+    for old, new in [("10)", "11)"), (" ", "   "), ("x < 11", "y < 11"), ("y < 11", "x < 11"), ("'x", "'y")]:
+        document.edit(document.source.index(old), len(old), new)
+        assert_same(document)
+    assert document.full_compilations == 1
@@ -0,0 +1,135 @@
+"""
+Checks tokenize_string() against the lexer it replaced, which tried each of
+TOKEN_PATTERNS in turn at every position, on every sample program in main(), and
+tokenize_bytes() and the streaming tokenizers against tokenize_string().
+"""
+import ast
+import inspect
+import re
+
+import pytest
+
+import compiler
+
+
+def reference_tokenize_string(input_string):
+    """The original tokenize_string(), returning a list of (token, lexeme) pairs."""
+    position = 0
+    tokens = []
+    previous_token = None
+    # loops through input string chars:
+    while position < len(input_string):
+        match_output = None
+        match_len = 0
+        for pattern, token_type in compiler.TOKEN_PATTERNS:
+            regex = re.compile(pattern)
+            match_output = regex.match(input_string, position)
+            if match_output and token_type:  # skips whitespaces
+                match_len = match_output.end() - match_output.start()
+                if token_type in [compiler.TOKEN_INVALID]:
+                    # raises error if any tokens are invalid
+                    invalid_token = input_string[position : position + match_len]
+                    raise ValueError(
+                        f"ERROR - The input contains the following invalid tokens: '{invalid_token}'"
+                    )
+                token_value = match_output.group()
+                # assigning strings as variable name if preceeded by an variable initialisation (INT token):
+                if previous_token == compiler.TOKEN_INT_INIT:
+                    token_type = compiler.TOKEN_VARIABLE_NAME
+                # only captures tokens that are NOT comments:
+                if token_type not in [compiler.TOKEN_COMMENT, compiler.TOKEN_MULTI_COMMENT]:
+                    tokens.append((token_type, token_value))
+                # captures previous increment for the purpose of checking for variable names
+                previous_token = token_type
+                break
+        if match_len != 0:
+            position += match_len
+        else:
+            position += 1
+    return tokens
+
+
+def main_samples():
+    """Every string assigned in main(), by variable name."""
+    function = ast.parse(inspect.getsource(compiler.main)).body[0]
+    return {
+        statement.targets[0].id: statement.value.value
+        for statement in function.body
+        if isinstance(statement, ast.Assign) and isinstance(statement.value, ast.Constant)
+    }
+
+
+SAMPLES = main_samples()
+# more awkward inputs, each lexed the same way by both:
+EXTRA_SOURCES = [
+    "",
+    "   \n\t ",
+    "int x = 10; int y = x;",
+    "int int = 5;",
+    "printf('unclosed",
+    "printf('a') printf('b');",
+    "/* unclosed comment",
+    "/* one */ /* two */ x",
+    "x // comment\ny",
+    "a@b",
+    "1 + 2 $ 3",
+    "while_ x1 _y",
+    "printf('a\nb');",
+]
+
+
+def outcome(tokenize, source):
+    try:
+        return list(tokenize(source))
+    except ValueError as error:
+        return str(error)
+
+
+def test_main_has_samples():
+    assert len(SAMPLES) > 20
+
+
+@pytest.mark.parametrize("name", sorted(SAMPLES))
+def test_main_samples_match_reference(name):
+    source = SAMPLES[name]
+    assert outcome(compiler.tokenize_string, source) == outcome(reference_tokenize_string, source)
+
+
+@pytest.mark.parametrize("source", EXTRA_SOURCES)
+def test_awkward_inputs_match_reference(source):
+    assert outcome(compiler.tokenize_string, source) == outcome(reference_tokenize_string, source)
+
+
+@pytest.mark.parametrize("name", sorted(SAMPLES))
+def test_bytes_match_string_on_main_samples(name):
+    source = SAMPLES[name]
+    assert outcome(compiler.tokenize_bytes, source.encode()) == outcome(compiler.tokenize_string, source)
+
+
+@pytest.mark.parametrize("code", range(128))
+def test_bytes_match_string_for_every_ascii_character(code):
+    # eg \x1c-\x1f, which \s only matches in a str unless the bytes regex adds them:
+    character = chr(code)
+    source = f"printf('a');{character}x{character}y /* {character} printf('{character}"
+    assert outcome(compiler.tokenize_bytes, source.encode()) == outcome(compiler.tokenize_string, source)
+
+
+def in_chunks(source, size):
+    return [source[start : start + size] for start in range(0, len(source), size)]
+
+
+@pytest.mark.parametrize("size", [1, 3, 64])
+def test_stream_matches_string_on_main_samples(size):
+    for source in SAMPLES.values():
+        assert outcome(compiler.tokenize_stream, in_chunks(source, size)) == outcome(compiler.tokenize_string, source)
+
+
+@pytest.mark.parametrize("size", [1, 5, 64])
+def test_stream_buffer_keeps_locations(size):
+    source = "// header\nint x = 10;\n\n  /* c */ if (a > b) {\n\tprintf('x');\n} elif (a < 1) {\n};\n"
+    expected = compiler.tokenize_string(source)
+    tokens = compiler.tokenize_stream_buffer(in_chunks(source, size))
+    assert list(tokens) == list(expected)
+    assert [tokens.location(index) for index in range(len(tokens) + 1)] == [
+        expected.location(index) for index in range(len(expected) + 1)
+    ]
@@ -0,0 +1,110 @@
+"""Checks what optimize_tree() (compile_source(..., optimize=True)) changes, and that it never changes what a program does."""
+import random
+
+import pytest
+
+import bytecode
+import compiler
+from benchmarks.programs import SHAPES, ProgramGenerator
+
+
+def optimized(source):
+    result = compiler.compile_source(source, optimize=True)
+    assert result.ok, result.diagnostics
+    infos = [
+        (diagnostic.message, diagnostic.line, diagnostic.column)
+        for diagnostic in result.diagnostics
+        if diagnostic.stage == "optimize"
+    ]
+    assert all(diagnostic.severity == "info" for diagnostic in result.diagnostics if diagnostic.stage == "optimize")
+    return result, infos
+
+
+def test_nested_arithmetic_is_folded():
+    result, infos = optimized("1 + 2 * 3 - a;")
+    assert result.pseudo_code == "7 SUBTRACT a"
+    assert infos == [("Folded 1 + 2 * 3 to 7.", 1, 1)]
+
+
+def test_constant_operands_are_folded_around_a_variable():
+    result, infos = optimized("a * (2 + 3);")
+    assert result.pseudo_code == "a MULTIPLIED BY 5"
+    assert infos == [("Folded 2 + 3 to 5.", 1, 6)]
+
+
+def test_division_by_zero_is_left_alone():
+    result, infos = optimized("10 / 0;")
+    assert result.pseudo_code == "10 DIVIDED BY 0"
+    assert infos == []
+
+
+def test_always_true_branch_keeps_its_block_and_drops_the_rest():
+    result, infos = optimized("if (1 < 2) { printf('a'); } elif (x > 1) { printf('b'); } else { printf('c'); };")
+    assert result.pseudo_code == "\nPRINT a "
+    assert infos == [
+        ("Replaced if statement with the block of if (1 < 2), which is always true.", 1, 1),
+        ("Removed elif branch, it comes after (1 < 2), which is always true.", 1, 35),
+        ("Removed else block, it comes after (1 < 2), which is always true.", 1, 66),
+    ]
+
+
+def test_always_true_elif_becomes_the_else_block():
+    result, infos = optimized("if (x > 1) { printf('a'); } elif (2 > 1) { printf('b'); } elif (x < 0) { printf('c'); };")
+    assert result.pseudo_code == compiler.compile_source("if (x > 1) { printf('a'); } else { printf('b'); };").pseudo_code
+    assert infos == [("Removed elif branch, it comes after (2 > 1), which is always true.", 1, 65)]
+
+
+def test_always_false_branch_is_dropped_and_the_next_elif_becomes_the_if():
+    result, infos = optimized("if (1 > 2) { printf('a'); } elif (x > 1) { printf('b'); } else { printf('c'); };")
+    assert result.pseudo_code == "\nIF x IS MORE THAN 1\n   PRINT b \nELSE\n   PRINT c \nEND IF"
+    assert infos == [("Removed if branch, its condition (1 > 2) is always false.", 1, 5)]
+
+
+def test_if_with_only_false_branches_is_replaced_by_its_else_block():
+    result, infos = optimized("if (1 > 2) { printf('a'); } else { printf('c'); };")
+    assert result.pseudo_code == "\nPRINT c "
+    assert infos == [
+        ("Replaced if statement with its else block, none of its conditions can be true.", 1, 1),
+        ("Removed if branch, its condition (1 > 2) is always false.", 1, 5),
+    ]
+
+
+def test_false_while_loop_is_removed():
+    # the semantic analyser rejects a counter that isn't in the condition, so this
+    # is optimized straight from the parser:
+    tokens = compiler.tokenize_string("while (3 > 4) { printf('w'); x++ };")
+    syntax_tree = compiler.parse_tokens(tokens)
+    optimizations = compiler.optimize_tree(syntax_tree)
+    assert syntax_tree.statements == []
+    assert [(tokens.location(index), message) for index, message in optimizations] == [
+        ((1, 1), "Removed while loop, its condition (3 > 4) is always false.")
+    ]
+
+
+def test_unoptimizable_program_is_unchanged():
+    source = "while (x < 10) { if (x > y) { printf('x'); }; x++ };"
+    result, infos = optimized(source)
+    assert infos == []
+    assert result.pseudo_code == compiler.compile_source(source).pseudo_code
+
+
+def execution(syntax_tree, variables):
+    try:
+        return bytecode.run(bytecode.compile_program(syntax_tree), variables, max_iterations=1000)
+    except (ZeroDivisionError, RuntimeError) as error:
+        return type(error)
+
+
+@pytest.mark.parametrize("shape", SHAPES)
+def test_optimizing_never_changes_what_a_program_does(shape):
+    values = random.Random(shape)
+    for seed in range(10):
+        for source in ProgramGenerator(seed).generate(shape, 8):
+            plain = compiler.compile_source(source)
+            if not plain.ok:
+                continue
+            folded = compiler.compile_source(source, optimize=True)
+            program = bytecode.compile_program(plain.syntax_tree)
+            for _ in range(3):
+                variables = {name: values.randint(-5, 1005) for name in program.inputs()}
+                assert execution(folded.syntax_tree, variables) == execution(plain.syntax_tree, variables), source
@@ -0,0 +1,101 @@
+"""Checks how expressions are parsed, and the errors the recovering parser (parse_tokens(..., errors=...)) reports."""
+import pytest
+
+import compiler
+
+
+def syntax_errors(source):
+    errors = []
+    compiler.parse_tokens(compiler.tokenize_string(source), errors=errors)
+    return [(error.message, error.line, error.column) for error in errors]
+
+
+UNCLOSED = "PARSER ERROR - Unclosed LEFT_BRACKET, expected a RIGHT_BRACKET before the end of input"
+
+
+@pytest.mark.parametrize(
+    "source, column",
+    [
+        ("((((", 4),
+        ("(1 + 2", 1),
+        ("1 + (2 * (3", 10),
+        ("if (a > (b", 9),
+    ],
+)
+def test_unclosed_bracket_is_reported_where_it_opens(source, column):
+    assert syntax_errors(source) == [(UNCLOSED, 1, column)]
+
+
+def test_closed_brackets_still_need_a_semi_colon():
+    assert syntax_errors("(1) + 2") == [("PARSER ERROR - Expected SEMI_COLON but found end of input", 1, 8)]
+
+
+def test_valid_program_has_no_errors():
+    assert syntax_errors("if (a > (b + 1)) { printf('x'); };") == []
+
+
+def expression_shape(node):
+    # nested (operator, left, right) tuples of the lexemes, for comparing trees by eye:
+    if type(node) is compiler.ArithmeticExpression:
+        operator = compiler.TOKEN_NAMES[node.operator]
+        return (operator, expression_shape(node.left), expression_shape(node.right))
+    return node.value if type(node) is compiler.Number else node.name
+
+
+def parsed_expression(source):
+    return expression_shape(compiler.parse_tokens(compiler.tokenize_string(source)).statements[0])
+
+
+@pytest.mark.parametrize(
+    "source, shape",
+    [
+        ("3754;", "3754"),
+        ("a + b * c;", ("ADD", "a", ("MULTIPLY", "b", "c"))),
+        ("a * b + c;", ("ADD", ("MULTIPLY", "a", "b"), "c")),
+        ("a - b / 2 * c;", ("SUBTRACT", "a", ("MULTIPLY", ("DIVIDE", "b", "2"), "c"))),
+        ("a - b - c;", ("SUBTRACT", ("SUBTRACT", "a", "b"), "c")),
+        ("a / b / c;", ("DIVIDE", ("DIVIDE", "a", "b"), "c")),
+        ("a - (b - c);", ("SUBTRACT", "a", ("SUBTRACT", "b", "c"))),
+        ("(a + b) * c;", ("MULTIPLY", ("ADD", "a", "b"), "c")),
+        ("((a));", "a"),
+    ],
+)
+def test_expression_precedence_and_associativity(source, shape):
+    assert parsed_expression(source) == shape
+
+
+@pytest.mark.parametrize(
+    "source, pseudo_code",
+    [
+        ("3754;", "3754"),
+        ("(a + b) * c;", "(a ADDED TO b) MULTIPLIED BY c"),
+        ("a - (b - c);", "a SUBTRACT (b SUBTRACT c)"),
+        # brackets that don't change the order aren't written out:
+        ("(a - b) - c;", "a SUBTRACT b SUBTRACT c"),
+        ("a + (b * c);", "a ADDED TO b MULTIPLIED BY c"),
+        ("if (a + 1 > b * 2) { printf('x'); };", "\nIF a ADDED TO 1 IS MORE THAN b MULTIPLIED BY 2\n   PRINT x \nEND IF"),
+    ],
+)
+def test_expression_pseudo_code(source, pseudo_code):
+    assert compiler.compile_source(source).pseudo_code == pseudo_code
+
+
+@pytest.mark.parametrize(
+    "source, errors",
+    [
+        ("a + * b;", [("PARSER ERROR - Expected a NUMBER, LETTERS or LEFT_BRACKET but found MULTIPLY", 1, 5)]),
+        ("a b;", [("PARSER ERROR - Expected SEMI_COLON but found LETTERS", 1, 3)]),
+        ("(a + b));", [("PARSER ERROR - Expected SEMI_COLON but found RIGHT_BRACKET", 1, 8)]),
+        ("a + b", [("PARSER ERROR - Expected SEMI_COLON but found end of input", 1, 6)]),
+        ("1 +\n  (2 * ) ;", [("PARSER ERROR - Expected a NUMBER, LETTERS or LEFT_BRACKET but found RIGHT_BRACKET", 2, 8)]),
+    ],
+)
+def test_errors_inside_expressions(source, errors):
+    assert syntax_errors(source) == errors
+
+
+def test_first_error_inside_an_expression_is_located():
+    result = compiler.compile_source("if (a + > b) { printf('x'); };")
+    assert [(diagnostic.message, diagnostic.line, diagnostic.column) for diagnostic in result.diagnostics] == [
+        ("PARSER ERROR - Unexpected token MORE_THAN", 1, 9)
+    ]
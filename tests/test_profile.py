@@ -0,0 +1,73 @@
+"""Checks the stats and Chrome trace a Profiler records, and that stage hooks come in pairs."""
+import json
+
+import compiler
+from compile_profile import Profiler
+
+
+SOURCES = ["while (x < 10) { if (x > 3) { printf('x'); }; x++ };", "if (a > b", "int x = 5;"]
+
+
+class RecordingProfiler(Profiler):
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def stage_start(self, stage, result):
+        self.calls.append(("start", stage))
+        super().stage_start(stage, result)
+
+    def stage_end(self, stage, result):
+        self.calls.append(("end", stage))
+        super().stage_end(stage, result)
+
+
+def profiled():
+    profiler = RecordingProfiler()
+    for source in SOURCES:
+        compiler.compile_source(source, hooks=profiler)
+    return profiler
+
+
+def test_stage_hooks_open_and_close_in_pairs():
+    calls = profiled().calls
+    started = [call for call in calls if call[0] == "start"]
+    assert calls == [call for start in started for call in (start, ("end", start[1]))]
+    passed = ["tokenize", "parse", "semantic", "generate"]
+    assert [stage for _, stage in started] == passed + ["tokenize", "parse"] + passed
+
+
+def test_chrome_trace_is_valid(tmp_path):
+    profiler = profiled()
+    path = tmp_path / "trace.json"
+    profiler.write_chrome_trace(str(path))
+    with open(path) as trace_file:
+        trace = json.load(trace_file)
+    events = trace["traceEvents"]
+    assert [event["name"] for event in events] == [stage for kind, stage in profiler.calls if kind == "start"]
+    for event in events:
+        assert event["ph"] == "X" and event["cat"] == "compiler"
+        assert event["dur"] >= 0 and event["ts"] >= 0
+        assert event["args"]["status"] in (compiler.STAGE_PASSED, compiler.STAGE_FAILED)
+    # each stage starts after the last one ended (to within rounding, in microseconds):
+    for earlier, later in zip(events, events[1:]):
+        assert earlier["ts"] + earlier["dur"] <= later["ts"] + 1e-6
+    assert events[5]["args"] == {"tokens": 5, "status": compiler.STAGE_FAILED}
+    assert trace["otherData"]["rule_hits"]
+
+
+def test_stats_count_every_stage():
+    stats = profiled().stats()
+    assert stats["compilations"] == 3
+    assert stats["tokens"] == sum(len(compiler.tokenize_string(source)) for source in SOURCES)
+    assert {stage: (totals["count"], totals["failed"]) for stage, totals in stats["stages"].items()} == {
+        "tokenize": (3, 0), "parse": (3, 1), "semantic": (2, 0), "optimize": (0, 0), "generate": (2, 0),
+    }
+    assert stats["slowest"]["tokens"] in [len(compiler.tokenize_string(source)) for source in SOURCES]
+
+
+def test_untraced_profiler_keeps_no_events():
+    profiler = Profiler(trace=False)
+    compiler.compile_source(SOURCES[0], hooks=profiler)
+    assert profiler.chrome_trace()["traceEvents"] == []
+    assert profiler.stats()["compilations"] == 1
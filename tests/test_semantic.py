@@ -0,0 +1,87 @@
+"""Checks the errors and warnings semantic_analyzer() reports, and where it reports them."""
+import pytest
+
+import compiler
+
+
+def semantic_diagnostics(source):
+    result = compiler.compile_source(source)
+    assert result.stages["parse"] == compiler.STAGE_PASSED
+    return result.stages["semantic"], [
+        (diagnostic.severity, diagnostic.message, diagnostic.line, diagnostic.column)
+        for diagnostic in result.diagnostics
+    ]
+
+
+def undeclared(name, line, column):
+    return ("warning", f"WARNING - Variable {name} is used without being declared.", line, column)
+
+
+@pytest.mark.parametrize(
+    "source, diagnostics",
+    [
+        ("int x = 5;", []),
+        ("printf('x');", []),
+        ("while (x < 10) { printf('a'); x++ };", [undeclared("x", 1, 8)]),
+        # only the first use of a variable is reported:
+        ("if (a > b) { printf('a'); } elif (a < c) { printf('b'); };",
+         [undeclared("a", 1, 5), undeclared("b", 1, 9), undeclared("c", 1, 39)]),
+        ("a + b * a;", [undeclared("a", 1, 1), undeclared("b", 1, 5)]),
+        ("while (x + 1 < y * 2) {\n  printf('a');\n  y++\n};", [undeclared("x", 1, 8), undeclared("y", 1, 16)]),
+    ],
+)
+def test_passing_programs_and_their_warnings(source, diagnostics):
+    assert semantic_diagnostics(source) == (compiler.STAGE_PASSED, diagnostics)
+
+
+@pytest.mark.parametrize(
+    "source, line, column",
+    [
+        ("while (x < 10) { printf('a'); y++ };", 1, 31),
+        ("while (x < 10) {\n  printf('a');\n  y++\n};", 3, 3),
+    ],
+)
+def test_counter_not_in_condition_is_an_error(source, line, column):
+    message = "ERROR - While loop increments y, which isn't in its condition (x < 10)."
+    assert semantic_diagnostics(source) == (compiler.STAGE_FAILED, [("error", message, line, column)])
+
+
+def analyse(symbols):
+    warnings = []
+    compiler.semantic_analyzer(compiler.Program([]), symbols, warnings)
+    return warnings
+
+
+def test_declared_variable_is_not_undeclared():
+    symbols = compiler.SymbolTable()
+    symbols.declare("total", 1)
+    symbols.use("total", 5)
+    symbols.use("other", 7)
+    assert analyse(symbols) == [(7, "WARNING - Variable other is used without being declared.")]
+
+
+def test_declaring_a_variable_twice_is_an_error():
+    symbols = compiler.SymbolTable()
+    symbols.declare("total", 1)
+    symbols.declare("total", 9)
+    with pytest.raises(Exception, match="Variable total is declared more than once") as error:
+        analyse(symbols)
+    assert error.value.token_index == 9
+
+
+def test_variable_name_with_a_number_is_an_error():
+    # the lexer ends a variable name at a digit, so this can only come from a table:
+    symbols = compiler.SymbolTable()
+    symbols.declare("x1", 3)
+    with pytest.raises(Exception, match="cannot contain any numbers") as error:
+        analyse(symbols)
+    assert error.value.token_index == 3
+
+
+def test_table_from_tree_matches_the_parsers():
+    source = "while (x + 1 < y * 2) { if (z > x) { printf('a'); }; y++ };"
+    symbols = compiler.SymbolTable()
+    syntax_tree = compiler.parse_tokens(compiler.tokenize_string(source), symbols=symbols)
+    rebuilt = compiler.SymbolTable.from_tree(syntax_tree)
+    assert rebuilt.undeclared == symbols.undeclared == {"x": 2, "y": 6, "z": 13}
+    assert rebuilt.counter_mismatches == symbols.counter_mismatches == []
@@ -0,0 +1,121 @@
+"""Checks that tokens and syntax trees survive compile_serialize's dump and load."""
+import pickle
+import struct
+import zlib
+
+import pytest
+
+import compile_serialize
+import compiler
+
+SOURCES = [
+    "int x = 10;",
+    "while (x < 10) { if (x > i) { printf('x'); } else { printf('i'); }; x++ };",
+    "if (a > b) {\n    printf('a is more than b');\n};  // comment",
+    "if (a > b) { printf('naïve ☃ café'); };",
+    "(1 + 2) * 3 / (4 - a);",
+]
+
+
+def pairs(tokens):
+    return list(tokens)
+
+
+def locations(tokens):
+    return [tokens.location(index) for index in range(len(tokens) + 1)]
+
+
+@pytest.mark.parametrize("source", SOURCES)
+def test_tokens_round_trip(source):
+    tokens = compiler.tokenize_string(source)
+    loaded = compile_serialize.load_tokens(compile_serialize.dump_tokens(tokens))
+    assert pairs(loaded) == pairs(tokens)
+    assert locations(loaded) == locations(tokens)
+
+
+@pytest.mark.parametrize("source", SOURCES)
+def test_bytes_tokens_round_trip(source):
+    tokens = compiler.tokenize_bytes(source.encode())
+    loaded = compile_serialize.load_tokens(compile_serialize.dump_tokens(tokens))
+    assert pairs(loaded) == pairs(tokens)
+    assert locations(loaded) == locations(tokens)
+
+
+@pytest.mark.parametrize("source", SOURCES)
+def test_parse_result_round_trip(source):
+    tokens = compiler.tokenize_string(source)
+    syntax_tree = compiler.parse_tokens(tokens)
+    loaded_tokens, loaded_tree = compile_serialize.load_parse_result(
+        compile_serialize.dump_parse_result(tokens, syntax_tree)
+    )
+    assert pairs(loaded_tokens) == pairs(tokens)
+    assert loaded_tree == syntax_tree
+    result = compiler.compile_stages(compiler.CompileResult(loaded_tokens, loaded_tree))
+    assert result.pseudo_code == compiler.compile_source(source).pseudo_code
+
+
+def test_load_tokens_needs_no_tree():
+    with pytest.raises(ValueError):
+        compile_serialize.load_parse_result(compile_serialize.dump_tokens(compiler.tokenize_string("1 + 2;")))
+
+
+def test_loaded_non_ascii_tokens_can_be_edited_and_pickled():
+    source = "printf('café'); 1 + 2;"
+    loaded = compile_serialize.load_tokens(compile_serialize.dump_tokens(compiler.tokenize_string(source)))
+    edited = compiler.relex_tokens(loaded, source.index("2"), 1, "3")[0]
+    assert pairs(edited) == pairs(compiler.tokenize_string(source.replace("2", "3")))
+    assert pairs(pickle.loads(pickle.dumps(loaded))) == pairs(loaded)
+
+
+def test_loaded_ascii_tokens_can_be_pickled():
+    loaded = compile_serialize.load_tokens(compile_serialize.dump_tokens(compiler.tokenize_string("x + 1;")))
+    assert pairs(pickle.loads(pickle.dumps(loaded))) == pairs(loaded)
+
+
+def test_every_truncation_is_rejected():
+    source = SOURCES[1]
+    tokens = compiler.tokenize_string(source)
+    data = compile_serialize.dump_parse_result(tokens, compiler.parse_tokens(tokens))
+    for end in range(len(data)):
+        with pytest.raises(ValueError):
+            compile_serialize.load_parse_result(data[:end])
+
+
+def test_every_changed_byte_is_rejected():
+    tokens = compiler.tokenize_string(SOURCES[3])
+    data = compile_serialize.dump_parse_result(tokens, compiler.parse_tokens(tokens))
+    for position in range(len(data)):
+        corrupt = bytearray(data)
+        corrupt[position] ^= 0x41
+        with pytest.raises(ValueError):
+            compile_serialize.load_parse_result(bytes(corrupt))
+
+
+def with_checksum(data):
+    return data + struct.pack("<I", zlib.crc32(data))
+
+
+def test_inconsistent_data_with_a_valid_checksum_is_rejected():
+    # as if written that way, rather than damaged on the way:
+    tokens = compiler.tokenize_string(SOURCES[1])
+    data = compile_serialize.dump_parse_result(tokens, compiler.parse_tokens(tokens))[:-4]
+    header = struct.calcsize("<4sHB8s")
+    for position in range(header, len(data)):
+        for value in (0, 0x7F, 0xFF):
+            corrupt = bytearray(data)
+            corrupt[position] = value
+            try:
+                loaded_tokens, loaded_tree = compile_serialize.load_parse_result(with_checksum(bytes(corrupt)))
+            except ValueError:
+                continue
+            pairs(loaded_tokens)
+            compiler.compile_stages(compiler.CompileResult(loaded_tokens, loaded_tree))
+
+
+def test_other_formats_are_rejected():
+    with pytest.raises(ValueError, match="Not serialized"):
+        compile_serialize.load_tokens(b"not tokens at all")
+    data = bytearray(compile_serialize.dump_tokens(compiler.tokenize_string("1;")))
+    data[4] = compile_serialize.FORMAT_VERSION + 1
+    with pytest.raises(ValueError, match="version"):
+        compile_serialize.load_tokens(bytes(data))
@@ -0,0 +1,114 @@
+"""Round trips to a CompileServer over a Unix socket: compiling, bad messages, timeouts and stats."""
+import asyncio
+import struct
+
+import compiler
+from compile_client import CompileClient
+from compile_server import CompileServer, encode_message, read_message
+
+
+def serve(tmp_path, test, **options):
+    # runs test(path) against a server listening on a socket at path:
+    path = str(tmp_path / "compiler.sock")
+
+    async def run():
+        server = CompileServer(workers=1, **options)
+        await server.start(path)
+        try:
+            return await test(path, server)
+        finally:
+            await server.close()
+
+    return asyncio.run(run())
+
+
+async def send_raw(path, data):
+    reader, writer = await asyncio.open_unix_connection(path)
+    writer.write(data)
+    writer.write_eof()
+    response = await read_message(reader)
+    closed = await read_message(reader) is None
+    writer.close()
+    await writer.wait_closed()
+    return response, closed
+
+
+def test_round_trip(tmp_path):
+    sources = ["int x = 5;", "while (x < 10) { printf('x'); x++ };", "if (a > b"]
+
+    async def test(path, server):
+        async with await CompileClient.connect(path=path) as client:
+            return await asyncio.gather(*(client.compile(source) for source in sources))
+
+    responses = serve(tmp_path, test)
+    assert [response["pseudo_code"] for response in responses] == [
+        compiler.compile_source(source).pseudo_code for source in sources
+    ]
+    assert [response["error"] and response["error"]["message"] for response in responses] == [
+        None, None, "ERROR - Parser has failed."
+    ]
+
+
+def test_bad_frames_get_an_error_and_close_the_connection(tmp_path):
+    async def test(path, server):
+        not_json = await send_raw(path, struct.pack(">I", 3) + b"{{{")
+        too_long = await send_raw(path, struct.pack(">I", 2**31))
+        cut_short = await send_raw(path, struct.pack(">I", 10) + b"{}")
+        return not_json, too_long, cut_short, server.stats()
+
+    not_json, too_long, cut_short, stats = serve(tmp_path, test)
+    for response, closed in (not_json, too_long):
+        assert response["id"] is None and response["error"]["type"] == "ProtocolError" and closed
+    assert "isn't JSON" in not_json[0]["error"]["message"]
+    assert "over the limit" in too_long[0]["error"]["message"]
+    assert cut_short[0]["error"]["type"] == "ProtocolError"
+    assert stats["requests"] == 0 and stats["connections"] == 3
+
+
+def test_bad_requests_are_rejected(tmp_path):
+    async def test(path, server):
+        async with await CompileClient.connect(path=path) as client:
+            responses = [
+                await client.request({"sauce": "int x = 5;"}),
+                await client.request({"source": "int x = 5;", "timeout": "soon"}),
+            ]
+            return responses, await client.stats()
+
+    responses, stats = serve(tmp_path, test)
+    assert [response["error"]["type"] for response in responses] == ["ValueError", "ValueError"]
+    assert stats["rejected"] == 2 and stats["compiled"] == 0
+
+
+def test_timeouts_are_capped_at_the_servers(tmp_path):
+    async def test(path, server):
+        async with await CompileClient.connect(path=path) as client:
+            responses = [
+                await client.compile("int x = 5;"),
+                await client.request({"source": "int x = 5;", "timeout": None}),
+                await client.compile("int x = 5;", timeout=1000),
+            ]
+            return responses, await client.stats()
+
+    # far too short for a worker process to answer in:
+    responses, stats = serve(tmp_path, test, timeout=1e-6)
+    assert [response["error"]["type"] for response in responses] == ["TimeoutError"] * 3
+    assert "1e-06 seconds" in responses[2]["error"]["message"]
+    assert stats["timed_out"] == 3
+
+
+def test_stats(tmp_path):
+    async def test(path, server):
+        async with await CompileClient.connect(path=path) as client:
+            await asyncio.gather(*(client.compile("int x = 5;") for _ in range(20)))
+            await client.compile("if (a > b")
+            return await client.stats()
+
+    stats = serve(tmp_path, test)
+    assert (stats["requests"], stats["compiled"], stats["failed"], stats["timed_out"]) == (22, 20, 1, 0)
+    assert stats["workers"] == 1 and 1 <= stats["batches"] <= 21
+    latency = stats["latency_ms"]
+    assert 0 <= latency["p50"] <= latency["p90"] <= latency["p99"] <= latency["max"]
+
+
+def test_encode_message_frames_json():
+    assert encode_message({"id": 1}) == b"\x00\x00\x00\x08" + b'{"id":1}'